@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+EXIF读取基准测试
+在合成的测试图片上对比三种读取方式的耗时和读取的字节数：
+piexif.load(文件路径)、PIL的getexif()（含Exif/GPS子IFD）、只读取文件头的read_exif
+
+用法（在项目根目录执行）:
+    python benchmarks/bench_exif.py [--megapixels 24] [--repeat 20]
+"""
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from PIL import Image as PILImage
+from pillow_heif import register_heif_opener
+import piexif
+
+register_heif_opener()
+
+
+def make_exif():
+    """带GPS、MakerNote和内嵌缩略图的EXIF"""
+    thumbnail = io.BytesIO()
+    PILImage.new('RGB', (160, 120), (120, 80, 40)).save(thumbnail, 'JPEG')
+    return piexif.dump({
+        '0th': {
+            piexif.ImageIFD.Make: b'Canon', piexif.ImageIFD.Model: b'EOS R5',
+            piexif.ImageIFD.Orientation: 6, piexif.ImageIFD.DateTime: b'2024:01:01 10:00:00'
+        },
+        'Exif': {
+            piexif.ExifIFD.DateTimeOriginal: b'2024:01:01 10:00:00',
+            piexif.ExifIFD.LensModel: b'RF24-70mm F2.8 L IS USM',
+            piexif.ExifIFD.FocalLength: (500, 10), piexif.ExifIFD.FNumber: (28, 10),
+            piexif.ExifIFD.ExposureTime: (1, 250), piexif.ExifIFD.ISOSpeedRatings: 400,
+            piexif.ExifIFD.Flash: 16, piexif.ExifIFD.MeteringMode: 5,
+            piexif.ExifIFD.MakerNote: os.urandom(16 * 1024)
+        },
+        'GPS': {
+            piexif.GPSIFD.GPSLatitudeRef: b'N', piexif.GPSIFD.GPSLatitude: ((31, 1), (14, 1), (3000, 100)),
+            piexif.GPSIFD.GPSLongitudeRef: b'E', piexif.GPSIFD.GPSLongitude: ((121, 1), (28, 1), (1200, 100))
+        },
+        '1st': {piexif.ImageIFD.JPEGInterchangeFormat: 0, piexif.ImageIFD.JPEGInterchangeFormatLength: 0},
+        'thumbnail': thumbnail.getvalue()
+    })
+
+
+def make_corpus(directory, megapixels):
+    """生成JPEG、TIFF（未压缩，体积大）、PNG、WebP和HEIC测试图片"""
+    width = int((megapixels * 1_000_000 * 3 / 2) ** 0.5)
+    height = int(width * 2 / 3)
+    noise = PILImage.effect_noise((width, height), 64)
+    img = PILImage.merge('RGB', (noise, PILImage.linear_gradient('L').resize((width, height)), noise))
+    exif = make_exif()
+
+    corpus = []
+    for format_name, extension in (('JPEG', 'jpg'), ('TIFF', 'tif'), ('PNG', 'png'),
+                                   ('WEBP', 'webp'), ('HEIF', 'heic')):
+        path = os.path.join(directory, f"sample.{extension}")
+        img.save(path, format_name, exif=exif)
+        corpus.append((format_name, path))
+    return corpus
+
+
+def read_piexif(path):
+    return piexif.load(path)
+
+
+def read_pil(path):
+    with PILImage.open(path) as img:
+        exif = img.getexif()
+        return exif, exif.get_ifd(0x8769), exif.get_ifd(0x8825)
+
+
+def read_header(path):
+    from src.core.exif_reader import read_exif
+    return read_exif(path)
+
+
+def bytes_read():
+    """当前进程累计读取的字节数（Linux的/proc/self/io，包括页缓存命中），不支持时返回None"""
+    try:
+        with open('/proc/self/io', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('rchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def measure(func, path, repeat):
+    """返回 (平均耗时秒, 每次读取的字节数)，不支持的格式返回None"""
+    try:
+        func(path)
+    except Exception:
+        return None
+    before = bytes_read()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func(path)
+    elapsed = (time.perf_counter() - started) / repeat
+    after = bytes_read()
+    return elapsed, (after - before) / repeat if before is not None else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EXIF读取基准测试")
+    parser.add_argument('--megapixels', type=float, default=24)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    readers = (('piexif', read_piexif), ('PIL', read_pil), ('header', read_header))
+    print(f"{'格式':>6} {'文件(MB)':>9} {'读取方式':>8} {'耗时(ms)':>10} {'读取(KB)':>12}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for format_name, path in make_corpus(tmp_dir, args.megapixels):
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            for name, func in readers:
+                result = measure(func, path, args.repeat)
+                if result is None:
+                    print(f"{format_name:>6} {size_mb:>9.1f} {name:>8} {'不支持':>10}")
+                    continue
+                elapsed, nbytes = result
+                read_kb = f"{nbytes / 1024:.1f}" if nbytes is not None else '-'
+                print(f"{format_name:>6} {size_mb:>9.1f} {name:>8} {elapsed * 1000:>10.3f} {read_kb:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+网格打开视图基准测试
+在临时数据库中生成指定数量的图片和缩略图记录，对比旧实现（每张图片一个会话、一次缩略图查询和一次stat）
+与网格模型的投影查询（图片外连接缩略图，按页读取）打开全部图片和目录视图的耗时
+
+用法（在项目根目录执行）:
+    python benchmarks/bench_grid.py [--rows 10000 100000] [--no-legacy]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from sqlalchemy import create_engine, func, insert
+
+
+def populate(engine, rows, directories=10):
+    """写入测试数据：图片平均分布在几个目录中，约90%有缩略图"""
+    from src.models.directory import Directory
+    from src.models.image import Image
+    from src.models.thumbnail import Thumbnail
+
+    with engine.begin() as conn:
+        conn.execute(insert(Directory), [
+            {'id': d + 1, 'path': f"/photos/dir{d:02d}", 'name': f"dir{d:02d}"} for d in range(directories)
+        ])
+        batch = 10000
+        for start in range(0, rows, batch):
+            ids = range(start + 1, min(start + batch, rows) + 1)
+            conn.execute(insert(Image), [
+                {'id': i, 'file_path': f"/photos/dir{i % directories:02d}/IMG_{i:07d}.jpg",
+                 'file_name': f"IMG_{i:07d}.jpg", 'directory_id': i % directories + 1} for i in ids
+            ])
+            conn.execute(insert(Thumbnail), [
+                {'image_id': i, 'thumbnail_path': f"pack:{i:032x}"} for i in ids if i % 10
+            ])
+
+
+def legacy_open(SessionLocal, condition=None):
+    """旧实现：读取视图中所有图片的完整记录，再逐张打开会话查询缩略图并检查文件是否存在"""
+    from src.models.image import Image
+    from src.models.thumbnail import Thumbnail
+
+    start = time.perf_counter()
+    with SessionLocal() as db:
+        query = db.query(Image)
+        if condition is not None:
+            query = query.filter(condition)
+        images = query.all()
+    for image in images:
+        with SessionLocal() as db:
+            thumbnail = db.query(Thumbnail).filter(Thumbnail.image_id == image.id).first()
+            if thumbnail:
+                os.path.exists(thumbnail.thumbnail_path)
+    return time.perf_counter() - start, len(images)
+
+
+def model_open(SessionLocal, condition=None):
+    """网格模型：照片数量统计加第一页投影查询（打开视图的延迟），以及滚动读取全部页的耗时"""
+    from src.models.image import Image
+    from src.ui.thumbnail_model import ThumbnailListModel
+
+    model = ThumbnailListModel()
+    start = time.perf_counter()
+    with SessionLocal() as db:
+        query = db.query(func.count(Image.id))
+        if condition is not None:
+            query = query.filter(condition)
+        query.scalar()
+    model.set_query(condition)
+    first_page = time.perf_counter() - start
+    while model.canFetchMore():
+        model.fetchMore()
+    total = time.perf_counter() - start
+    model.shutdown()
+    return first_page, total, model.rowCount()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="网格打开视图基准测试")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000], help="图片记录数量")
+    parser.add_argument('--no-legacy', action='store_true', help="不测量旧实现（10万条时需要较长时间）")
+    args = parser.parse_args()
+
+    from sqlalchemy import or_
+    from src.core.database import Base, SessionLocal
+    from src.models.image import Image
+    import src.models  # noqa: F401  注册所有表
+
+    for rows in args.rows:
+        with tempfile.TemporaryDirectory() as tmp:
+            engine = create_engine(f"sqlite:///{tmp}/bench.db")
+            Base.metadata.create_all(engine)
+            SessionLocal.configure(bind=engine)
+            populate(engine, rows)
+
+            # 与主窗口相同的目录条件：路径前缀匹配或目录ID匹配
+            views = {
+                '全部图片': None,
+                '单个目录': or_(Image.file_path.like("/photos/dir03%"), Image.directory_id == 4),
+            }
+            print(f"\n{rows} 条图片记录")
+            for name, condition in views.items():
+                first_page, total, count = model_open(SessionLocal, condition)
+                line = (f"  {name}: {count} 张，打开视图 {first_page * 1000:.1f} ms，"
+                        f"读取全部页 {total * 1000:.0f} ms")
+                if not args.no_legacy:
+                    elapsed, _ = legacy_open(SessionLocal, condition)
+                    line += f"，旧实现 {elapsed * 1000:.0f} ms（{elapsed / first_page:.0f}x）"
+                print(line)
+            engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
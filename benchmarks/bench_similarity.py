@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+相似图片索引基准测试
+测量多索引哈希的构建耗时，以及不同汉明距离下的查询耗时（与逐个比较对照）
+
+用法（在项目根目录执行）:
+    python benchmarks/bench_similarity.py [--images 500000] [--queries 200] [--distances 4 8 12]
+"""
+
+import argparse
+import io
+import random
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from PIL import Image as PILImage
+
+
+def make_hashes(count, seed=1):
+    """生成测试哈希：大部分随机，约10%是其他哈希翻转少量位得到的近似副本"""
+    rng = random.Random(seed)
+    hashes = []
+    for _ in range(count):
+        if hashes and rng.random() < 0.1:
+            value = rng.choice(hashes)
+            for bit in rng.sample(range(64), rng.randint(1, 6)):
+                value ^= 1 << bit
+        else:
+            value = rng.getrandbits(64)
+        hashes.append(value)
+    return hashes
+
+
+def main():
+    from src.core.ingest import create_thumbnail, perceptual_hashes, THUMBNAIL_BASE_LEVEL
+    from src.core.similarity import HammingIndex, hamming_distance
+
+    parser = argparse.ArgumentParser(description="相似图片索引基准测试")
+    parser.add_argument('--images', type=int, default=500000)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--distances', type=int, nargs='+', default=[4, 8, 12])
+    args = parser.parse_args()
+
+    # 感知哈希的计算耗时（缩略图已生成，只统计哈希本身）
+    noise = PILImage.effect_noise((1200, 800), 64)
+    levels, _ = create_thumbnail(PILImage.merge('RGB', (noise, noise, noise)))
+    with PILImage.open(io.BytesIO(levels[THUMBNAIL_BASE_LEVEL])) as thumbnail:
+        thumbnail.load()
+        started = time.perf_counter()
+        for _ in range(100):
+            perceptual_hashes(thumbnail)
+        print(f"感知哈希: {(time.perf_counter() - started) * 10:.2f} ms/张")
+
+    hashes = make_hashes(args.images)
+    started = time.perf_counter()
+    index = HammingIndex()
+    for image_id, value in enumerate(hashes):
+        index.add(value, image_id)
+    print(f"构建索引: {len(index)} 张图片 {time.perf_counter() - started:.2f} 秒")
+
+    queries = random.Random(2).sample(hashes, min(args.queries, len(hashes)))
+    print(f"{'距离':>4} {'索引(ms)':>10} {'逐个比较(ms)':>14} {'平均结果数':>10}")
+    for distance in args.distances:
+        started = time.perf_counter()
+        found = sum(len(index.search(value, distance)) for value in queries)
+        indexed = (time.perf_counter() - started) / len(queries)
+
+        # 逐个比较很慢，只取少量查询
+        linear_queries = queries[:5]
+        started = time.perf_counter()
+        for value in linear_queries:
+            [image_id for image_id, other in enumerate(hashes) if hamming_distance(value, other) <= distance]
+        linear = (time.perf_counter() - started) / len(linear_queries)
+
+        print(f"{distance:>4} {indexed * 1000:>10.2f} {linear * 1000:>14.1f} {found / len(queries):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
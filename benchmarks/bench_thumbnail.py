@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+缩略图生成基准测试
+对比全分辨率解码（旧实现）与低分辨率解码（draft/reduce）的耗时和峰值内存
+
+用法（在项目根目录执行）:
+    python benchmarks/bench_thumbnail.py [--megapixels 12 24 45] [--repeat 3]
+"""
+
+import argparse
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from PIL import Image as PILImage
+import piexif
+
+
+def legacy_thumbnail_bytes(img, orientation=1, size=150):
+    """旧实现：先做模式转换和旋转（触发全分辨率解码），再缩小"""
+    rotation_angle = {3: 180, 6: 90, 8: 270}.get(orientation, 0)
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = PILImage.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+    if rotation_angle != 0:
+        img = img.rotate(rotation_angle, expand=True)
+    img.thumbnail((size, size), PILImage.Resampling.LANCZOS)
+    buffer = io.BytesIO()
+    img.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
+
+
+def make_sample(path, megapixels, orientation):
+    """生成指定像素数的测试JPEG（噪声+渐变，避免压缩过度）"""
+    width = int((megapixels * 1_000_000 * 3 / 2) ** 0.5)
+    height = int(width * 2 / 3)
+    noise = PILImage.effect_noise((width, height), 64)
+    gradient = PILImage.linear_gradient('L').resize((width, height))
+    img = PILImage.merge('RGB', (noise, gradient, noise.transpose(PILImage.Transpose.FLIP_LEFT_RIGHT)))
+    exif = piexif.dump({'0th': {piexif.ImageIFD.Orientation: orientation}})
+    img.save(path, 'JPEG', quality=90, exif=exif)
+    return width * height
+
+
+def peak_rss_kb():
+    """当前进程的峰值内存（KB）
+    优先读取/proc的VmHWM：ru_maxrss在Linux上会从父进程继承，子进程测量不准确"""
+    try:
+        with open('/proc/self/status', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def measure(mode, path, orientation, repeat):
+    """在子进程中运行，返回 (平均耗时秒, 峰值内存增量MB)"""
+    from src.core.ingest import create_thumbnail_bytes, THUMBNAIL_BASE_LEVEL
+    func = legacy_thumbnail_bytes if mode == 'before' else create_thumbnail_bytes
+
+    # 用小图预热，排除导入和编解码器初始化的内存
+    buffer = io.BytesIO()
+    PILImage.new('RGB', (64, 64)).save(buffer, 'JPEG')
+    with PILImage.open(buffer) as img:
+        func(img, orientation, THUMBNAIL_BASE_LEVEL)
+    baseline = peak_rss_kb()
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        with PILImage.open(path) as img:
+            func(img, orientation, THUMBNAIL_BASE_LEVEL)
+    elapsed = (time.perf_counter() - started) / repeat
+
+    peak = peak_rss_kb()
+    return elapsed, max(0, peak - baseline) / 1024.0
+
+
+def run_child(mode, path, orientation, repeat):
+    """启动独立进程测量，保证峰值内存互不影响"""
+    output = subprocess.check_output([
+        sys.executable, __file__, '--child', mode, path, str(orientation), str(repeat)
+    ], cwd=project_root)
+    return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="缩略图生成基准测试")
+    parser.add_argument('--megapixels', type=float, nargs='+', default=[12, 24, 45])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--child', nargs=4, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        mode, path, orientation, repeat = args.child
+        elapsed, peak_mb = measure(mode, path, int(orientation), int(repeat))
+        print(json.dumps([elapsed, peak_mb]))
+        return
+
+    print(f"{'像素':>8} {'方向':>4} {'实现':>7} {'耗时(ms)':>10} {'ms/MP':>8} {'峰值(MB)':>10} {'MB/MP':>8}")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for megapixels in args.megapixels:
+            for orientation in (1, 6):
+                path = os.path.join(tmp_dir, f"sample_{megapixels}_{orientation}.jpg")
+                pixels = make_sample(path, megapixels, orientation)
+                mp = pixels / 1_000_000
+                for mode in ('before', 'after'):
+                    elapsed, peak_mb = run_child(mode, path, orientation, args.repeat)
+                    print(f"{mp:>7.1f}M {orientation:>4} {mode:>7} {elapsed * 1000:>10.1f} "
+                          f"{elapsed * 1000 / mp:>8.2f} {peak_mb:>10.1f} {peak_mb / mp:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+"""
+命令行索引工具
+不创建QApplication，在当前线程直接执行扫描线程的run()，与桌面程序共用遍历、解析和批量写入的逻辑，
+适合在夜间导入大型图库，完成后桌面程序直接打开同一个 data/image_manager.db
+
+用法（在项目根目录执行）:
+    python -m src.cli add <目录>... [--no-scan]      注册目录并扫描
+    python -m src.cli scan [目录...]                 增量扫描（默认所有已启用的注册目录）
+    python -m src.cli rescan [目录...]               完整重新扫描
+    python -m src.cli thumbnails [目录...]           重新生成缺失或仍是内嵌缩略图的缩略图
+    python -m src.cli stats                          图库统计
+    python -m src.cli failures [目录...] [--retry]    列出处理失败（已隔离）的文件，--retry时重试并扫描
+    python -m src.cli migrate-thumbnails             把旧版本的独立缩略图文件导入打包存储
+    python -m src.cli compact-thumbnails             压缩整理缩略图段文件，回收被替换和删除的缩略图占用的空间
+
+扫描类命令支持 --workers、--batch-size、--low-priority，加 --json 时向标准输出写入JSON统计；
+进度和失败文件输出到标准错误。按Ctrl+C会在当前批次写入后停止，下次扫描从检查点继续
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import signal
+import sys
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from sqlalchemy import func
+
+from src.core.database import SessionLocal
+from src.core.duplicates import duplicate_summary
+from src.core.initializer import init_database
+from src.core.quarantine import list_failures, retry_failures
+from src.core.scan_jobs import JOB_RUNNING, JOB_PAUSED, JOB_INTERRUPTED
+from src.core.scanner_thread import ImageScannerThread
+from src.core.thumbnails import compact_thumbnails, migrate_loose_thumbnails, store_stats, COMPACT_DEAD_RATIO
+from src.models import Directory, Image, Thumbnail, ScanJob, ScanFailure
+
+
+def load_scanner_settings():
+    """读取与桌面程序相同的扫描器配置，命令行参数优先"""
+    try:
+        config_file = project_root / "config" / "settings.json"
+        if config_file.exists():
+            with open(config_file, 'r', encoding='utf-8') as f:
+                return json.load(f).get('scanner', {})
+    except Exception:
+        pass
+    return {}
+
+
+class ConsoleReporter:
+    """把扫描线程的信号输出到终端：进度和失败写标准错误，最终统计写标准输出"""
+
+    def __init__(self, quiet=False):
+        self.quiet = quiet
+        self.interactive = sys.stderr.isatty()
+        self.stats = {}
+        self.failures = []
+        self.failure_count = 0
+        self.errors = []
+
+    def connect(self, scanner):
+        scanner.progress_updated.connect(self.on_progress)
+        scanner.thumbnails_refined.connect(self.on_thumbnails)
+        scanner.scan_failures.connect(self.on_failures)
+        scanner.scan_stats.connect(self.on_stats)
+        scanner.scan_error.connect(self.on_error)
+
+    def _status(self, text):
+        if self.quiet:
+            return
+        if self.interactive:
+            print(f"\r{text}", end='', file=sys.stderr, flush=True)
+        else:
+            print(text, file=sys.stderr, flush=True)
+
+    def end_line(self):
+        """结束终端中原地刷新的进度行"""
+        if self.interactive and not self.quiet:
+            print(file=sys.stderr)
+
+    def on_progress(self, current, total):
+        self._status(f"扫描进度: {current}/{total}")
+
+    def on_thumbnails(self, current, total):
+        self._status(f"缩略图: {current}/{total}")
+
+    def on_failures(self, failures, count):
+        self.failures.extend(failures)
+        self.failure_count += count
+        if not self.quiet:
+            self.end_line()
+            for image_path, message in failures:
+                print(f"失败: {image_path}: {message}", file=sys.stderr)
+            if count > len(failures):
+                print(f"……另有 {count - len(failures)} 个文件失败", file=sys.stderr)
+
+    def on_stats(self, stats):
+        self.stats = stats
+
+    def on_error(self, message):
+        self.errors.append(message)
+        self.end_line()
+        print(message, file=sys.stderr)
+
+
+def resolve_directories(session, paths):
+    """把命令行给出的路径对应到注册目录，未给出时返回所有启用的目录"""
+    if not paths:
+        return [row.path for row in session.query(Directory.path).filter(Directory.is_active.is_(True))]
+
+    resolved = []
+    for path in paths:
+        normalized_path = os.path.normpath(os.path.abspath(path))
+        if session.query(Directory.id).filter(Directory.path == normalized_path).first() is None:
+            raise SystemExit(f"目录尚未注册: {normalized_path}（先执行 add）")
+        resolved.append(normalized_path)
+    return resolved
+
+
+def register_directories(session, paths):
+    """注册新目录，已注册的目录直接返回，返回规范化后的路径"""
+    registered = []
+    for path in paths:
+        normalized_path = os.path.normpath(os.path.abspath(path))
+        if not os.path.isdir(normalized_path):
+            raise SystemExit(f"目录不存在: {normalized_path}")
+        if session.query(Directory.id).filter(Directory.path == normalized_path).first() is None:
+            session.add(Directory(path=normalized_path, name=os.path.basename(normalized_path)))
+            print(f"已添加目录: {normalized_path}", file=sys.stderr)
+        registered.append(normalized_path)
+    session.commit()
+    return registered
+
+
+def run_scanner(directories, args, incremental=True, thumbnails_only=False):
+    """在当前线程运行扫描，返回 (统计, 报告器)"""
+    settings = load_scanner_settings()
+    scanner = ImageScannerThread(
+        directories,
+        incremental=incremental,
+        workers=args.workers or settings.get('workers') or None,
+        batch_size=args.batch_size or settings.get('batch_size', 200),
+        batch_interval_ms=settings.get('batch_interval_ms', 500),
+        embedded_thumbnails=settings.get('embedded_thumbnails', False) and not args.final_thumbnails,
+        low_priority=args.low_priority,
+        progress_interval_ms=500 if sys.stderr.isatty() else 10000,
+        thumbnails_only=thumbnails_only
+    )
+    reporter = ConsoleReporter(quiet=args.quiet)
+    reporter.connect(scanner)
+
+    # 第一次Ctrl+C请求停止并保存检查点，第二次强制退出
+    def interrupt(signum, frame):
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        reporter.end_line()
+        print("正在停止，下次扫描从检查点继续（再次按Ctrl+C强制退出）", file=sys.stderr)
+        scanner.stop()
+
+    previous_handler = signal.signal(signal.SIGINT, interrupt)
+    try:
+        # 扫描过程中的诊断输出转到标准错误，标准输出只保留结果
+        with contextlib.redirect_stdout(sys.stderr):
+            scanner.run()
+    finally:
+        signal.signal(signal.SIGINT, previous_handler)
+    reporter.end_line()
+
+    if scanner.is_stopped():
+        reporter.stats['interrupted'] = True
+    return reporter.stats, reporter
+
+
+def print_scan_result(command, directories, stats, reporter, as_json):
+    """输出扫描结果"""
+    if as_json:
+        result = {
+            'command': command,
+            'directories': directories,
+            'stats': stats,
+            'failures': [{'path': image_path, 'error': message} for image_path, message in reporter.failures],
+            'errors': reporter.errors
+        }
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return
+
+    if not stats:
+        return
+    print(f"处理 {stats['processed']} 张图片：新增 {stats['new']}，更新 {stats['updated']}，"
+          f"未变化 {stats['skipped']}，失败 {stats['failed']}，移除 {stats['removed']}，"
+          f"跳过之前失败的文件 {stats.get('quarantined', 0)}")
+    print(f"写入 {stats['batches']} 批（最大 {stats['largest_batch']} 条），写入耗时 {stats['write_seconds']:.2f} 秒，"
+          f"总耗时 {stats['elapsed_seconds']:.2f} 秒，{stats['workers']} 个解析进程")
+    if stats.get('interrupted'):
+        print("扫描已中断，下次扫描从检查点继续")
+
+
+def library_stats(session):
+    """图库统计"""
+    image_count, total_bytes = session.query(func.count(Image.id), func.sum(Image.file_size)).one()
+    thumbnail_sources = dict(
+        session.query(Thumbnail.source, func.count(Thumbnail.id)).group_by(Thumbnail.source).all()
+    )
+    without_thumbnail = session.query(func.count(Image.id)).outerjoin(
+        Thumbnail, Thumbnail.image_id == Image.id
+    ).filter(Thumbnail.id.is_(None)).scalar()
+    image_counts = dict(
+        session.query(Image.directory_id, func.count(Image.id)).group_by(Image.directory_id).all()
+    )
+    unfinished_jobs = session.query(func.count(ScanJob.id)).filter(
+        ScanJob.status.in_([JOB_RUNNING, JOB_PAUSED, JOB_INTERRUPTED])
+    ).scalar()
+    db_file = Path("./data/image_manager.db")
+
+    return {
+        'database': {
+            'path': str(db_file.resolve()),
+            'size_bytes': db_file.stat().st_size if db_file.exists() else 0
+        },
+        'directories': [
+            {
+                'id': directory.id,
+                'path': directory.path,
+                'active': directory.is_active,
+                'images': image_counts.get(directory.id, 0),
+                'last_scanned_at': directory.last_scanned_at.isoformat() if directory.last_scanned_at else None
+            }
+            for directory in session.query(Directory).order_by(Directory.path)
+        ],
+        'images': image_count,
+        'total_bytes': total_bytes or 0,
+        'thumbnails': {
+            'by_source': thumbnail_sources,
+            'missing': without_thumbnail,
+            'store': store_stats(session)
+        },
+        'perceptual_hashes': session.query(func.count(Image.id)).filter(Image.phash.isnot(None)).scalar(),
+        'duplicates': duplicate_summary(session),
+        'quarantined_files': session.query(func.count(ScanFailure.id)).scalar(),
+        'unfinished_scan_jobs': unfinished_jobs
+    }
+
+
+def print_library_stats(stats, as_json):
+    """输出图库统计"""
+    if as_json:
+        print(json.dumps(stats, ensure_ascii=False, indent=2))
+        return
+
+    print(f"数据库: {stats['database']['path']} ({stats['database']['size_bytes'] / (1024 * 1024):.1f} MB)")
+    print(f"图片: {stats['images']} 张，共 {stats['total_bytes'] / (1024 * 1024 * 1024):.2f} GB")
+    for directory in stats['directories']:
+        state = "" if directory['active'] else "（已停用）"
+        print(f"  {directory['path']}: {directory['images']} 张{state}")
+    sources = "，".join(f"{source} {count}" for source, count in stats['thumbnails']['by_source'].items())
+    print(f"缩略图: {sources or '无'}，缺失 {stats['thumbnails']['missing']}")
+    store = stats['thumbnails']['store']
+    print(f"缩略图存储: {store['segments']} 个段文件，{store['file_bytes'] / (1024 * 1024):.1f} MB，"
+          f"无效数据 {store['dead_ratio']:.0%}，未迁移的独立文件 {store['loose_thumbnails']}")
+    print(f"感知哈希: {stats['perceptual_hashes']} 张")
+    duplicates = stats['duplicates']
+    print(f"重复图片: {duplicates['groups']} 组，多余副本 {duplicates['redundant_copies']} 个，"
+          f"可节省 {duplicates['reclaimable_bytes'] / (1024 * 1024):.1f} MB")
+    print(f"处理失败（已隔离）的文件: {stats['quarantined_files']}")
+    print(f"未完成的扫描任务: {stats['unfinished_scan_jobs']}")
+
+
+def print_failures(failures, as_json):
+    """输出隔离的文件"""
+    if as_json:
+        print(json.dumps([failure.to_dict() for failure in failures], ensure_ascii=False, indent=2))
+        return
+    for failure in failures:
+        print(f"[{failure.id}] {failure.file_path}\n    {failure.error_type}: {failure.error_message}"
+              f"（{failure.attempts} 次）")
+    print(f"共 {len(failures)} 个文件")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m src.cli", description="ImageManager 命令行索引工具")
+    parser.add_argument('--json', action='store_true', help="以JSON输出统计")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    scan_options = argparse.ArgumentParser(add_help=False)
+    scan_options.add_argument('--workers', type=int, default=0, help="解析进程数（默认使用配置或CPU核心数）")
+    scan_options.add_argument('--batch-size', type=int, default=0, help="每个事务写入的最大记录数")
+    scan_options.add_argument('--low-priority', action='store_true', help="降低CPU和IO优先级")
+    scan_options.add_argument('--final-thumbnails', action='store_true',
+                              help="直接生成最终缩略图，不使用内嵌缩略图再替换的两轮方式")
+    scan_options.add_argument('--quiet', action='store_true', help="不输出进度和失败文件")
+    scan_options.add_argument('--json', action='store_true', default=argparse.SUPPRESS, help="以JSON输出统计")
+
+    add_parser = subparsers.add_parser('add', parents=[scan_options], help="注册目录并扫描")
+    add_parser.add_argument('paths', nargs='+')
+    add_parser.add_argument('--no-scan', action='store_true', help="只注册，不扫描")
+
+    for name, help_text in (('scan', "增量扫描"), ('rescan', "完整重新扫描"),
+                            ('thumbnails', "重新生成缺失或仍是内嵌缩略图的缩略图")):
+        command_parser = subparsers.add_parser(name, parents=[scan_options], help=help_text)
+        command_parser.add_argument('paths', nargs='*', help="注册目录（默认所有已启用的目录）")
+
+    failures_parser = subparsers.add_parser('failures', parents=[scan_options], help="处理失败（已隔离）的文件")
+    failures_parser.add_argument('paths', nargs='*', help="注册目录（默认全部）")
+    failures_parser.add_argument('--retry', action='store_true', help="清除隔离并重新扫描这些文件所在的目录")
+    failures_parser.add_argument('--ids', type=int, nargs='+', help="只重试指定ID的文件")
+
+    migrate_parser = subparsers.add_parser('migrate-thumbnails', help="把旧版本的独立缩略图文件导入打包存储")
+    migrate_parser.add_argument('--json', action='store_true', default=argparse.SUPPRESS, help="以JSON输出统计")
+
+    compact_parser = subparsers.add_parser('compact-thumbnails', help="压缩整理缩略图段文件")
+    compact_parser.add_argument('--min-dead-ratio', type=float, default=COMPACT_DEAD_RATIO,
+                                help="整理无效数据比例不低于该值的段文件（0表示全部整理）")
+    compact_parser.add_argument('--json', action='store_true', default=argparse.SUPPRESS, help="以JSON输出统计")
+
+    stats_parser = subparsers.add_parser('stats', help="图库统计")
+    stats_parser.add_argument('--json', action='store_true', default=argparse.SUPPRESS, help="以JSON输出统计")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    if not init_database():
+        print("数据库初始化失败", file=sys.stderr)
+        return 1
+
+    if args.command == 'migrate-thumbnails':
+        progress = lambda done, total: print(f"\r迁移缩略图 {done}/{total}", end='', file=sys.stderr, flush=True)
+        result = migrate_loose_thumbnails(SessionLocal, progress=progress)
+        if result['migrated']:
+            print(file=sys.stderr)
+        result.update(compact_thumbnails(SessionLocal))
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False, indent=2))
+        else:
+            print(f"迁移 {result['migrated']} 组缩略图，{result['missing']} 组文件已丢失（运行 thumbnails 重新生成），"
+                  f"删除 {result['removed_files']} 个无引用的文件")
+        return 0
+    if args.command == 'compact-thumbnails':
+        result = compact_thumbnails(SessionLocal, args.min_dead_ratio)
+        if args.json:
+            print(json.dumps(result, ensure_ascii=False, indent=2))
+        else:
+            print(f"整理 {result['segments']} 个段文件，回收 {result['reclaimed_bytes'] / (1024 * 1024):.1f} MB")
+        return 0
+
+    session = SessionLocal()
+    try:
+        if args.command == 'stats':
+            print_library_stats(library_stats(session), args.json)
+            return 0
+        if args.command == 'failures':
+            directory_ids = [None]
+            if args.paths:
+                directory_paths = resolve_directories(session, args.paths)
+                directory_ids = [row.id for row in session.query(Directory.id).filter(Directory.path.in_(directory_paths))]
+            if not args.retry:
+                failures = [failure for directory_id in directory_ids for failure in list_failures(session, directory_id)]
+                print_failures(failures, args.json)
+                return 0
+            directories = []
+            for directory_id in directory_ids:
+                directories.extend(path for path in retry_failures(session, args.ids, directory_id)
+                                   if path not in directories)
+            if not directories:
+                print("没有需要重试的文件", file=sys.stderr)
+                return 0
+        elif args.command == 'add':
+            directories = register_directories(session, args.paths)
+            if args.no_scan:
+                return 0
+        else:
+            directories = resolve_directories(session, args.paths)
+    finally:
+        session.close()
+
+    if not directories:
+        print("没有可扫描的目录（先执行 add）", file=sys.stderr)
+        return 1
+
+    stats, reporter = run_scanner(
+        directories, args,
+        incremental=args.command != 'rescan',
+        thumbnails_only=args.command == 'thumbnails'
+    )
+    print_scan_result(args.command, directories, stats, reporter, args.json)
+    return 1 if reporter.errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
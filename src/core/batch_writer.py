@@ -0,0 +1,256 @@
+"""
+批量写入模块
+缓冲扫描结果，按数量或时间间隔在单个事务中批量写入图片和缩略图记录
+"""
+import time
+from datetime import datetime
+from sqlalchemy import func, insert, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from src.core.ingest import (THUMBNAIL_BASE_LEVEL, THUMBNAIL_GENERATOR_VERSION, THUMBNAIL_SOURCE_DECODED,
+                             thumbnail_dimensions, thumbnail_fingerprint)
+from src.core.thumbnails import (delete_thumbnails, put_thumbnails, stored_sizes, thumbnail_key,
+                                 unique_thumbnail_key)
+from src.models.image import Image
+from src.models.thumbnail import Thumbnail
+
+
+def remove_unreferenced_thumbnails(session, thumbnail_paths):
+    """删除不再被任何缩略图记录引用的缩略图（各级），内容相同的图片共用一组缩略图"""
+    paths = list({path for path in thumbnail_paths if path})
+    referenced = set()
+    for start in range(0, len(paths), 500):
+        chunk = paths[start:start + 500]
+        referenced.update(
+            row.thumbnail_path for row in
+            session.query(Thumbnail.thumbnail_path).filter(Thumbnail.thumbnail_path.in_(chunk))
+        )
+    unreferenced = [path for path in paths if path not in referenced]
+    if unreferenced:
+        delete_thumbnails(session, unreferenced)
+
+
+class BatchWriter:
+    """扫描结果批量写入器"""
+
+    def __init__(self, Session, batch_size=200, flush_interval_ms=500):
+        self.Session = Session
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.pending = []  # 待写入: (图片路径, 图片字段, {缩略图尺寸: 字节}, 缩略图来源, 目录ID, 已有图片ID, 共用的缩略图路径, 原图指纹)
+        self._last_flush = time.monotonic()
+
+        self.stats = {
+            'batch_size': self.batch_size,
+            'flush_interval_ms': flush_interval_ms,
+            'batches': 0,
+            'records': 0,
+            'inserted': 0,  # 新增的图片记录
+            'updated': 0,  # 文件变化后重新解析的图片记录
+            'thumbnails': 0,  # 只替换缩略图的记录
+            'largest_batch': 0,
+            'write_seconds': 0.0
+        }
+
+    def add(self, values, thumbnail_bytes, directory_id, image_id=None,
+            thumbnail_source=THUMBNAIL_SOURCE_DECODED, thumbnail_path=None):
+        """
+        添加一条扫描结果，达到批量大小或时间间隔时自动写入
+        thumbnail_path为已有的缩略图存储键（内容相同的图片共用），此时thumbnail_bytes为None
+        返回写入失败的记录列表 [(文件路径, 异常)]
+        """
+        self.pending.append((values['file_path'], values, thumbnail_bytes, thumbnail_source,
+                             directory_id, image_id, thumbnail_path,
+                             thumbnail_fingerprint(values['file_size'], values['file_mtime_ns'])))
+        return self._flush_if_full()
+
+    def add_thumbnail(self, image_id, image_path, thumbnail_bytes, source_fingerprint,
+                      thumbnail_source=THUMBNAIL_SOURCE_DECODED):
+        """只替换已有图片的缩略图，source_fingerprint为生成时原图的指纹，返回写入失败的记录列表"""
+        self.pending.append((image_path, None, thumbnail_bytes, thumbnail_source, None, image_id, None,
+                             source_fingerprint))
+        return self._flush_if_full()
+
+    def _flush_if_full(self):
+        """达到批量大小或时间间隔时写入"""
+        if len(self.pending) >= self.batch_size:
+            return self.flush()
+        return self.flush_if_due()
+
+    def flush_if_due(self):
+        """距上次写入超过时间间隔时写入"""
+        if self.pending and time.monotonic() - self._last_flush >= self.flush_interval:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """将缓冲的记录在一个事务中写入，返回写入失败的记录列表"""
+        batch, self.pending = self.pending, []
+        self._last_flush = time.monotonic()
+        if not batch:
+            return []
+
+        started = time.perf_counter()
+        try:
+            self._write_batch(batch)
+            failures = []
+        except Exception:
+            # 整批失败时逐条写入，定位出错的记录
+            failures = []
+            for record in batch:
+                try:
+                    self._write_batch([record])
+                except Exception as e:
+                    failures.append((record[0], e))
+
+        self.stats['batches'] += 1
+        self.stats['records'] += len(batch) - len(failures)
+        failed_paths = {image_path for image_path, _ in failures}
+        for image_path, values, _, _, _, image_id, _, _ in batch:
+            if image_path in failed_paths:
+                continue
+            if values is None:
+                self.stats['thumbnails'] += 1
+            elif image_id:
+                self.stats['updated'] += 1
+            else:
+                self.stats['inserted'] += 1
+        self.stats['largest_batch'] = max(self.stats['largest_batch'], len(batch))
+        self.stats['write_seconds'] += time.perf_counter() - started
+        return failures
+
+    def _base_dimensions(self, levels):
+        """{尺寸: JPEG字节} 中基础级缩略图的宽高，无法读取时为 (None, None)"""
+        data = levels.get(THUMBNAIL_BASE_LEVEL)
+        if not data:
+            return None, None
+        try:
+            return thumbnail_dimensions(data)
+        except Exception as e:
+            print(f"读取缩略图尺寸失败: {e}")
+            return None, None
+
+    def _keys_used_by_others(self, session, owners):
+        """{存储键: 图片ID} 中被其他图片的缩略图记录引用的存储键"""
+        keys = list(owners)
+        shared = set()
+        for start in range(0, len(keys), 500):
+            shared.update(
+                row.thumbnail_path for row in
+                session.query(Thumbnail.thumbnail_path, Thumbnail.image_id).filter(
+                    Thumbnail.thumbnail_path.in_(keys[start:start + 500])
+                ) if row.image_id != owners[row.thumbnail_path]
+            )
+        return shared
+
+    def _write_batch(self, batch):
+        """单事务写入一批记录"""
+        # 缩略图存储键只依赖图片路径，和记录在同一个事务中写入
+        thumbnail_paths = {}
+        owners = {}  # 写入新缩略图的存储键 -> 图片ID（新图片为None）
+        for image_path, _, thumbnail_bytes, _, _, image_id, shared_path, _ in batch:
+            if thumbnail_bytes is None:
+                thumbnail_paths[image_path] = shared_path
+            else:
+                thumbnail_paths[image_path] = thumbnail_key(image_path)
+                owners[thumbnail_paths[image_path]] = image_id
+
+        new_rows = [dict(values, directory_id=directory_id)
+                    for _, values, _, _, directory_id, image_id, _, _ in batch if values and not image_id]
+        changed_rows = [dict(values, id=image_id)
+                        for _, values, _, _, _, image_id, _, _ in batch if values and image_id]
+
+        session = self.Session()
+        try:
+            # 存储键仍被其他图片共用时（内容相同的副本复用了原图的缩略图），原图变化后改用新的键，
+            # 副本继续显示原来的内容
+            shared = self._keys_used_by_others(session, owners)
+            shared.update(owners.keys() & {thumbnail_paths[image_path]
+                                           for image_path, _, thumbnail_bytes, *_ in batch if thumbnail_bytes is None})
+            thumbnail_levels = {}
+            for image_path, _, thumbnail_bytes, *_ in batch:
+                if thumbnail_bytes is not None:
+                    if thumbnail_paths[image_path] in shared:
+                        thumbnail_paths[image_path] = unique_thumbnail_key()
+                    thumbnail_levels[thumbnail_paths[image_path]] = thumbnail_bytes
+            thumbnail_sizes = put_thumbnails(session, thumbnail_levels)
+            thumbnail_versions = dict.fromkeys(thumbnail_sizes, THUMBNAIL_GENERATOR_VERSION)
+            # 记录基础级缩略图的实际宽高（非正方形的图片小于级别尺寸）
+            thumbnail_dims = {key: self._base_dimensions(levels)
+                              for key, levels in thumbnail_levels.items()}
+            shared_paths = set(thumbnail_paths.values()) - set(thumbnail_sizes)
+            if shared_paths:
+                # 共用的缩略图沿用原记录的生成器版本和宽高，过期时会被重新生成
+                thumbnail_sizes.update(stored_sizes(session, shared_paths))
+                for path, version, width, height in session.query(
+                    Thumbnail.thumbnail_path, func.min(Thumbnail.generator_version),
+                    func.max(Thumbnail.width), func.max(Thumbnail.height)
+                ).filter(
+                    Thumbnail.thumbnail_path.in_(shared_paths)
+                ).group_by(Thumbnail.thumbnail_path):
+                    thumbnail_versions[path] = version
+                    thumbnail_dims[path] = (width, height)
+
+            # 只更新缩略图的记录已知图片ID
+            image_ids = {image_path: image_id
+                         for image_path, values, _, _, _, image_id, _, _ in batch if not values}
+            if new_rows:
+                result = session.execute(
+                    insert(Image).returning(Image.id, Image.file_path), new_rows
+                )
+                image_ids.update({row.file_path: row.id for row in result})
+
+            stale_thumbnails = []
+            existing_ids = [image_id for _, _, _, _, _, image_id, _, _ in batch if image_id]
+            if existing_ids:
+                stale_thumbnails = [
+                    row.thumbnail_path for row in
+                    session.query(Thumbnail.thumbnail_path).filter(Thumbnail.image_id.in_(existing_ids))
+                ]
+            if changed_rows:
+                session.execute(update(Image), changed_rows)
+                image_ids.update({row['file_path']: row['id'] for row in changed_rows})
+
+            # 缩略图记录：image_id唯一，已存在时更新
+            thumbnail_rows = [
+                {
+                    'image_id': image_ids[image_path],
+                    'thumbnail_path': thumbnail_paths[image_path],
+                    'width': thumbnail_dims.get(thumbnail_paths[image_path], (None, None))[0],
+                    'height': thumbnail_dims.get(thumbnail_paths[image_path], (None, None))[1],
+                    'file_size': thumbnail_sizes.get(thumbnail_paths[image_path]),
+                    'source': thumbnail_source,
+                    'generator_version': thumbnail_versions.get(thumbnail_paths[image_path]),
+                    'source_fingerprint': source_fingerprint
+                }
+                for image_path, _, _, thumbnail_source, _, _, _, source_fingerprint in batch
+            ]
+            stmt = sqlite_insert(Thumbnail)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Thumbnail.image_id],
+                set_={
+                    'thumbnail_path': stmt.excluded.thumbnail_path,
+                    'width': stmt.excluded.width,
+                    'height': stmt.excluded.height,
+                    'file_size': stmt.excluded.file_size,
+                    'source': stmt.excluded.source,
+                    'generator_version': stmt.excluded.generator_version,
+                    'source_fingerprint': stmt.excluded.source_fingerprint,
+                    'updated_at': datetime.now()
+                }
+            )
+            session.connection().execute(stmt, thumbnail_rows)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        else:
+            # 删除被替换、且没有其他图片共用的旧缩略图
+            current_paths = set(thumbnail_paths.values())
+            try:
+                remove_unreferenced_thumbnails(
+                    session, [path for path in stale_thumbnails if path not in current_paths]
+                )
+            except Exception as e:
+                print(f"清理旧缩略图失败: {e}")
+        finally:
+            session.close()
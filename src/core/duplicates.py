@@ -0,0 +1,47 @@
+"""
+重复图片查询模块
+按完整内容哈希对图片分组，内容完全相同的副本归为一组
+"""
+from sqlalchemy import func
+from src.models.image import Image
+
+
+def _duplicate_hash_query(session):
+    """有多张图片共用的完整哈希，及每组的图片数和文件大小"""
+    return session.query(
+        Image.full_hash,
+        func.count(Image.id).label('copies'),
+        func.max(Image.file_size).label('file_size')
+    ).filter(
+        Image.full_hash.isnot(None)
+    ).group_by(Image.full_hash).having(func.count(Image.id) > 1)
+
+
+def find_duplicate_groups(session):
+    """
+    返回重复图片分组 [[Image, ...], ...]
+    组内按路径排序，组之间按可节省的空间（多余副本的总大小）降序
+    """
+    hashes = [row.full_hash for row in _duplicate_hash_query(session)]
+    groups = {}
+    for start in range(0, len(hashes), 500):
+        images = session.query(Image).filter(
+            Image.full_hash.in_(hashes[start:start + 500])
+        ).order_by(Image.file_path).all()
+        for image in images:
+            groups.setdefault(image.full_hash, []).append(image)
+
+    return sorted(groups.values(),
+                  key=lambda group: (group[0].file_size or 0) * (len(group) - 1),
+                  reverse=True)
+
+
+def duplicate_summary(session):
+    """重复图片统计: 分组数、图片总数、多余副本数和删除多余副本可节省的字节数"""
+    rows = _duplicate_hash_query(session).all()
+    return {
+        'groups': len(rows),
+        'images': sum(row.copies for row in rows),
+        'redundant_copies': sum(row.copies - 1 for row in rows),
+        'reclaimable_bytes': sum((row.copies - 1) * (row.file_size or 0) for row in rows)
+    }
@@ -0,0 +1,490 @@
+"""
+EXIF读取模块
+只读取文件头部的元数据（JPEG的APP1段、PNG/WebP的EXIF块、HEIF的Exif项），TIFF按IFD偏移跳转读取，
+不需要把整个文件读入内存；解析时只保留入库需要的标签，再按标签表解码为图片记录的字段
+"""
+import io
+import struct
+from collections import namedtuple
+from datetime import datetime
+
+# IFD名称（与piexif一致）
+IFD_IMAGE = '0th'
+IFD_EXIF = 'Exif'
+IFD_GPS = 'GPS'
+IFD_THUMBNAIL = '1st'
+
+# 子IFD指针和IFD1中内嵌缩略图的位置
+TAG_EXIF_POINTER = 0x8769
+TAG_GPS_POINTER = 0x8825
+TAG_THUMBNAIL_OFFSET = 0x0201
+TAG_THUMBNAIL_LENGTH = 0x0202
+
+TAG_ORIENTATION = 0x0112
+
+# TIFF数据类型 -> (单个值的字节数, struct格式)
+_TIFF_TYPES = {
+    1: (1, 'B'), 2: (1, None), 3: (2, 'H'), 4: (4, 'L'), 5: (8, 'LL'), 6: (1, 'b'),
+    7: (1, None), 8: (2, 'h'), 9: (4, 'l'), 10: (8, 'll'), 11: (4, 'f'), 12: (8, 'd')
+}
+_RATIONAL_TYPES = (5, 10)
+
+# 有理数值，与piexif一样可按 (分子, 分母) 取用
+Rational = namedtuple('Rational', ['numerator', 'denominator'])
+
+# 单个标签值的大小上限，损坏的文件中计数可能非常大
+_MAX_VALUE_SIZE = 1 << 20
+
+# 枚举值的显示名称
+ORIENTATION_NAMES = {
+    1: 'Horizontal (normal)', 2: 'Mirror horizontal', 3: 'Rotate 180',
+    4: 'Mirror vertical', 5: 'Mirror horizontal and rotate 270 CW',
+    6: 'Rotate 90 CW', 7: 'Mirror horizontal and rotate 90 CW',
+    8: 'Rotate 270 CW'
+}
+COLOR_SPACE_NAMES = {1: 'sRGB', 2: 'Adobe RGB', 65535: 'Uncalibrated'}
+WHITE_BALANCE_NAMES = {0: 'Auto', 1: 'Manual', 2: 'Custom', 3: 'One-touch', 4: 'Subtle'}
+METERING_MODE_NAMES = {
+    0: 'Unknown', 1: 'Average', 2: 'Center-weighted average',
+    3: 'Spot', 4: 'Multi-spot', 5: 'Pattern', 6: 'Partial',
+    255: 'Other'
+}
+EXPOSURE_PROGRAM_NAMES = {
+    0: 'Not defined', 1: 'Manual', 2: 'Normal program',
+    3: 'Aperture priority', 4: 'Shutter priority', 5: 'Creative program',
+    6: 'Action program', 7: 'Portrait mode', 8: 'Landscape mode'
+}
+FLASH_NAMES = {
+    0: 'No Flash', 1: 'Fired', 5: 'Fired, Return not detected',
+    7: 'Fired, Return detected', 9: 'On', 13: 'On, Return not detected',
+    15: 'On, Return detected', 16: 'Off', 24: 'Auto, Did not fire',
+    25: 'Auto, Fired', 29: 'Auto, Fired, Return not detected',
+    31: 'Auto, Fired, Return detected', 32: 'No flash function',
+    65: 'Fired, Red-eye reduction', 69: 'Fired, Red-eye reduction, Return not detected',
+    71: 'Fired, Red-eye reduction, Return detected', 73: 'On, Red-eye reduction',
+    77: 'On, Red-eye reduction, Return not detected',
+    79: 'On, Red-eye reduction, Return detected', 89: 'Auto, Fired, Red-eye reduction',
+    93: 'Auto, Fired, Red-eye reduction, Return not detected',
+    95: 'Auto, Fired, Red-eye reduction, Return detected'
+}
+
+
+def _scalar(value):
+    """多值标签取第一个值"""
+    return value[0] if isinstance(value, tuple) and not isinstance(value, Rational) else value
+
+
+def _to_float(value):
+    """数值或有理数转为浮点数"""
+    value = _scalar(value)
+    if isinstance(value, Rational):
+        return value.numerator / value.denominator
+    return float(value)
+
+
+def _decode_text(value, ifd):
+    if isinstance(value, bytes):
+        value = value.decode('utf-8', errors='replace')
+    return value.strip() or None
+
+
+def _decode_datetime(value, ifd):
+    return datetime.strptime(_decode_text(value, ifd), '%Y:%m:%d %H:%M:%S')
+
+
+def _decode_float(value, ifd):
+    return _to_float(value)
+
+
+def _decode_int(value, ifd):
+    return int(_scalar(value))
+
+
+def _decode_exposure_time(value, ifd):
+    seconds = _to_float(value)
+    if seconds >= 1:
+        return f"{seconds:g}"
+    return f"1/{round(1 / seconds)}"
+
+
+def _enum_decoder(names):
+    """枚举标签的解码函数，名称表在模块加载时就已建好"""
+    def decode(value, ifd):
+        value = int(_scalar(value))
+        return names.get(value, str(value))
+    return decode
+
+
+def _gps_decoder(ref_tag, negative_refs):
+    """GPS坐标：度分秒转为十进制度，参考方向为南/西时取负"""
+    def decode(value, ifd):
+        degrees, minutes, seconds = (_to_float(part) for part in value[:3])
+        decimal = degrees + minutes / 60.0 + seconds / 3600.0
+        ref = ifd.get(ref_tag)
+        if isinstance(ref, bytes):
+            ref = ref.decode('ascii', errors='ignore')
+        return -decimal if ref and ref.strip() in negative_refs else decimal
+    return decode
+
+
+def _decode_altitude(value, ifd):
+    # GPSAltitudeRef为1表示海平面以下
+    altitude = _to_float(value)
+    return -altitude if _scalar(ifd.get(5, 0)) == 1 else altitude
+
+
+# 标签 -> 字段的解码表: (字段, IFD, 标签, 解码函数)
+# 同一字段出现多次时按顺序取第一个解码成功的值（如拍摄时间优先DateTimeOriginal）
+EXIF_COLUMNS = (
+    ('date_taken', IFD_EXIF, 0x9003, _decode_datetime),  # DateTimeOriginal
+    ('date_taken', IFD_IMAGE, 0x0132, _decode_datetime),  # DateTime
+    ('camera_make', IFD_IMAGE, 0x010F, _decode_text),
+    ('camera_model', IFD_IMAGE, 0x0110, _decode_text),
+    ('lens_model', IFD_EXIF, 0xA434, _decode_text),
+    ('focal_length', IFD_EXIF, 0x920A, _decode_float),
+    ('focal_length_35mm', IFD_EXIF, 0xA405, _decode_float),
+    ('aperture', IFD_EXIF, 0x829D, _decode_float),  # FNumber
+    ('shutter_speed', IFD_EXIF, 0x829A, _decode_exposure_time),  # ExposureTime
+    ('iso', IFD_EXIF, 0x8827, _decode_int),  # ISOSpeedRatings
+    ('gps_latitude', IFD_GPS, 0x0002, _gps_decoder(0x0001, ('S',))),
+    ('gps_longitude', IFD_GPS, 0x0004, _gps_decoder(0x0003, ('W',))),
+    ('gps_altitude', IFD_GPS, 0x0006, _decode_altitude),
+    ('orientation', IFD_IMAGE, TAG_ORIENTATION, _enum_decoder(ORIENTATION_NAMES)),
+    ('color_space', IFD_EXIF, 0xA001, _enum_decoder(COLOR_SPACE_NAMES)),
+    ('white_balance', IFD_EXIF, 0xA403, _enum_decoder(WHITE_BALANCE_NAMES)),
+    ('metering_mode', IFD_EXIF, 0x9207, _enum_decoder(METERING_MODE_NAMES)),
+    ('exposure_program', IFD_EXIF, 0x8822, _enum_decoder(EXPOSURE_PROGRAM_NAMES)),
+    ('flash', IFD_EXIF, 0x9209, _enum_decoder(FLASH_NAMES)),
+)
+
+# 每个IFD需要读取的标签（解码表中的标签、解码时用到的参考标签和子IFD指针）
+_WANTED_TAGS = {IFD_IMAGE: {TAG_EXIF_POINTER, TAG_GPS_POINTER}, IFD_EXIF: set(),
+                IFD_GPS: {0x0001, 0x0003, 0x0005}, IFD_THUMBNAIL: {TAG_THUMBNAIL_OFFSET, TAG_THUMBNAIL_LENGTH}}
+for _column, _ifd, _tag, _decoder in EXIF_COLUMNS:
+    _WANTED_TAGS[_ifd].add(_tag)
+
+
+def decode_exif(exif):
+    """按解码表把EXIF标签转换为图片记录的字段，单个字段解码失败不影响其他字段"""
+    columns = {}
+    if not exif:
+        return columns
+    for column, ifd_name, tag, decode in EXIF_COLUMNS:
+        if column in columns:
+            continue
+        ifd = exif.get(ifd_name) or {}
+        value = ifd.get(tag)
+        if value is None:
+            continue
+        try:
+            decoded = decode(value, ifd)
+        except Exception as e:
+            print(f"解析EXIF字段{column}失败: {e}")
+            continue
+        if decoded is not None:
+            columns[column] = decoded
+    return columns
+
+
+def get_orientation(exif):
+    """EXIF方向值（1-8），没有时返回1"""
+    try:
+        return int(_scalar(((exif or {}).get(IFD_IMAGE) or {}).get(TAG_ORIENTATION, 1)))
+    except (TypeError, ValueError):
+        return 1
+
+
+class _TiffReader:
+    """按偏移跳转读取TIFF结构中需要的标签，base为TIFF头在文件中的位置"""
+
+    def __init__(self, fp, base=0):
+        self.fp = fp
+        self.base = base
+        fp.seek(base)
+        header = fp.read(8)
+        if header[:2] == b'II':
+            self.endian = '<'
+        elif header[:2] == b'MM':
+            self.endian = '>'
+        else:
+            raise ValueError("无效的TIFF头")
+        magic, self.first_ifd = struct.unpack(self.endian + 'HL', header[2:8])
+        if magic != 42:
+            raise ValueError("无效的TIFF头")
+
+    def read(self, thumbnail=True):
+        """读取各IFD中需要的标签，返回 {IFD名称: {标签: 值}, 'thumbnail': 内嵌缩略图字节或None}"""
+        exif = {IFD_IMAGE: {}, IFD_EXIF: {}, IFD_GPS: {}, IFD_THUMBNAIL: {}, 'thumbnail': None}
+        image_ifd, next_ifd = self._read_ifd(self.first_ifd, _WANTED_TAGS[IFD_IMAGE])
+        exif[IFD_IMAGE] = image_ifd
+
+        for name, pointer in ((IFD_EXIF, TAG_EXIF_POINTER), (IFD_GPS, TAG_GPS_POINTER)):
+            offset = image_ifd.pop(pointer, None)
+            if offset:
+                try:
+                    exif[name] = self._read_ifd(_scalar(offset), _WANTED_TAGS[name])[0]
+                except (ValueError, struct.error) as e:
+                    print(f"读取EXIF {name} IFD失败: {e}")
+
+        if thumbnail and next_ifd:
+            try:
+                exif[IFD_THUMBNAIL] = self._read_ifd(next_ifd, _WANTED_TAGS[IFD_THUMBNAIL])[0]
+                offset = exif[IFD_THUMBNAIL].get(TAG_THUMBNAIL_OFFSET)
+                length = exif[IFD_THUMBNAIL].get(TAG_THUMBNAIL_LENGTH)
+                if offset and length and length <= _MAX_VALUE_SIZE:
+                    self.fp.seek(self.base + _scalar(offset))
+                    exif['thumbnail'] = self.fp.read(_scalar(length)) or None
+            except (ValueError, struct.error) as e:
+                print(f"读取EXIF缩略图失败: {e}")
+        return exif
+
+    def _read_ifd(self, offset, wanted):
+        """读取一个IFD中wanted包含的标签，返回 ({标签: 值}, 下一个IFD的偏移)"""
+        fp = self.fp
+        fp.seek(self.base + offset)
+        (count,) = struct.unpack(self.endian + 'H', fp.read(2))
+        entries = fp.read(count * 12 + 4)
+        if len(entries) < count * 12:
+            raise ValueError("IFD被截断")
+
+        values = {}
+        for index in range(count):
+            entry = entries[index * 12:index * 12 + 12]
+            tag, value_type, value_count = struct.unpack(self.endian + 'HHL', entry[:8])
+            if tag not in wanted or value_type not in _TIFF_TYPES:
+                continue
+            unit, fmt = _TIFF_TYPES[value_type]
+            size = unit * value_count
+            if size > _MAX_VALUE_SIZE:
+                continue
+            if size <= 4:
+                raw = entry[8:8 + size]
+            else:
+                # 值放不下时，条目中存的是值的偏移
+                (value_offset,) = struct.unpack(self.endian + 'L', entry[8:12])
+                fp.seek(self.base + value_offset)
+                raw = fp.read(size)
+                if len(raw) < size:
+                    continue
+            values[tag] = self._unpack(value_type, fmt, value_count, raw)
+
+        next_ifd = 0
+        if len(entries) >= count * 12 + 4:
+            (next_ifd,) = struct.unpack(self.endian + 'L', entries[count * 12:count * 12 + 4])
+        return values, next_ifd
+
+    def _unpack(self, value_type, fmt, value_count, raw):
+        """把原始字节转换为与piexif相同的结构：单值为标量，多值为元组，有理数为Rational"""
+        if fmt is None:
+            # ASCII去掉结尾的NUL，UNDEFINED保留原始字节
+            return raw.rstrip(b'\x00') if value_type == 2 else raw
+        numbers = struct.unpack(self.endian + fmt * value_count, raw)
+        if value_type in _RATIONAL_TYPES:
+            numbers = tuple(Rational(*pair) for pair in zip(numbers[::2], numbers[1::2]))
+        return numbers[0] if value_count == 1 else numbers
+
+
+def parse_exif(data, thumbnail=True):
+    """解析内存中的EXIF数据（TIFF结构，可带'Exif\\0\\0'前缀）"""
+    if data.startswith(b'Exif\x00\x00'):
+        data = data[6:]
+    return _TiffReader(io.BytesIO(data)).read(thumbnail)
+
+
+def read_exif(image_path, thumbnail=True):
+    """
+    只读取文件头部的元数据解析EXIF，没有EXIF时返回None
+    支持JPEG、TIFF（含DNG等基于TIFF的RAW）、PNG、WebP和HEIF/HEIC
+    """
+    with open(image_path, 'rb') as f:
+        head = f.read(16)
+        f.seek(0)
+        if head[:4] in (b'II*\x00', b'MM\x00*'):
+            return _TiffReader(f).read(thumbnail)
+        if head[:2] == b'\xff\xd8':
+            data = _jpeg_exif(f)
+        elif head[:8] == b'\x89PNG\r\n\x1a\n':
+            data = _png_exif(f)
+        elif head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            data = _webp_exif(f)
+        elif head[4:8] == b'ftyp':
+            data = _heif_exif(f)
+        else:
+            data = None
+    return parse_exif(data, thumbnail) if data else None
+
+
+def _jpeg_exif(f):
+    """逐段跳过JPEG头部，直到Exif APP1段；遇到图像数据（SOS）时停止"""
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None
+        while marker[1] == 0xFF:
+            # 段之间的填充字节
+            marker = marker[1:] + f.read(1)
+        code = marker[1]
+        if code in (0xDA, 0xD9):
+            return None
+        if code == 0x01 or 0xD0 <= code <= 0xD7:
+            continue
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return None
+        (length,) = struct.unpack('>H', length_bytes)
+        if code == 0xE1:
+            payload = f.read(length - 2)
+            if payload.startswith(b'Exif\x00\x00'):
+                return payload
+        else:
+            f.seek(length - 2, 1)
+
+
+def _png_exif(f):
+    """跳过PNG的各个块（包括图像数据块）查找eXIf块"""
+    f.seek(8)
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        length, chunk_type = struct.unpack('>L4s', header)
+        if chunk_type == b'eXIf':
+            return f.read(length)
+        if chunk_type == b'IEND':
+            return None
+        f.seek(length + 4, 1)  # 数据和CRC
+
+
+def _webp_exif(f):
+    """跳过WebP的RIFF块查找EXIF块"""
+    f.seek(12)
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        chunk_type, length = struct.unpack('<4sL', header)
+        if chunk_type == b'EXIF':
+            return f.read(length)
+        f.seek(length + (length & 1), 1)
+
+
+def _iter_boxes(f, end):
+    """遍历ISOBMFF的盒子，产出 (类型, 内容起点, 内容终点)"""
+    while end is None or f.tell() + 8 <= end:
+        start = f.tell()
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack('>L4s', header)
+        header_size = 8
+        if size == 1:
+            (size,) = struct.unpack('>Q', f.read(8))
+            header_size = 16
+        elif size == 0:
+            # 延伸到文件末尾
+            f.seek(0, 2)
+            size = f.tell() - start
+        if size < header_size:
+            return
+        yield box_type, start + header_size, start + size
+        f.seek(start + size)
+
+
+def _heif_exif(f):
+    """
+    读取HEIF/HEIC的meta盒子（通常只有几KB），从iinf找到Exif项、从iloc找到它在文件中的位置
+    之后只读取Exif项本身，不读取图像数据
+    """
+    f.seek(0)
+    meta = None
+    for box_type, start, end in _iter_boxes(f, None):
+        if box_type == b'meta':
+            f.seek(start)
+            meta = f.read(end - start)
+            break
+    if not meta:
+        return None
+
+    meta_file = io.BytesIO(meta)
+    meta_file.seek(4)  # meta是FullBox
+    exif_item = None
+    locations = {}
+    for box_type, start, end in _iter_boxes(meta_file, len(meta)):
+        body = meta[start:end]
+        if box_type == b'iinf':
+            exif_item = _heif_exif_item_id(body)
+        elif box_type == b'iloc':
+            locations = _heif_item_locations(body)
+    location = locations.get(exif_item) if exif_item is not None else None
+    if not location:
+        return None
+
+    base_offset, extents = location
+    data = b''
+    for offset, length in extents:
+        f.seek(base_offset + offset)
+        data += f.read(length)
+    if len(data) < 4:
+        return None
+    # Exif项以4字节的TIFF头偏移开头
+    (tiff_offset,) = struct.unpack('>L', data[:4])
+    return data[4 + tiff_offset:]
+
+
+def _heif_exif_item_id(body):
+    """从iinf盒子中找到类型为Exif的项ID"""
+    version = body[0]
+    stream = io.BytesIO(body)
+    stream.seek(4 + (2 if version == 0 else 4))  # FullBox头和项数
+    for box_type, start, end in _iter_boxes(stream, len(body)):
+        if box_type != b'infe':
+            continue
+        infe_version = body[start]
+        if infe_version < 2:
+            continue
+        position = start + 4
+        if infe_version == 2:
+            (item_id,) = struct.unpack('>H', body[position:position + 2])
+            position += 2
+        else:
+            (item_id,) = struct.unpack('>L', body[position:position + 4])
+            position += 4
+        position += 2  # item_protection_index
+        if body[position:position + 4] == b'Exif':
+            return item_id
+    return None
+
+
+def _heif_item_locations(body):
+    """解析iloc盒子，返回 {项ID: (基准偏移, [(偏移, 长度)])}，只包含直接存放在文件中的项"""
+    version = body[0]
+    position = 4
+
+    def read_int(size):
+        nonlocal position
+        value = int.from_bytes(body[position:position + size], 'big') if size else 0
+        position += size
+        return value
+
+    sizes = read_int(1)
+    offset_size, length_size = sizes >> 4, sizes & 0x0F
+    sizes = read_int(1)
+    base_offset_size = sizes >> 4
+    index_size = sizes & 0x0F if version in (1, 2) else 0
+    item_count = read_int(2 if version < 2 else 4)
+
+    locations = {}
+    for _ in range(item_count):
+        item_id = read_int(2 if version < 2 else 4)
+        construction_method = read_int(2) & 0x0F if version in (1, 2) else 0
+        read_int(2)  # data_reference_index
+        base_offset = read_int(base_offset_size)
+        extent_count = read_int(2)
+        extents = []
+        for _ in range(extent_count):
+            read_int(index_size)
+            extents.append((read_int(offset_size), read_int(length_size)))
+        if construction_method == 0:
+            locations[item_id] = (base_offset, extents)
+    return locations
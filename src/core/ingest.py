@@ -0,0 +1,354 @@
+"""
+图片解析模块
+提供可在子进程中执行的图片解析函数（尺寸、EXIF、缩略图），只返回普通数据，不访问数据库
+"""
+import hashlib
+import io
+import math
+from pathlib import Path
+from PIL import Image as PILImage
+from pillow_heif import register_heif_opener
+from src.core.exif_reader import parse_exif, read_exif, decode_exif, get_orientation
+
+# 让PIL支持HEIC/HEIF
+register_heif_opener()
+
+# 缩略图金字塔的各级尺寸（长边像素）
+# 入库时一次解码生成THUMBNAIL_EAGER_LEVELS中的各级，更大的级别在第一次使用时生成
+THUMBNAIL_LEVELS = (128, 256, 512)
+THUMBNAIL_EAGER_LEVELS = (128, 256)
+THUMBNAIL_BASE_LEVEL = 256  # 数据库记录的缩略图文件，感知哈希也由这一级计算
+
+# 缩略图两步缩放的余量：先整数倍快速缩小到目标的该倍数以上，再高质量重采样
+THUMBNAIL_REDUCING_GAP = 2.0
+
+# 缩略图来源：内嵌缩略图（快速首轮）或解码原图生成
+THUMBNAIL_SOURCE_EMBEDDED = 'embedded'
+THUMBNAIL_SOURCE_DECODED = 'decoded'
+
+# 缩略图生成逻辑的版本，修改级别尺寸、编码参数或方向处理时加一，旧版本的缩略图由后台重新生成
+# 2: 缩略图按EXIF方向（含镜像）转正后保存，显示时不再旋转
+THUMBNAIL_GENERATOR_VERSION = 2
+
+# EXIF方向值对应的转正操作（与ImageOps.exif_transpose相同），1为正常方向
+ORIENTATION_TRANSPOSE = {
+    2: PILImage.Transpose.FLIP_LEFT_RIGHT,
+    3: PILImage.Transpose.ROTATE_180,
+    4: PILImage.Transpose.FLIP_TOP_BOTTOM,
+    5: PILImage.Transpose.TRANSPOSE,
+    6: PILImage.Transpose.ROTATE_270,
+    7: PILImage.Transpose.TRANSVERSE,
+    8: PILImage.Transpose.ROTATE_90,
+}
+
+# 写入数据库时需要覆盖的EXIF字段（缺失的字段会被置空）
+EXIF_FIELDS = (
+    'date_taken', 'camera_make', 'camera_model', 'lens_model', 'focal_length',
+    'focal_length_35mm', 'aperture', 'shutter_speed', 'iso', 'gps_latitude',
+    'gps_longitude', 'gps_altitude', 'orientation', 'color_space', 'white_balance',
+    'metering_mode', 'exposure_program', 'flash'
+)
+
+# 内容指纹读取的首尾数据块大小
+CONTENT_HASH_BLOCK = 64 * 1024
+
+# pHash先缩小到32x32，取DCT左上角8x8的低频系数
+PHASH_SAMPLE_SIZE = 32
+HASH_SIZE = 8
+
+# 8x32的DCT系数表，只计算需要的低频部分
+_DCT_TABLE = [
+    [math.cos((2 * x + 1) * u * math.pi / (2 * PHASH_SAMPLE_SIZE)) for x in range(PHASH_SAMPLE_SIZE)]
+    for u in range(HASH_SIZE)
+]
+
+
+def partial_content_hash(image_path, file_size):
+    """内容指纹：文件大小 + 首尾数据块的哈希，只读取少量数据"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(file_size.to_bytes(8, 'little'))
+    with open(image_path, 'rb') as f:
+        digest.update(f.read(CONTENT_HASH_BLOCK))
+        if file_size > CONTENT_HASH_BLOCK:
+            f.seek(max(CONTENT_HASH_BLOCK, file_size - CONTENT_HASH_BLOCK))
+            digest.update(f.read(CONTENT_HASH_BLOCK))
+    return digest.hexdigest()
+
+
+def full_content_hash(image_path):
+    """完整内容哈希，只在内容指纹相同时用于确认"""
+    digest = hashlib.blake2b(digest_size=32)
+    with open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def ingest_image_file(image_path, file_stat=None, embedded_thumbnail=False, candidates=()):
+    """
+    先计算内容指纹，与已入库的同大小图片比较后再解析
+    candidates为已入库的同大小图片 (内容指纹, 图片ID, 路径, 完整哈希或None)
+    返回 (图片记录字典, {缩略图尺寸: JPEG字节}, 缩略图来源, 内容相同的已有图片ID, {图片ID: 本次算出的完整哈希})；
+    内容相同时不解码，记录只有文件字段，缩略图字节和来源为None
+    """
+    if file_stat is None:
+        file_stat = Path(image_path).stat()
+    content_hash = partial_content_hash(image_path, file_stat.st_size)
+    
+    full_hash = None
+    duplicate_of = None
+    computed = {}  # 指纹相同、之前没有完整哈希的已有图片，结果交给扫描线程补齐
+    for candidate_hash, image_id, candidate_path, candidate_full_hash in candidates:
+        if candidate_hash != content_hash:
+            continue
+        # 指纹相同，用完整哈希确认
+        if full_hash is None:
+            full_hash = full_content_hash(image_path)
+        if candidate_full_hash is None:
+            try:
+                candidate_full_hash = computed[image_id] = full_content_hash(candidate_path)
+            except OSError:
+                continue
+        if candidate_full_hash == full_hash and duplicate_of is None:
+            duplicate_of = image_id
+    
+    if duplicate_of is not None:
+        record = {
+            'file_path': image_path,
+            'file_name': Path(image_path).name,
+            'file_size': file_stat.st_size,
+            'file_mtime_ns': file_stat.st_mtime_ns,
+            'file_inode': file_stat.st_ino or None,
+            'content_hash': content_hash,
+            'full_hash': full_hash,
+        }
+        return record, None, None, duplicate_of, computed
+    
+    record, thumbnail_bytes, thumbnail_source = process_image_file(image_path, file_stat, embedded_thumbnail)
+    record['content_hash'] = content_hash
+    record['full_hash'] = full_hash
+    return record, thumbnail_bytes, thumbnail_source, None, computed
+
+
+def process_image_file(image_path, file_stat=None, embedded_thumbnail=False):
+    """
+    解析单张图片
+    文件只打开一次：尺寸、EXIF、方向和缩略图都来自同一个图片句柄
+    embedded_thumbnail为True时优先使用内嵌缩略图，不解码主图
+    返回 (图片记录字典, {缩略图尺寸: JPEG字节}, 缩略图来源)，可直接在进程池中执行
+    """
+    file_path = Path(image_path)
+    if file_stat is None:
+        file_stat = file_path.stat()
+    
+    with PILImage.open(image_path) as img:
+        # 基础信息只需要解析文件头
+        width, height = img.size
+        format_name = img.format or file_path.suffix.upper().lstrip('.')
+        
+        # EXIF来自已读取的文件头，按标签表解码
+        exif = load_exif(img, image_path)
+        exif_data = decode_exif(exif)
+        
+        orientation = get_orientation(exif)
+        thumbnail = None
+        thumbnail_source = THUMBNAIL_SOURCE_DECODED
+        if embedded_thumbnail:
+            thumbnail = extract_embedded_thumbnail(img, exif, orientation)
+            if thumbnail:
+                thumbnail_source = THUMBNAIL_SOURCE_EMBEDDED
+        
+        # 复用同一个解码器生成缩略图
+        if not thumbnail:
+            thumbnail = create_thumbnail(img, orientation)
+        thumbnail_bytes, hashes = thumbnail
+    
+    record = {
+        'file_path': image_path,
+        'file_name': file_path.name,
+        'file_size': file_stat.st_size,
+        'file_mtime_ns': file_stat.st_mtime_ns,
+        'file_inode': file_stat.st_ino or None,
+        'width': width,
+        'height': height,
+        'format': format_name,
+        'exif_orientation': orientation,
+    }
+    record.update({field: exif_data.get(field) for field in EXIF_FIELDS})
+    record.update(hashes)
+    
+    return record, thumbnail_bytes, thumbnail_source
+
+
+def thumbnail_fingerprint(file_size, file_mtime_ns):
+    """缩略图对应的原图指纹，原图变化后缩略图需要重新生成"""
+    return f"{file_size}:{file_mtime_ns}"
+
+
+def render_thumbnail(image_path, levels=THUMBNAIL_EAGER_LEVELS):
+    """解码原图重新生成缩略图各级，返回 {尺寸: JPEG字节}，用于替换首轮的内嵌缩略图或按需生成更大的级别"""
+    with PILImage.open(image_path) as img:
+        images = create_thumbnail_levels(img, get_orientation(load_exif(img, image_path)), levels)
+    return {size: encode_thumbnail(thumbnail) for size, thumbnail in images.items()}
+
+
+def scale_thumbnail(data, size):
+    """由已有的较大一级缩略图（JPEG字节）缩小得到指定尺寸，返回JPEG字节"""
+    with PILImage.open(io.BytesIO(data)) as img:
+        return encode_thumbnail(create_thumbnail_image(img, 1, size))
+
+
+def dhash(img):
+    """差异哈希：9x8灰度图中每行相邻像素的明暗关系"""
+    pixels = list(img.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), PILImage.Resampling.LANCZOS).getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def phash(img):
+    """感知哈希：32x32灰度图做二维DCT，低频8x8系数与中位数比较（不含直流分量）"""
+    size = PHASH_SAMPLE_SIZE
+    pixels = list(img.convert('L').resize((size, size), PILImage.Resampling.LANCZOS).getdata())
+    # 先对每行做DCT，再对列做DCT，都只保留前8个系数
+    rows = [
+        [sum(coef * pixel for coef, pixel in zip(table, pixels[y * size:(y + 1) * size])) for table in _DCT_TABLE]
+        for y in range(size)
+    ]
+    coefficients = [
+        sum(table[y] * rows[y][u] for y in range(size))
+        for table in _DCT_TABLE for u in range(HASH_SIZE)
+    ]
+    median = sorted(coefficients[1:])[(len(coefficients) - 1) // 2]
+    value = 0
+    for coefficient in coefficients:
+        value = (value << 1) | (coefficient > median)
+    return value
+
+
+def perceptual_hashes(img):
+    """计算缩略图的dHash和pHash，返回可直接写入图片记录的十六进制字符串"""
+    return {'dhash': f"{dhash(img):016x}", 'phash': f"{phash(img):016x}"}
+
+
+def thumbnail_hashes(data):
+    """从已保存的缩略图（JPEG字节）计算感知哈希，用于补齐旧记录，可在进程池中执行"""
+    with PILImage.open(io.BytesIO(data)) as img:
+        return perceptual_hashes(img)
+
+
+def thumbnail_dimensions(data):
+    """缩略图JPEG的实际宽高（只解析文件头，不解码）"""
+    with PILImage.open(io.BytesIO(data)) as img:
+        return img.size
+
+
+def load_exif(img, image_path):
+    """
+    读取EXIF，没有EXIF时返回None
+    JPEG/WebP/PNG/HEIC的EXIF段在打开图片时已随文件头读入info，直接解析；
+    TIFF等格式的EXIF位于IFD中，按偏移跳转读取，不读取图像数据
+    """
+    try:
+        exif_bytes = img.info.get('exif')
+        if exif_bytes:
+            return parse_exif(exif_bytes)
+        return read_exif(image_path)
+    except Exception as e:
+        print(f"EXIF解析错误: {e}")
+        return None
+
+
+def extract_embedded_thumbnail(img, exif, orientation=1):
+    """
+    提取内嵌缩略图（JPEG的EXIF IFD1或HEIF缩略图），不解码主图
+    返回 ({尺寸: 缩略图JPEG字节}, 感知哈希)，没有可用的内嵌缩略图时返回None
+    """
+    try:
+        if img.format == 'HEIF':
+            # pillow-heif通过draft选择内嵌缩略图，之后只解码缩略图
+            if img.draft(None, (1, 1)) is None:
+                return None
+            return create_thumbnail(img, orientation)
+        
+        thumbnail_data = exif.get('thumbnail') if exif else None
+        if not thumbnail_data:
+            return None
+        with PILImage.open(io.BytesIO(thumbnail_data)) as thumbnail:
+            return create_thumbnail(thumbnail, orientation)
+    except Exception as e:
+        print(f"读取内嵌缩略图失败: {e}")
+        return None
+
+
+def create_thumbnail_bytes(img, orientation=1, size=THUMBNAIL_BASE_LEVEL):
+    """使用已打开的图片创建单个尺寸的缩略图（按EXIF方向转正），返回JPEG字节"""
+    return encode_thumbnail(create_thumbnail_image(img, orientation, size))
+
+
+def create_thumbnail(img, orientation=1):
+    """
+    一次解码创建缩略图各级并顺便计算感知哈希，返回 ({尺寸: JPEG字节}, {'dhash', 'phash'})
+    哈希直接使用已缩小的基础级缩略图，不需要再次解码
+    """
+    images = create_thumbnail_levels(img, orientation)
+    levels = {size: encode_thumbnail(thumbnail) for size, thumbnail in images.items()}
+    return levels, perceptual_hashes(images[THUMBNAIL_BASE_LEVEL])
+
+
+def create_thumbnail_levels(img, orientation=1, levels=THUMBNAIL_EAGER_LEVELS):
+    """
+    一次解码生成多个尺寸的缩略图，返回 {尺寸: RGB图片}
+    只按最大的尺寸缩小解码，较小的各级由上一级继续缩小
+    """
+    sizes = sorted(levels, reverse=True)
+    current = create_thumbnail_image(img, orientation, sizes[0])
+    images = {sizes[0]: current}
+    for size in sizes[1:]:
+        current = current.copy()
+        current.thumbnail((size, size), PILImage.Resampling.LANCZOS)
+        images[size] = current
+    return images
+
+
+def create_thumbnail_image(img, orientation=1, size=THUMBNAIL_BASE_LEVEL):
+    """
+    使用已打开的图片创建长边不超过size的RGB缩略图，按EXIF方向值（1-8，含镜像）转正
+    先在低分辨率下解码/缩小，再做模式转换、转正和最终的LANCZOS重采样
+    """
+    # 异常按原类型抛出：扫描线程按异常类型区分文件本身损坏和网络存储、内存不足等暂时性错误
+    box = (size, size)
+    
+    # 调色板/位图模式缩放时只能使用最近邻，需要先转换（JPEG只有L/RGB/CMYK，不会在这里提前解码）
+    if img.mode in ('P', '1'):
+        img = img.convert('RGBA' if img.mode == 'P' else 'L')
+    elif img.mode not in ('RGB', 'RGBA', 'L', 'LA', 'CMYK'):
+        img = img.convert('RGB')
+    
+    # thumbnail按保持宽高比后的尺寸调用draft：JPEG在DCT域按1/2、1/4、1/8直接缩小解码，
+    # 其他格式用reduce按整数倍缩小，都保留至少reducing_gap倍的余量，最后一步用LANCZOS保证质量
+    img.thumbnail(box, PILImage.Resampling.LANCZOS, reducing_gap=THUMBNAIL_REDUCING_GAP)
+    
+    # 转换为RGB模式（处理RGBA等模式）
+    if img.mode in ('RGBA', 'LA'):
+        background = PILImage.new('RGB', img.size, (255, 255, 255))
+        background.paste(img, mask=img.split()[-1])
+        img = background
+    elif img.mode != 'RGB':
+        img = img.convert('RGB')
+    
+    # 按EXIF方向转正（转置是无损的像素重排，在缩小后进行）
+    transpose = ORIENTATION_TRANSPOSE.get(orientation)
+    if transpose is not None:
+        img = img.transpose(transpose)
+    return img
+
+
+def encode_thumbnail(img):
+    """把缩略图编码为JPEG字节"""
+    buffer = io.BytesIO()
+    img.save(buffer, 'JPEG', quality=85)
+    return buffer.getvalue()
@@ -6,11 +6,11 @@
 import os
 import logging
 from pathlib import Path
-from sqlalchemy import inspect
+from sqlalchemy import inspect, text
 from sqlalchemy.exc import SQLAlchemyError
 
 from src.core.database import engine, Base
-from src.models import Directory, Image, Album, Thumbnail
+from src.models import Directory, Image, Album, Thumbnail, ScanJob, ScanFailure, ThumbnailBlob
 
 logger = logging.getLogger(__name__)
 
@@ -41,6 +41,9 @@ class DatabaseInitializer:
             # 创建所有表
             Base.metadata.create_all(bind=engine)
             
+            # 为旧数据库补齐新增的列和索引
+            DatabaseInitializer.upgrade_schema()
+            
             # 验证表是否创建成功
             inspector = inspect(engine)
             tables = inspector.get_table_names()
@@ -62,6 +65,29 @@ class DatabaseInitializer:
             logger.error(f"数据库初始化时发生未知错误: {e}")
             return False
     
+    @staticmethod
+    def upgrade_schema():
+        """
+        升级已存在的表结构
+        create_all不会修改已存在的表，这里为旧表补齐模型中新增的列和索引
+        """
+        inspector = inspect(engine)
+        with engine.begin() as conn:
+            for table in Base.metadata.sorted_tables:
+                if not inspector.has_table(table.name):
+                    continue
+                
+                existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in existing_columns:
+                        continue
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    logger.info(f"为表 {table.name} 添加列: {column.name} {column_type}")
+                    conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+                
+                for index in table.indexes:
+                    index.create(bind=conn, checkfirst=True)
+    
     @staticmethod
     def check_database_health():
         """
@@ -0,0 +1,146 @@
+"""
+失败文件隔离模块
+记录解析失败的文件及其指纹（路径+大小+修改时间），文件没有变化时之后的扫描直接跳过，不再打开；
+文件被替换或修改、或者用户请求重试时才重新处理
+"""
+import errno
+import os
+from concurrent.futures import BrokenExecutor
+from datetime import datetime
+from sqlalchemy import and_, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import SQLAlchemyError
+from src.models.directory import Directory
+from src.models.scan_failure import ScanFailure
+
+# 环境导致的失败不隔离，下次扫描照常重试：扫描中文件被删除、暂时没有权限、数据库暂时不可用、
+# 解析进程崩溃（进程池损坏时所有进行中的任务都会失败）、内存不足、网络存储超时
+TRANSIENT_ERRORS = (FileNotFoundError, PermissionError, SQLAlchemyError, BrokenExecutor, MemoryError, TimeoutError)
+
+# 网络挂载（NAS）上常见的暂时性IO错误
+TRANSIENT_ERRNOS = {errno.EIO, errno.ESTALE, errno.ETIMEDOUT}
+
+
+def is_quarantinable(error):
+    """解析失败是否由文件本身导致，需要隔离；包装过的异常沿 __cause__/__context__ 检查原始异常"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, TRANSIENT_ERRORS):
+            return False
+        if isinstance(error, OSError) and error.errno in TRANSIENT_ERRNOS:
+            return False
+        error = error.__cause__ or error.__context__
+    return True
+
+
+class FailureStore:
+    """扫描线程使用的隔离记录读写，失败和恢复的文件先缓冲，按批写入"""
+
+    def __init__(self, Session, batch_size=200):
+        self.Session = Session
+        self.batch_size = batch_size
+        self._failed = {}  # 路径 -> 待写入的记录
+        self._resolved = set()  # 已恢复（处理成功或已删除）的路径
+
+    def load(self, directory_path, recursive=True):
+        """加载目录下隔离中的文件 {路径: (大小, 修改时间)}，等待重试的文件不返回"""
+        session = self.Session()
+        try:
+            prefix = os.path.join(os.path.normpath(directory_path), '')
+            condition = and_(
+                ScanFailure.file_path.startswith(prefix, autoescape=True),
+                ScanFailure.file_size.isnot(None)
+            )
+            if not recursive:
+                condition = and_(condition,
+                                 func.instr(func.substr(ScanFailure.file_path, len(prefix) + 1), os.sep) == 0)
+            rows = session.query(ScanFailure.file_path, ScanFailure.file_size, ScanFailure.file_mtime_ns).filter(
+                condition
+            ).all()
+            return {row.file_path: (row.file_size, row.file_mtime_ns) for row in rows}
+        finally:
+            session.close()
+
+    def add(self, directory_id, image_path, file_stat, error):
+        """记录一次解析失败"""
+        self._resolved.discard(image_path)
+        self._failed[image_path] = {
+            'directory_id': directory_id,
+            'file_path': image_path,
+            'file_size': file_stat.st_size,
+            'file_mtime_ns': file_stat.st_mtime_ns,
+            'error_type': type(error).__name__,
+            'error_message': str(error),
+            'last_failed_at': datetime.now()
+        }
+        if len(self._failed) >= self.batch_size:
+            self.flush()
+
+    def resolve(self, paths):
+        """文件已处理成功或已从磁盘删除，移出隔离区"""
+        for path in paths:
+            self._failed.pop(path, None)
+            self._resolved.add(path)
+        if len(self._resolved) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """在一个事务中写入缓冲的失败和恢复记录"""
+        failed, self._failed = list(self._failed.values()), {}
+        resolved, self._resolved = list(self._resolved), set()
+        if not failed and not resolved:
+            return
+        session = self.Session()
+        try:
+            if failed:
+                stmt = sqlite_insert(ScanFailure)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[ScanFailure.file_path],
+                    set_={
+                        'directory_id': stmt.excluded.directory_id,
+                        'file_size': stmt.excluded.file_size,
+                        'file_mtime_ns': stmt.excluded.file_mtime_ns,
+                        'error_type': stmt.excluded.error_type,
+                        'error_message': stmt.excluded.error_message,
+                        'attempts': ScanFailure.attempts + 1,
+                        'last_failed_at': stmt.excluded.last_failed_at
+                    }
+                )
+                session.connection().execute(stmt, failed)
+            for start in range(0, len(resolved), 500):
+                session.query(ScanFailure).filter(
+                    ScanFailure.file_path.in_(resolved[start:start + 500])
+                ).delete(synchronize_session=False)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"保存失败文件记录失败: {e}")
+        finally:
+            session.close()
+
+
+def list_failures(session, directory_id=None):
+    """列出隔离的文件，最近失败的在前"""
+    query = session.query(ScanFailure)
+    if directory_id is not None:
+        query = query.filter(ScanFailure.directory_id == directory_id)
+    return query.order_by(ScanFailure.last_failed_at.desc()).all()
+
+
+def retry_failures(session, failure_ids=None, directory_id=None):
+    """
+    清除隔离文件的指纹，下次扫描时重新处理（再次失败时累加失败次数）
+    failure_ids和directory_id都为None时重试全部，返回需要重新扫描的注册目录路径
+    """
+    query = session.query(ScanFailure)
+    if failure_ids is not None:
+        query = query.filter(ScanFailure.id.in_(failure_ids))
+    if directory_id is not None:
+        query = query.filter(ScanFailure.directory_id == directory_id)
+    directory_ids = {row.directory_id for row in query.with_entities(ScanFailure.directory_id).distinct()}
+    query.update({'file_size': None, 'file_mtime_ns': None}, synchronize_session=False)
+    session.commit()
+    if not directory_ids:
+        return []
+    return [row.path for row in session.query(Directory.path).filter(Directory.id.in_(directory_ids))]
@@ -0,0 +1,141 @@
+"""
+扫描任务模块
+记录每个目录扫描任务的状态和检查点，程序退出或中断后从检查点继续扫描
+"""
+from collections import deque
+from datetime import datetime
+from sqlalchemy import update
+from src.models.scan_job import ScanJob
+
+# 任务状态
+JOB_RUNNING = 'running'
+JOB_PAUSED = 'paused'
+JOB_INTERRUPTED = 'interrupted'  # 程序退出等原因中断，下次启动时继续
+JOB_CANCELLED = 'cancelled'  # 用户取消，不再继续
+JOB_COMPLETED = 'completed'
+
+# 下次扫描时可以继续的状态（running表示上次异常退出）
+RESUMABLE_STATUSES = (JOB_RUNNING, JOB_PAUSED, JOB_INTERRUPTED)
+
+
+class CheckpointTracker:
+    """
+    按遍历顺序跟踪文件的处理状态，计算检查点
+    解析结果按完成顺序返回、写入先进入缓冲，所以检查点是遍历顺序中
+    之前所有文件都已写入数据库（或已跳过、已失败）的最后一个文件
+    """
+
+    def __init__(self, cursor=None, files_seen=0, files_written=0, files_failed=0):
+        self.cursor = cursor
+        self.files_seen = files_seen
+        self.files_written = files_written
+        self.files_failed = files_failed
+        self._order = deque()  # (序号, 路径)
+        self._outstanding = set()  # 解析中或等待写入的序号
+        self._buffered = set()  # 已交给写入器、尚未提交的序号
+        self._next_seq = 0
+        self._saved = (cursor, files_seen, files_written, files_failed)
+
+    def walked(self, path, needs_processing):
+        """遍历到一个文件，返回其序号"""
+        seq = self._next_seq
+        self._next_seq += 1
+        self._order.append((seq, path))
+        if needs_processing:
+            self._outstanding.add(seq)
+        return seq
+
+    def buffered(self, seq):
+        """解析结果已交给写入器"""
+        self._buffered.add(seq)
+
+    def failed(self, seq):
+        """解析失败，不会再写入"""
+        self._outstanding.discard(seq)
+        self.files_failed += 1
+
+    def flushed(self):
+        """写入器缓冲已全部提交"""
+        self._outstanding.difference_update(self._buffered)
+        self.files_written += len(self._buffered)
+        self._buffered.clear()
+
+    def advance(self):
+        """推进检查点，返回检查点是否有变化（需要保存）"""
+        while self._order and self._order[0][0] not in self._outstanding:
+            _, self.cursor = self._order.popleft()
+            self.files_seen += 1
+        return (self.cursor, self.files_seen, self.files_written, self.files_failed) != self._saved
+
+    def mark_saved(self):
+        """记录已保存的检查点"""
+        self._saved = (self.cursor, self.files_seen, self.files_written, self.files_failed)
+
+
+class ScanJobStore:
+    """扫描任务的数据库读写"""
+
+    def __init__(self, Session):
+        self.Session = Session
+
+    def start(self, directory_id, incremental):
+        """
+        开始目录扫描任务：存在同类型未完成的任务时继续该任务，否则新建
+        返回 (任务ID, 检查点跟踪器)
+        """
+        session = self.Session()
+        try:
+            unfinished = session.query(ScanJob).filter(
+                ScanJob.directory_id == directory_id,
+                ScanJob.status.in_(RESUMABLE_STATUSES)
+            ).order_by(ScanJob.id.desc()).all()
+
+            job = None
+            for candidate in unfinished:
+                if job is None and bool(candidate.incremental) == bool(incremental):
+                    job = candidate
+                else:
+                    # 类型不同或更早的未完成任务不再继续
+                    candidate.status = JOB_CANCELLED
+                    candidate.finished_at = datetime.now()
+
+            if job is None:
+                job = ScanJob(directory_id=directory_id, incremental=incremental, status=JOB_RUNNING)
+                session.add(job)
+            else:
+                job.status = JOB_RUNNING
+            session.commit()
+
+            tracker = CheckpointTracker(job.cursor, job.files_seen or 0, job.files_written or 0,
+                                        job.files_failed or 0)
+            return job.id, tracker
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+    def save(self, job_id, tracker, status=None):
+        """保存检查点，可同时更新状态"""
+        values = {
+            'cursor': tracker.cursor,
+            'files_seen': tracker.files_seen,
+            'files_written': tracker.files_written,
+            'files_failed': tracker.files_failed,
+            'updated_at': datetime.now()
+        }
+        if status:
+            values['status'] = status
+            if status in (JOB_COMPLETED, JOB_CANCELLED):
+                values['finished_at'] = datetime.now()
+
+        session = self.Session()
+        try:
+            session.execute(update(ScanJob).where(ScanJob.id == job_id).values(**values))
+            session.commit()
+            tracker.mark_saved()
+        except Exception as e:
+            session.rollback()
+            print(f"保存扫描检查点失败: {e}")
+        finally:
+            session.close()
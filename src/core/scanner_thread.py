@@ -2,74 +2,925 @@
 图片扫描线程模块
 """
 import os
+import time
 import threading
-from pathlib import Path
-from PIL import Image as PILImage
+import multiprocessing
+from collections import deque, namedtuple
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 from PySide6.QtCore import QObject, Signal, QThread
+from datetime import datetime
+from sqlalchemy import String, and_, case, cast, delete, func, or_, update
 from sqlalchemy.orm import sessionmaker
 from src.core.database import engine
+from src.core.batch_writer import BatchWriter, remove_unreferenced_thumbnails
+from src.core.ingest import (ingest_image_file, full_content_hash, process_image_file, render_thumbnail,
+                             thumbnail_hashes,
+                             thumbnail_fingerprint, EXIF_FIELDS, THUMBNAIL_BASE_LEVEL,
+                             THUMBNAIL_GENERATOR_VERSION, THUMBNAIL_SOURCE_EMBEDDED)
+from src.core.thumbnails import compact_thumbnails, load_thumbnail, thumbnails_missing_levels
+from src.core.walker import stream_image_files, count_image_files, walk_key, ScanTotals
+from src.core.scheduler import ScanScheduler, path_matcher
+from src.core.throttle import IOThrottle, lower_priority
+from src.core.quarantine import FailureStore, is_quarantinable
+from src.core.scan_jobs import ScanJobStore, JOB_RUNNING, JOB_PAUSED, JOB_INTERRUPTED, JOB_CANCELLED, JOB_COMPLETED
+from src.models.album import album_images
 from src.models.image import Image
 from src.models.thumbnail import Thumbnail
 from src.models.directory import Directory
-import hashlib
-import piexif
-from datetime import datetime
+
+# 增量扫描使用的文件指纹
+FileFingerprint = namedtuple('FileFingerprint', ['image_id', 'directory_id', 'file_size', 'mtime_ns', 'inode'])
+
 
 class ImageScannerThread(QThread):
     """后台图片扫描线程"""
     
+    MAX_REPORTED_FAILURES = 1000  # 失败汇总中最多保留的文件数
+    
     progress_updated = Signal(int, int)  # 当前进度, 总数
     scan_completed = Signal(int)  # 扫描完成的图片数量
-    scan_error = Signal(str)  # 扫描错误信息
+    scan_error = Signal(str)  # 扫描错误信息（单个文件的失败通过scan_failures汇总）
+    scan_failures = Signal(list, int)  # 处理失败的文件汇总: [(路径, 错误信息)]（最多MAX_REPORTED_FAILURES条）, 本次汇总的失败数
+    scan_stats = Signal(dict)  # 扫描统计信息，含新增/更新/未变化/失败计数（在scan_completed之前发出）
+    thumbnails_refined = Signal(int, int)  # 内嵌缩略图替换进度: 当前进度, 总数
+    thumbnails_updated = Signal(list)  # 缩略图已重新生成并写入数据库的图片ID（界面刷新显示中的旧缩略图）
+    scan_paused = Signal(bool)  # 已暂停 / 已恢复
+    directory_indexed = Signal(str)  # 优先扫描的目录有新记录写入（扫描中会多次发出）
+    rates_updated = Signal(float, float, bool)  # 实际速度: 文件/秒, 字节/秒, 是否限速中
+    files_unsettled = Signal(list)  # 同步目录变化时仍在写入、本次没有处理的文件所在的目录
     
-    def __init__(self, directories):
+    def __init__(self, directories, incremental=True, workers=None, batch_size=200, batch_interval_ms=500,
+                 embedded_thumbnails=False, changed_directories=None, throttle=None, low_priority=False,
+                 progress_interval_ms=100, thumbnails_only=False, settle_ms=2000):
         super().__init__()
         self.directories = directories
-        self.thumbnail_dir = Path("thumbnails")
-        self.thumbnail_dir.mkdir(exist_ok=True)
+        self.incremental = incremental  # 增量模式：跳过大小/修改时间未变化的文件
+        self.workers = workers or os.cpu_count() or 1  # 解析进程数，1表示在扫描线程内处理
+        self.batch_size = batch_size  # 每个事务写入的最大记录数
+        self.batch_interval_ms = batch_interval_ms  # 缓冲记录的最长等待时间
+        self.embedded_thumbnails = embedded_thumbnails  # 首轮使用内嵌缩略图，扫描完成后再替换为高质量缩略图
+        self.changed_directories = changed_directories  # [(子目录, 是否递归)]，只同步这些位置（文件监视器使用）
+        self.throttle = throttle or IOThrottle()  # 限速器，默认不限速
+        self.low_priority = low_priority  # 降低扫描线程和解析进程的CPU/IO优先级
+        self.progress_interval = progress_interval_ms / 1000.0  # 进度信号的最短间隔，避免界面线程处理大量排队的信号
+        self.thumbnails_only = thumbnails_only  # 不遍历文件，只为缺少缩略图或仍是内嵌缩略图的图片重新生成
+        # 修改时间在这个时间以内的文件可能仍在复制或写入：解析失败时不隔离，同步目录变化时推迟处理
+        self.settle_ns = settle_ms * 1_000_000
+        self._unsettled = set()
+        self._rates_emitted = 0.0
+        self._progress_emitted = 0.0
+        self._failures = []  # 尚未发出的失败文件 [(路径, 错误信息)]
+        self._failure_count = 0
+        self._reported_failures = 0  # 已经汇总发出的失败数
+        self.skipped_images = 0
+        self.quarantined_images = 0
+        self._quarantine = None
+        self._executor = None
+        self._stop_event = threading.Event()
+        self._resume_event = threading.Event()  # 未设置时表示暂停
+        self._resume_event.set()
+        self._cancelled = False
+        self._jobs = None
+        self._Session = None
+        self._writer = None
+        self._flush_if_due = None
+        self._job = None  # 当前目录的 (任务ID, 检查点跟踪器)
+        self._last_checkpoint = 0.0
+        self.checkpoint_interval = 2.0  # 保存检查点的最短间隔（秒）
+        self._scheduler = ScanScheduler()
+        self._roots = []  # 注册目录 (路径, ID)，按路径长度降序
+        self._prioritized = []  # 已优先扫描完成的目录，常规遍历时跳过
+        self._in_priority_scan = False
         
         # 支持的图片格式
         self.supported_formats = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', 
                                 '.tiff', '.tif', '.webp', '.ico', '.heic', '.heif'}
         
+    def stop(self):
+        """请求停止扫描（当前正在处理的图片完成后退出），下次扫描时从检查点继续"""
+        self._stop_event.set()
+        self._resume_event.set()
+    
+    def cancel(self):
+        """取消扫描，下次扫描时不再继续本次任务"""
+        self._cancelled = True
+        self.stop()
+    
+    def is_stopped(self):
+        """是否已请求停止"""
+        return self._stop_event.is_set()
+    
+    def set_throttled(self, throttled):
+        """开启或关闭限速，可在界面线程随时调用"""
+        self.throttle.set_enabled(throttled)
+    
+    def _emit_rates(self, force=False):
+        """每秒最多发出一次实际处理速度"""
+        now = time.monotonic()
+        if force or now - self._rates_emitted >= 1.0:
+            self._rates_emitted = now
+            files_per_second, bytes_per_second = self.throttle.rates()
+            self.rates_updated.emit(files_per_second, bytes_per_second, self.throttle.enabled)
+    
+    def prioritize(self, paths):
+        """请求优先处理目录（整棵子树）或图片（内嵌缩略图替换），可在界面线程调用"""
+        self._scheduler.request(paths)
+    
+    def pause(self):
+        """暂停扫描，已提交的图片处理完成后等待"""
+        if not self.is_stopped():
+            self._resume_event.clear()
+    
+    def resume(self):
+        """恢复暂停的扫描"""
+        self._resume_event.set()
+    
+    def is_paused(self):
+        """是否处于暂停状态"""
+        return not self._resume_event.is_set()
+    
+    def _wait_while_paused(self):
+        """暂停时写入缓冲的记录、保存检查点，然后等待恢复或停止"""
+        if not self.is_paused():
+            return
+        self._checkpoint(force=True, status=JOB_PAUSED)
+        self.scan_paused.emit(True)
+        while not self._resume_event.wait(0.2):
+            pass
+        if not self.is_stopped():
+            self._checkpoint(force=True, status=JOB_RUNNING)
+        self.scan_paused.emit(False)
+    
+    def _checkpoint(self, force=False, status=None):
+        """推进当前目录任务的检查点，按间隔保存到数据库；force时先写入缓冲的记录"""
+        if self._job is None:
+            return
+        job_id, tracker = self._job
+        if force and self._writer is not None:
+            self._report_write_failures(self._writer.flush())
+        if not self._writer.pending:
+            tracker.flushed()
+        changed = tracker.advance()
+        now = time.monotonic()
+        if status or (changed and now - self._last_checkpoint >= self.checkpoint_interval):
+            self._jobs.save(job_id, tracker, status)
+            self._last_checkpoint = now
+        
     def run(self):
-        """线程运行入口"""
+        """线程运行入口：流式遍历目录 → 进程池解析 → 本线程统一写入数据库"""
         try:
-            total_images = 0
-            processed_images = 0
+            if self.low_priority:
+                # 之后创建的遍历线程和解析进程继承本线程的优先级
+                lower_priority(threading.get_native_id())
+            started = time.perf_counter()
+            self.processed_images = 0
+            self.removed_images = 0
+            self.skipped_images = 0
+            self.quarantined_images = 0
+            self._failure_count = 0
+            self._reported_failures = 0
+            self._totals = ScanTotals()
             
             # 创建数据库会话
             Session = sessionmaker(bind=engine)
+            writer = BatchWriter(Session, self.batch_size, self.batch_interval_ms)
+            flush_if_due = lambda: self._report_write_failures(writer.flush_if_due())
+            self._writer = writer
+            self._Session = Session
+            self._flush_if_due = flush_if_due
+            self._jobs = ScanJobStore(Session)
+            self._quarantine = FailureStore(Session, self.batch_size)
             
-            for directory_path in self.directories:
-                if not os.path.exists(directory_path):
-                    continue
-                
-                # 获取或创建目录记录
-                directory_id = self._get_directory_id(directory_path, Session)
-                if not directory_id:
-                    continue
+            if self.thumbnails_only:
+                self._repair_thumbnails(writer, Session, flush_if_due)
+                self._compact_thumbnails(Session)
+                self.scan_stats.emit(self._collect_stats(writer, started))
+                self.scan_completed.emit(self.processed_images)
+                return
+            
+            if self.changed_directories is not None:
+                self._unsettled = set()
+                scanned_directory_ids = self._scan_changed_directories(writer, flush_if_due, Session)
+                if self._unsettled:
+                    self.files_unsettled.emit(sorted(self._unsettled))
+            else:
+                scanned_directory_ids = self._scan_directories(writer, flush_if_due, Session)
+            
+            # 最后一次进度和失败汇总
+            self._advance_progress(0, force=True)
+            self._emit_failures()
+            
+            self.scan_stats.emit(self._collect_stats(writer, started))
+            self.scan_completed.emit(self.processed_images)
+            
+            # 同一批处理的副本彼此看不到对方的记录，扫描后补齐完整哈希并合并缩略图
+            if not self.is_stopped():
+                self._resolve_pending_duplicates(Session)
+            
+            # 旧记录没有感知哈希，从已有的缩略图补齐
+            if not self.is_stopped():
+                self._backfill_perceptual_hashes(scanned_directory_ids, Session)
+            
+            # 图片列表已可用，再用低优先级的第二轮替换内嵌缩略图和生成器版本过期的缩略图
+            if not self.is_stopped():
+                self._refine_thumbnails(scanned_directory_ids, writer, Session, flush_if_due)
+            
+            # 被替换的缩略图（重新扫描、内嵌缩略图的第二轮替换）在段文件中留下无效数据
+            if not self.is_stopped():
+                self._compact_thumbnails(Session)
+            
+        except Exception as e:
+            self.scan_error.emit(f"扫描线程错误: {str(e)}")
+        finally:
+            self._emit_failures()
+            self._shutdown_executor()
+    
+    def _compact_thumbnails(self, Session):
+        """压缩整理无效数据较多的缩略图段文件"""
+        try:
+            compact_thumbnails(Session)
+        except Exception as e:
+            print(f"压缩整理缩略图失败: {e}")
+    
+    def _collect_stats(self, writer, started):
+        """汇总写入统计和本次扫描的计数"""
+        stats = dict(writer.stats)
+        stats.update({
+            'workers': self.workers,
+            'total': self._totals.total(),
+            'processed': self.processed_images,
+            'new': writer.stats['inserted'],
+            'updated': writer.stats['updated'],
+            'skipped': self.skipped_images,
+            'failed': self._failure_count,
+            'quarantined': self.quarantined_images,
+            'removed': self.removed_images,
+            'elapsed_seconds': round(time.perf_counter() - started, 3)
+        })
+        return stats
+    
+    def _scan_directories(self, writer, flush_if_due, Session):
+        """完整扫描所有注册目录，返回已扫描的目录ID"""
+        scanned_directory_ids = []
+        
+        # 先确定所有目录，让进度总数从一开始就覆盖全部目录
+        targets = self._resolve_directories(Session)
+        
+        for directory_path, directory_id in targets:
+            self._run_priority_scans()
+            if self.is_stopped():
+                break
+            scanned_directory_ids.append(directory_id)
+            
+            # 存在未完成的任务时从检查点继续，之前的文件计入进度
+            job_id, tracker = self._jobs.start(directory_id, self.incremental)
+            self._job = (job_id, tracker)
+            resume_from = tracker.cursor
+            if resume_from:
+                self.processed_images += tracker.files_seen
+                self._totals.add_walked(directory_id, tracker.files_seen)
+            
+            # 一次性加载该目录下已入库图片的指纹
+            fingerprints = self._load_fingerprints(directory_path, Session, directory_id=directory_id)
+            seen_paths = self._sync_directory(directory_id, directory_path, directory_id, fingerprints,
+                                              writer, flush_if_due, Session, start_after=resume_from)
+            self._checkpoint(force=True)
+            self._job = None
+            if self.is_stopped():
+                self._jobs.save(job_id, tracker, JOB_CANCELLED if self._cancelled else JOB_INTERRUPTED)
+                break
+            self._jobs.save(job_id, tracker, JOB_COMPLETED)
+            
+            self._totals.finish(directory_id)
+            self._save_directory_count(directory_id, tracker.files_seen, Session)
+            
+            # 清理磁盘上已不存在的图片（检查点之前的部分本次没有遍历，留到下次完整扫描）
+            resume_key = walk_key(directory_path, resume_from) if resume_from else None
+            missing_ids = [fp.image_id for path, fp in fingerprints.items()
+                           if path not in seen_paths and fp.directory_id == directory_id
+                           and not (resume_key and path.startswith(os.path.join(directory_path, ''))
+                                    and walk_key(directory_path, path) <= resume_key)]
+            if missing_ids:
+                self._prune_images(missing_ids, Session)
+        
+        return scanned_directory_ids
+    
+    def _scan_changed_directories(self, writer, flush_if_due, Session):
+        """
+        只同步发生变化的子目录（来自文件监视器），返回涉及的注册目录ID
+        非递归项只比较该目录下的文件，递归项（新建、删除或移动的目录）比较整棵子树
+        """
+        roots = []
+        for directory_path in self.directories:
+            directory_id, _ = self._get_directory_id(directory_path, Session)
+            if directory_id:
+                roots.append((directory_path, directory_id))
+        self._set_roots(roots)
+        
+        scanned_directory_ids = set()
+        for changed_path, recursive in self.changed_directories:
+            if self.is_stopped():
+                break
+            changed_path = os.path.normpath(changed_path)
+            owner = self._owner_directory(changed_path)
+            # 注册目录本身不可访问时（如网络盘断开）不做任何清理
+            if owner is None or not os.path.isdir(owner[0]):
+                continue
+            root_path, directory_id = owner
+            scanned_directory_ids.add(directory_id)
+            
+            fingerprints = self._load_fingerprints(changed_path, Session, recursive=recursive)
+            seen_paths = self._sync_directory(directory_id, changed_path, changed_path, fingerprints,
+                                              writer, flush_if_due, Session, recursive=recursive)
+            if self.is_stopped():
+                break
+            self._totals.finish(changed_path)
+            
+            missing_ids = [fp.image_id for path, fp in fingerprints.items() if path not in seen_paths]
+            if missing_ids:
+                self._prune_images(missing_ids, Session)
+        
+        return list(scanned_directory_ids)
+    
+    def _set_roots(self, roots):
+        """记录注册目录，嵌套注册时图片归属到最深的目录"""
+        self._roots = sorted(((os.path.normpath(path), directory_id) for path, directory_id in roots),
+                             key=lambda root: len(root[0]), reverse=True)
+    
+    def _owner_directory(self, path):
+        """返回路径所属的注册目录 (路径, ID)，不属于任何注册目录时返回None"""
+        return next((root for root in self._roots
+                     if path == root[0] or path.startswith(os.path.join(root[0], ''))), None)
+    
+    def _is_prioritized(self, image_path):
+        """图片是否位于已优先扫描完成的目录中"""
+        return bool(self._prioritized) and image_path.startswith(tuple(self._prioritized))
+    
+    def _run_priority_scans(self):
+        """
+        处理界面请求的优先目录：立即完整同步该子树，常规遍历之后经过时直接跳过
+        在常规遍历的文件之间调用，当前目录任务的检查点不受影响
+        """
+        if self._in_priority_scan or not self._scheduler.has_requests():
+            return
+        self._in_priority_scan = True
+        saved_job, self._job = self._job, None
+        try:
+            while not self.is_stopped():
+                request = self._scheduler.pop()
+                if request is None:
+                    break
+                for path in request:
+                    if self.is_stopped():
+                        break
+                    owner = self._owner_directory(path)
+                    # 图片文件的请求用于缩略图替换；已经同步过的目录不重复处理
+                    if owner is None or not os.path.isdir(path) or self._is_prioritized(os.path.join(path, '')):
+                        continue
                     
-                # 扫描目录中的所有图片
-                images = self._scan_directory(directory_path)
-                total_images += len(images)
-                
-                # 处理每张图片
-                for image_path in images:
+                    fingerprints = self._load_fingerprints(path, self._Session)
+                    seen_paths = self._sync_directory(owner[1], path, None, fingerprints,
+                                                      self._writer, self._flush_if_due, self._Session)
+                    if self.is_stopped():
+                        break
+                    self._prioritized.append(os.path.join(path, ''))
+                    
+                    missing_ids = [fp.image_id for image_path, fp in fingerprints.items()
+                                   if image_path not in seen_paths]
+                    if missing_ids:
+                        self._prune_images(missing_ids, self._Session)
+                    self.directory_indexed.emit(path)
+        finally:
+            self._job = saved_job
+            self._in_priority_scan = False
+    
+    def _sync_directory(self, directory_id, directory_path, totals_key, fingerprints, writer, flush_if_due,
+                        Session, recursive=True, start_after=None):
+        """
+        遍历目录，解析新增和变化的图片并批量写入，返回磁盘上发现的图片路径集合
+        totals_key为None表示优先扫描，不计入进度
+        """
+        seen_paths = set()
+        backfills = []
+        quarantined = self._quarantine.load(directory_path, recursive)
+        tasks = self._iter_scan_tasks(directory_id, directory_path, totals_key, fingerprints, quarantined,
+                                      seen_paths, backfills, recursive, start_after, Session)
+        tracker = self._job[1] if self._job else None
+
+        # 解析结果按完成顺序返回，由本线程批量写入数据库
+        for (image_path, image_id, seq, file_stat), result, error in self._run_tasks(ingest_image_file, tasks,
+                                                                                     on_idle=flush_if_due):
+            if error is None:
+                # 比较指纹时读取过的已有图片，补齐其完整哈希
+                backfills.extend({'id': candidate_id, 'full_hash': full_hash}
+                                 for candidate_id, full_hash in result[4].items())
+                if result[3] is not None:
+                    # 与已入库的图片内容相同：复用其EXIF和缩略图，不再解码
                     try:
-                        self._process_image(image_path, directory_id, Session)
-                        processed_images += 1
-                        self.progress_updated.emit(processed_images, total_images)
+                        result = self._reuse_duplicate(result[0], result[3], file_stat, Session)
                     except Exception as e:
-                        self.scan_error.emit(f"处理图片失败 {image_path}: {str(e)}")
+                        error = e
+            if error is not None and is_quarantinable(error) and self._is_settled(image_path, file_stat):
+                # 文件本身无法解析，隔离到文件发生变化为止（仍在写入的文件下次照常重试）
+                self._quarantine.add(directory_id, image_path, file_stat, error)
+            if error is not None:
+                self._record_failure(image_path, f"处理图片失败: {error}")
+                if tracker:
+                    tracker.failed(seq)
+                if totals_key is not None:
+                    self._advance_progress()
+                continue
+            values, thumbnail_bytes, thumbnail_source, shared_thumbnail = result[:4]
+            if image_path in quarantined:
+                self._quarantine.resolve([image_path])
+            self.throttle.record(values.get('file_size') or 0)
+            if tracker:
+                tracker.buffered(seq)
+            self._report_write_failures(
+                writer.add(values, thumbnail_bytes, directory_id, image_id, thumbnail_source, shared_thumbnail)
+            )
+            if totals_key is not None:
+                self._advance_progress()
+            elif not writer.pending:
+                # 优先扫描的记录已提交，通知界面刷新
+                self.directory_indexed.emit(directory_path)
+            self._checkpoint()
+            self._wait_while_paused()
+        self._report_write_failures(writer.flush())
+        
+        # 已从磁盘删除的隔离文件（从检查点继续或中途停止时本次没有遍历全部文件，留到下次）
+        if start_after is None and not self.is_stopped():
+            self._quarantine.resolve([path for path in quarantined if path not in seen_paths])
+        self._quarantine.flush()
+        
+        if backfills:
+            self._backfill_fingerprints(backfills, Session)
+        return seen_paths
+    
+    def _is_settled(self, image_path, file_stat):
+        """文件是否已经写完：修改时间早于等待时间，且解析前后大小和修改时间没有变化"""
+        if time.time_ns() - file_stat.st_mtime_ns < self.settle_ns:
+            return False
+        try:
+            current = os.stat(image_path)
+        except OSError:
+            return False
+        return (current.st_size, current.st_mtime_ns) == (file_stat.st_size, file_stat.st_mtime_ns)
+    
+    def _advance_progress(self, count=1, force=False):
+        """处理完图片后更新进度，信号按progress_interval合并发出"""
+        self.processed_images += count
+        now = time.monotonic()
+        if force or now - self._progress_emitted >= self.progress_interval:
+            self._progress_emitted = now
+            self.progress_updated.emit(self.processed_images, self._totals.total())
+        self._emit_rates()
+    
+    def _record_failure(self, image_path, message):
+        """记录单个文件的失败，之后汇总为一次scan_failures信号"""
+        self._failure_count += 1
+        if self._failure_count - self._reported_failures <= self.MAX_REPORTED_FAILURES:
+            self._failures.append((image_path, message))
+    
+    def _emit_failures(self):
+        """发出尚未报告的失败汇总"""
+        if not self._failures:
+            return
+        failures, self._failures = self._failures, []
+        count = self._failure_count - self._reported_failures
+        self._reported_failures = self._failure_count
+        self.scan_failures.emit(failures, count)
+    
+    def _resolve_directories(self, Session):
+        """
+        获取所有待扫描目录的ID，并预估图片总数
+        优先使用上次扫描的数量，其次是已入库的数量，都没有时在后台快速计数
+        """
+        targets = []
+        for directory_path in self.directories:
+            if not os.path.exists(directory_path):
+                continue
+            
+            # 获取或创建目录记录
+            directory_id, estimate = self._get_directory_id(directory_path, Session)
+            if not directory_id:
+                continue
+            targets.append((directory_path, directory_id))
+            
+            if estimate:
+                self._totals.set_estimate(directory_id, estimate)
+            else:
+                counter = threading.Thread(
+                    target=count_image_files,
+                    args=(directory_path, self.supported_formats, self._stop_event,
+                          lambda count, key=directory_id: self._totals.set_estimate(key, count)),
+                    name="image-counter",
+                    daemon=True
+                )
+                counter.start()
+        self._set_roots(targets)
+        return targets
+    
+    def _iter_scan_tasks(self, directory_id, directory_path, totals_key, fingerprints, quarantined, seen_paths,
+                         backfills, recursive=True, start_after=None, Session=None):
+        """
+        边遍历边产出需要解析的任务:
+        ((路径, stat结果, 使用内嵌缩略图, 同大小的已入库图片), (路径, 已有图片ID, 检查点序号, stat结果))
+        未变化的文件和未变化的隔离文件直接计入进度，旧记录的指纹补齐项收集到backfills
+        """
+        tracker = self._job[1] if self._job else None
+        for image_path, file_stat in stream_image_files(directory_path, self.supported_formats, self._stop_event,
+                                                        recursive=recursive, start_after=start_after):
+            self._wait_while_paused()
+            seen_paths.add(image_path)
+            if totals_key is not None:
+                self._totals.add_walked(totals_key)
+                self._run_priority_scans()
+            
+            known = fingerprints.get(image_path)
+            changed = True
+            if self._is_prioritized(image_path):
+                # 已在优先扫描中同步
+                changed = False
+            elif known and self.incremental:
+                status = self._compare_fingerprint(known, file_stat)
+                if status == 'legacy':
+                    # 旧记录没有指纹，大小一致时只补齐指纹，不重新提取
+                    backfills.append(self._fingerprint_values(known.image_id, file_stat))
+                changed = status == 'changed'
+            
+            # 之前解析失败、文件没有变化：不再打开（完整扫描同样跳过，需要时由用户请求重试）
+            is_quarantined = changed and quarantined.get(image_path) == (file_stat.st_size, file_stat.st_mtime_ns)
+            if is_quarantined:
+                changed = False
+            
+            # 同步目录变化时，刚修改过的文件可能还没有写完：本次不处理，稍后再次同步所在目录
+            unsettled = (changed and self.changed_directories is not None
+                         and time.time_ns() - file_stat.st_mtime_ns < self.settle_ns)
+            if unsettled:
+                changed = False
+                self._unsettled.add(os.path.dirname(image_path))
+            
+            seq = tracker.walked(image_path, changed) if tracker else None
+            if not changed:
+                if is_quarantined:
+                    self.quarantined_images += 1
+                elif known and not unsettled and not self._is_prioritized(image_path):
+                    self.skipped_images += 1
+                if totals_key is not None:
+                    self._advance_progress()
+                self._checkpoint()
+                continue
+            
+            self.throttle.acquire(file_stat.st_size, self._stop_event)
+            candidates = self._load_content_candidates(image_path, file_stat.st_size, Session)
+            yield ((image_path, file_stat, self.embedded_thumbnails, candidates),
+                   (image_path, known.image_id if known else None, seq, file_stat))
+    
+    def _get_executor(self):
+        """按需创建解析进程池"""
+        if self._executor is None:
+            # 使用spawn避免在已有多个线程的Qt进程中fork
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=lower_priority if self.low_priority else None
+            )
+        return self._executor
+    
+    def _shutdown_executor(self):
+        """关闭解析进程池，取消尚未开始的任务"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+    
+    def _report_write_failures(self, failures):
+        """报告批量写入失败的记录"""
+        for image_path, error in failures:
+            self._record_failure(image_path, f"写入图片记录失败: {error}")
+    
+    def _refine_thumbnails(self, directory_ids, writer, Session, flush_if_due, rows=None):
+        """
+        解码原图重新生成缩略图，替换首轮写入的内嵌缩略图和过期的缩略图，返回成功替换的数量
+        rows为None时处理目录中所有需要重新生成的缩略图；替换完成前旧缩略图仍可正常显示
+        """
+        if rows is None:
+            rows = self._stale_thumbnail_rows(directory_ids, Session)
+        
+        refined = 0
+        total = len(rows)
+        updated_ids = []  # 已交给写入器、还没有通知界面的图片ID
+        for (image_path, image_id, fingerprint), thumbnail_bytes, error in self._run_tasks(render_thumbnail,
+                                                                              self._iter_refine_tasks(rows),
+                                                                              on_idle=flush_if_due):
+            self._wait_while_paused()
+            if error is not None:
+                self._record_failure(image_path, f"生成缩略图失败: {error}")
+                continue
+            self._report_write_failures(writer.add_thumbnail(image_id, image_path, thumbnail_bytes, fingerprint))
+            refined += 1
+            updated_ids.append(image_id)
+            if not writer.pending:
+                # 缓冲的记录刚刚写入
+                self.thumbnails_updated.emit(updated_ids)
+                updated_ids = []
+            now = time.monotonic()
+            if now - self._progress_emitted >= self.progress_interval:
+                self._progress_emitted = now
+                self.thumbnails_refined.emit(refined, total)
+            self._emit_rates()
+        self._report_write_failures(writer.flush())
+        if updated_ids:
+            self.thumbnails_updated.emit(updated_ids)
+        if total:
+            self.thumbnails_refined.emit(refined, total)
+        self._emit_failures()
+        return refined
+    
+    def _stale_thumbnail_rows(self, directory_ids, Session, check_levels=False):
+        """
+        需要重新生成缩略图的图片：没有缩略图、仍是内嵌缩略图、生成器版本过期或原图指纹与生成时不同
+        check_levels为True时还检查各级缩略图数据是否齐全
+        """
+        stale = or_(
+            Thumbnail.id.is_(None),
+            Thumbnail.source == THUMBNAIL_SOURCE_EMBEDDED,
+            Thumbnail.generator_version.is_(None),
+            Thumbnail.generator_version != THUMBNAIL_GENERATOR_VERSION,
+            Thumbnail.source_fingerprint.is_(None),
+            Thumbnail.source_fingerprint != (cast(Image.file_size, String) + ':' + cast(Image.file_mtime_ns, String))
+        )
+        session = Session()
+        try:
+            query = session.query(
+                Image.id, Image.file_path, Image.file_size, Image.file_mtime_ns,
+                Thumbnail.thumbnail_path, stale.label('stale')
+            ).outerjoin(
+                Thumbnail, Thumbnail.image_id == Image.id
+            ).filter(
+                Image.directory_id.in_(directory_ids)
+            )
+            if not check_levels:
+                return query.filter(stale).all()
+            rows = query.all()
+            missing = thumbnails_missing_levels(session, [row.thumbnail_path for row in rows if row.thumbnail_path])
+        finally:
+            session.close()
+        return [row for row in rows if row.stale or row.thumbnail_path in missing]
+    
+    def _repair_thumbnails(self, writer, Session, flush_if_due):
+        """重新生成注册目录中缺失、过期、数据不全或仍是内嵌缩略图的缩略图（后台重新生成任务）"""
+        session = Session()
+        try:
+            normalized_paths = [os.path.normpath(path) for path in self.directories]
+            directory_ids = [row.id for row in session.query(Directory.id).filter(Directory.path.in_(normalized_paths))]
+        finally:
+            session.close()
+        
+        rows = self._stale_thumbnail_rows(directory_ids, Session, check_levels=True)
+        self._totals.set_estimate('thumbnails', len(rows))
+        self.processed_images = self._refine_thumbnails(directory_ids, writer, Session, flush_if_due, rows)
+        if not self.is_stopped():
+            self._backfill_perceptual_hashes(directory_ids, Session)
+    
+    def _backfill_perceptual_hashes(self, directory_ids, Session, batch_size=500):
+        """为还没有感知哈希的图片读取缩略图计算哈希，每张图片只需补齐一次"""
+        session = Session()
+        try:
+            rows = session.query(Image.id, Thumbnail.thumbnail_path).join(
+                Thumbnail, Thumbnail.image_id == Image.id
+            ).filter(
+                Image.phash.is_(None),
+                Image.directory_id.in_(directory_ids)
+            ).all()
+            # 缩略图数据在扫描线程中读出后交给工作进程
+            def hash_tasks():
+                for row in rows:
+                    data = load_thumbnail(session, row.thumbnail_path, THUMBNAIL_BASE_LEVEL)
+                    if data:
+                        yield (data,), row.id
             
-            self.scan_completed.emit(processed_images)
+            updates = []
+            for image_id, hashes, error in self._run_tasks(thumbnail_hashes, hash_tasks()):
+                if error is None:
+                    updates.append(dict(hashes, id=image_id))
+                if len(updates) >= batch_size:
+                    self._backfill_fingerprints(updates, Session)
+                    updates = []
+            if updates:
+                self._backfill_fingerprints(updates, Session)
+        finally:
+            session.close()
+    
+    def _iter_refine_tasks(self, rows):
+        """按顺序产出缩略图替换任务，界面请求的目录和可见图片提前处理"""
+        queue = deque(rows)
+        while queue:
+            request = self._scheduler.pop()
+            if request is not None:
+                matches = path_matcher(request)
+                prioritized = [row for row in queue if matches(row.file_path)]
+                if prioritized:
+                    queue = deque(prioritized + [row for row in queue if not matches(row.file_path)])
+            row = queue.popleft()
+            self.throttle.acquire(row.file_size or 0, self._stop_event)
+            # 替换任务的结果不含文件大小，提交时计入速度统计
+            self.throttle.record(row.file_size or 0)
+            yield (row.file_path,), (row.file_path, row.id, thumbnail_fingerprint(row.file_size, row.file_mtime_ns))
+    
+    def _run_tasks(self, task_func, tasks, on_idle=None):
+        """
+        执行解析任务，tasks为 (参数元组, 上下文) 的可迭代对象，按完成顺序产出 (上下文, 结果, 异常)
+        等待结果期间定期调用on_idle（用于按时间写入缓冲的记录）
+        """
+        if self.workers <= 1:
+            for args, context in tasks:
+                if self.is_stopped():
+                    return
+                try:
+                    yield context, task_func(*args), None
+                except Exception as e:
+                    yield context, None, e
+            return
+        
+        max_in_flight = self.workers * 4  # 限制排队的任务数，控制内存占用
+        task_iter = iter(tasks)
+        pending = {}  # future -> (参数元组, 上下文, 已重试次数, 所属进程池)
+        
+        def submit(args, context, retries=0):
+            # 进程池在第一个任务出现时才创建，没有变化的增量扫描不需要启动子进程
+            executor = self._get_executor()
+            try:
+                future = executor.submit(task_func, *args)
+            except BrokenExecutor:
+                # 解析进程崩溃后进程池不再接受任务，换一个新的进程池
+                self._discard_executor(executor)
+                executor = self._get_executor()
+                future = executor.submit(task_func, *args)
+            pending[future] = (args, context, retries, executor)
+        
+        while True:
+            while not self.is_stopped() and len(pending) < max_in_flight:
+                task = next(task_iter, None)
+                if task is None:
+                    break
+                submit(*task)
             
+            if self.is_stopped():
+                for future in pending:
+                    future.cancel()
+                return
+            if not pending:
+                return
+            
+            done, _ = wait(pending, timeout=self.batch_interval_ms / 1000.0, return_when=FIRST_COMPLETED)
+            if not done and on_idle:
+                on_idle()
+            for future in done:
+                args, context, retries, executor = pending.pop(future)
+                try:
+                    result = future.result()
+                except BrokenExecutor as e:
+                    # 一个解析进程崩溃会让进程池中所有进行中的任务失败：换新的进程池，每个任务最多重新提交一次
+                    self._discard_executor(executor)
+                    if retries < 1:
+                        submit(args, context, retries + 1)
+                        continue
+                    yield context, None, e
+                except Exception as e:
+                    yield context, None, e
+                else:
+                    yield context, result, None
+    
+    def _discard_executor(self, executor):
+        """丢弃已损坏的进程池，下次提交任务时重新创建"""
+        if self._executor is executor:
+            self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+    
+    def _load_content_candidates(self, image_path, file_size, Session):
+        """查找已入库的同大小图片，交给解析进程比较内容指纹"""
+        session = Session()
+        try:
+            rows = session.query(
+                Image.content_hash, Image.id, Image.file_path, Image.full_hash
+            ).filter(
+                Image.file_size == file_size,
+                Image.content_hash.isnot(None),
+                Image.file_path != image_path
+            ).order_by(Image.full_hash.is_(None)).limit(16).all()
+            return tuple(tuple(row) for row in rows)
+        finally:
+            session.close()
+
+    def _reuse_duplicate(self, values, source_id, file_stat, Session):
+        """
+        内容相同的图片复用已有图片的尺寸、EXIF和缩略图文件
+        返回与解析结果相同结构的 (图片字段, 缩略图字节, 缩略图来源, 共用的缩略图路径)；
+        已有图片的记录或缩略图已不存在时在本线程中正常解析（缩略图路径为None）
+        """
+        session = Session()
+        try:
+            source = session.query(Image).filter(Image.id == source_id).first()
+            thumbnail = session.query(Thumbnail).filter(Thumbnail.image_id == source_id).first()
+            if source is None or thumbnail is None:
+                record, thumbnail_bytes, thumbnail_source = process_image_file(
+                    values['file_path'], file_stat, self.embedded_thumbnails
+                )
+                record['content_hash'] = values['content_hash']
+                record['full_hash'] = values['full_hash']
+                return record, thumbnail_bytes, thumbnail_source, None
+            values = dict(values)
+            for field in ('width', 'height', 'format', 'exif_orientation', 'dhash', 'phash') + EXIF_FIELDS:
+                values[field] = getattr(source, field)
+            return values, None, thumbnail.source, thumbnail.thumbnail_path
+        finally:
+            session.close()
+
+    def _resolve_pending_duplicates(self, Session):
+        """
+        内容指纹相同、还没有完整哈希的图片（同时处理的副本只和已提交的记录比较过）：
+        计算完整哈希，确认内容相同的图片改为共用一组缩略图
+        """
+        session = Session()
+        try:
+            # 内容指纹包含文件大小，按 (大小, 指纹) 分组可以使用索引
+            groups = session.query(Image.content_hash).filter(
+                Image.content_hash.isnot(None)
+            ).group_by(Image.file_size, Image.content_hash).having(
+                func.count(Image.id) > 1,
+                func.sum(case((Image.full_hash.is_(None), 1), else_=0)) > 0
+            )
+            rows = session.query(Image.id, Image.file_path).filter(
+                Image.content_hash.in_(groups.scalar_subquery()),
+                Image.full_hash.is_(None)
+            ).all()
+        finally:
+            session.close()
+        if not rows:
+            return
+        
+        updates = []
+        for image_id, full_hash, error in self._run_tasks(full_content_hash,
+                                                          (((row.file_path,), row.id) for row in rows)):
+            # 文件已被删除或无法读取时留到下次扫描
+            if error is None:
+                updates.append({'id': image_id, 'full_hash': full_hash})
+        if updates:
+            self._backfill_fingerprints(updates, Session)
+            self._share_duplicate_thumbnails({values['full_hash'] for values in updates}, Session)
+    
+    def _share_duplicate_thumbnails(self, full_hashes, Session):
+        """完整哈希相同的图片改为共用同一组缩略图，优先保留当前版本、解码原图生成的缩略图"""
+        full_hashes = list(full_hashes)
+        replaced = []
+        session = Session()
+        try:
+            for start in range(0, len(full_hashes), 500):
+                rows = session.query(
+                    Image.full_hash, Thumbnail.id, Thumbnail.thumbnail_path, Thumbnail.file_size,
+                    Thumbnail.width, Thumbnail.height, Thumbnail.source, Thumbnail.generator_version
+                ).join(Thumbnail, Thumbnail.image_id == Image.id).filter(
+                    Image.full_hash.in_(full_hashes[start:start + 500])
+                ).order_by(Image.id).all()
+                groups = {}
+                for row in rows:
+                    groups.setdefault(row.full_hash, []).append(row)
+                
+                changes = []
+                for group in groups.values():
+                    keep = min(group, key=lambda row: (row.generator_version != THUMBNAIL_GENERATOR_VERSION,
+                                                       row.source == THUMBNAIL_SOURCE_EMBEDDED))
+                    for row in group:
+                        if row.thumbnail_path != keep.thumbnail_path:
+                            replaced.append(row.thumbnail_path)
+                            changes.append({
+                                'id': row.id,
+                                'thumbnail_path': keep.thumbnail_path,
+                                'width': keep.width,
+                                'height': keep.height,
+                                'file_size': keep.file_size,
+                                'source': keep.source,
+                                'generator_version': keep.generator_version
+                            })
+                if changes:
+                    session.execute(update(Thumbnail), changes)
+            session.commit()
         except Exception as e:
-            self.scan_error.emit(f"扫描线程错误: {str(e)}")
+            session.rollback()
+            self.scan_error.emit(f"合并重复图片的缩略图失败: {str(e)}")
+            return
+        finally:
+            session.close()
+        
+        session = Session()
+        try:
+            remove_unreferenced_thumbnails(session, replaced)
+        finally:
+            session.close()
     
     def _get_directory_id(self, directory_path, Session):
-        """获取目录ID，如果不存在则创建"""
+        """获取目录ID和预估图片数，如果不存在则创建"""
         session = Session()
         try:
             # 规范化路径
@@ -78,7 +929,10 @@ class ImageScannerThread(QThread):
             # 查找现有目录
             directory = session.query(Directory).filter_by(path=normalized_path).first()
             if directory:
-                return directory.id
+                estimate = directory.last_file_count
+                if estimate is None:
+                    estimate = session.query(func.count(Image.id)).filter(Image.directory_id == directory.id).scalar()
+                return directory.id, estimate
             
             # 创建新目录
             dir_name = os.path.basename(normalized_path)
@@ -88,316 +942,127 @@ class ImageScannerThread(QThread):
             )
             session.add(new_directory)
             session.commit()
-            return new_directory.id
+            return new_directory.id, None
             
         except Exception as e:
             session.rollback()
             print(f"获取目录ID失败: {e}")
-            return None
+            return None, None
         finally:
             session.close()
     
-    def _scan_directory(self, directory):
-        """扫描目录中的图片文件"""
-        images = []
-        for root, dirs, files in os.walk(directory):
-            # 忽略隐藏文件夹
-            dirs[:] = [d for d in dirs if not d.startswith('.')]
-            
-            for file in files:
-                if not file.startswith('.'):
-                    file_path = Path(root) / file
-                    if file_path.suffix.lower() in self.supported_formats:
-                        images.append(str(file_path))
-        return images
-    
-    def _process_image(self, image_path, directory_id, Session):
-        """处理单张图片"""
+    def _save_directory_count(self, directory_id, file_count, Session):
+        """记录本次扫描发现的图片数，作为下次扫描的进度总数"""
         session = Session()
         try:
-            # 检查图片是否已存在
-            existing_image = session.query(Image).filter_by(file_path=image_path).first()
-            if existing_image:
-                return
-            
-            # 获取图片信息
-            file_path = Path(image_path)
-            file_size = file_path.stat().st_size
-            
-            # 使用PIL获取基础图片信息
-            with PILImage.open(image_path) as img:
-                width, height = img.size
-                format_name = img.format or file_path.suffix.upper().lstrip('.')
-                
-                # 创建图片记录（包含EXIF信息）
-                image_record = Image(
-                    file_path=image_path,
-                    file_name=file_path.name,
-                    file_size=file_size,
-                    width=width,
-                    height=height,
-                    format=format_name,
-                    directory_id=directory_id,
-                    **self._extract_exif_data(image_path)
-                )
-                
-                session.add(image_record)
-                session.flush()  # 获取ID
-                
-                # 生成缩略图
-                thumbnail_path = self._create_thumbnail(image_path, image_record.id)
-                
-                # 创建缩略图记录
-                thumbnail_record = Thumbnail(
-                    image_id=image_record.id,
-                    thumbnail_path=thumbnail_path,
-                    width=150,
-                    height=150
+            session.execute(
+                update(Directory).where(Directory.id == directory_id).values(
+                    last_file_count=file_count,
+                    last_scanned_at=datetime.now()
                 )
-                
-                session.add(thumbnail_record)
-                session.commit()
-                
+            )
+            session.commit()
         except Exception as e:
             session.rollback()
-            raise e
+            print(f"保存目录扫描数量失败: {e}")
         finally:
             session.close()
-            
-    def _extract_exif_data(self, image_path):
-        """提取EXIF信息"""
-        exif_data = {}
-        
-        try:
-            # 尝试读取EXIF数据
-            exif_dict = piexif.load(image_path)
-            
-            # 提取拍摄时间
-            if piexif.ExifIFD.DateTimeOriginal in exif_dict['Exif']:
-                date_str = exif_dict['Exif'][piexif.ExifIFD.DateTimeOriginal].decode('utf-8')
-                exif_data['date_taken'] = datetime.strptime(date_str, '%Y:%m:%d %H:%M:%S')
-            elif piexif.ImageIFD.DateTime in exif_dict['0th']:
-                date_str = exif_dict['0th'][piexif.ImageIFD.DateTime].decode('utf-8')
-                exif_data['date_taken'] = datetime.strptime(date_str, '%Y:%m:%d %H:%M:%S')
-            
-            # 提取相机信息
-            if piexif.ImageIFD.Make in exif_dict['0th']:
-                exif_data['camera_make'] = exif_dict['0th'][piexif.ImageIFD.Make].decode('utf-8')
-            if piexif.ImageIFD.Model in exif_dict['0th']:
-                exif_data['camera_model'] = exif_dict['0th'][piexif.ImageIFD.Model].decode('utf-8')
-            
-            # 提取镜头信息
-            if piexif.ExifIFD.LensModel in exif_dict['Exif']:
-                try:
-                    exif_data['lens_model'] = exif_dict['Exif'][piexif.ExifIFD.LensModel].decode('utf-8')
-                except:
-                    exif_data['lens_model'] = str(exif_dict['Exif'][piexif.ExifIFD.LensModel])
-            
-            # 提取拍摄参数
-            if piexif.ExifIFD.FocalLength in exif_dict['Exif']:
-                focal_length = exif_dict['Exif'][piexif.ExifIFD.FocalLength]
-                exif_data['focal_length'] = float(focal_length[0]) / float(focal_length[1]) if isinstance(focal_length, tuple) else float(focal_length)
-                
-            if piexif.ExifIFD.FocalLengthIn35mmFilm in exif_dict['Exif']:
-                try:
-                    exif_data['focal_length_35mm'] = float(exif_dict['Exif'][piexif.ExifIFD.FocalLengthIn35mmFilm])
-                except:
-                    pass
-            
-            if piexif.ExifIFD.FNumber in exif_dict['Exif']:
-                aperture = exif_dict['Exif'][piexif.ExifIFD.FNumber]
-                exif_data['aperture'] = float(aperture[0]) / float(aperture[1]) if isinstance(aperture, tuple) else float(aperture)
-            
-            if piexif.ExifIFD.ExposureTime in exif_dict['Exif']:
-                exposure_time = exif_dict['Exif'][piexif.ExifIFD.ExposureTime]
-                if isinstance(exposure_time, tuple):
-                    exif_data['shutter_speed'] = f"1/{int(float(exposure_time[1])/float(exposure_time[0]))}"
-                else:
-                    exif_data['shutter_speed'] = str(exposure_time)
-            
-            if piexif.ExifIFD.ISOSpeedRatings in exif_dict['Exif']:
-                iso = exif_dict['Exif'][piexif.ExifIFD.ISOSpeedRatings]
-                exif_data['iso'] = int(iso[0]) if isinstance(iso, tuple) else int(iso)
-            
-            # 提取GPS信息
-            if 'GPS' in exif_dict and exif_dict['GPS']:
-                gps_info = exif_dict['GPS']
-                if piexif.GPSIFD.GPSLatitude in gps_info and piexif.GPSIFD.GPSLongitude in gps_info:
-                    lat = gps_info[piexif.GPSIFD.GPSLatitude]
-                    lat_ref = gps_info[piexif.GPSIFD.GPSLatitudeRef]
-                    lon = gps_info[piexif.GPSIFD.GPSLongitude]
-                    lon_ref = gps_info[piexif.GPSIFD.GPSLongitudeRef]
-                    
-                    exif_data['gps_latitude'] = self._convert_gps_to_decimal(lat, lat_ref)
-                    exif_data['gps_longitude'] = self._convert_gps_to_decimal(lon, lon_ref)
-                    
-                    if piexif.GPSIFD.GPSAltitude in gps_info:
-                        altitude = gps_info[piexif.GPSIFD.GPSAltitude]
-                        exif_data['gps_altitude'] = float(altitude[0]) / float(altitude[1]) if isinstance(altitude, tuple) else float(altitude)
-            
-            # 提取其他信息 - 使用正确的EXIF标签
-            if piexif.ImageIFD.Orientation in exif_dict['0th']:
-                try:
-                    orientation = exif_dict['0th'][piexif.ImageIFD.Orientation]
-                    orientation_map = {
-                        1: 'Horizontal (normal)', 2: 'Mirror horizontal', 3: 'Rotate 180',
-                        4: 'Mirror vertical', 5: 'Mirror horizontal and rotate 270 CW',
-                        6: 'Rotate 90 CW', 7: 'Mirror horizontal and rotate 90 CW',
-                        8: 'Rotate 270 CW'
-                    }
-                    exif_data['orientation'] = orientation_map.get(int(orientation), str(int(orientation)))
-                except Exception as e:
-                    print(f"提取orientation失败: {e}")
-                    exif_data['orientation'] = 'Unknown'
-            
-            # 使用ExifIFD而不是PhotoIFD
-            if piexif.ExifIFD.ColorSpace in exif_dict['Exif']:
-                try:
-                    color_space = exif_dict['Exif'][piexif.ExifIFD.ColorSpace]
-                    color_space_map = {1: 'sRGB', 2: 'Adobe RGB', 65535: 'Uncalibrated'}
-                    exif_data['color_space'] = color_space_map.get(color_space, str(color_space))
-                except Exception as e:
-                    print(f"提取color_space失败: {e}")
-                    exif_data['color_space'] = 'Unknown'
-            
-            if piexif.ExifIFD.WhiteBalance in exif_dict['Exif']:
-                try:
-                    white_balance = exif_dict['Exif'][piexif.ExifIFD.WhiteBalance]
-                    white_balance_map = {0: 'Auto', 1: 'Manual', 2: 'Custom', 3: 'One-touch', 4: 'Subtle'}
-                    exif_data['white_balance'] = white_balance_map.get(white_balance, str(white_balance))
-                except Exception as e:
-                    print(f"提取white_balance失败: {e}")
-                    exif_data['white_balance'] = 'Unknown'
-            
-            if piexif.ExifIFD.MeteringMode in exif_dict['Exif']:
-                try:
-                    metering_mode = exif_dict['Exif'][piexif.ExifIFD.MeteringMode]
-                    metering_map = {
-                        0: 'Unknown', 1: 'Average', 2: 'Center-weighted average',
-                        3: 'Spot', 4: 'Multi-spot', 5: 'Pattern', 6: 'Partial',
-                        255: 'Other'
-                    }
-                    exif_data['metering_mode'] = metering_map.get(metering_mode, str(metering_mode))
-                except Exception as e:
-                    print(f"提取metering_mode失败: {e}")
-                    exif_data['metering_mode'] = 'Unknown'
-            
-            # 提取曝光程序
-            if piexif.ExifIFD.ExposureProgram in exif_dict['Exif']:
-                try:
-                    exposure_program = exif_dict['Exif'][piexif.ExifIFD.ExposureProgram]
-                    exposure_map = {
-                        0: 'Not defined', 1: 'Manual', 2: 'Normal program',
-                        3: 'Aperture priority', 4: 'Shutter priority', 5: 'Creative program',
-                        6: 'Action program', 7: 'Portrait mode', 8: 'Landscape mode'
-                    }
-                    exif_data['exposure_program'] = exposure_map.get(exposure_program, str(exposure_program))
-                except Exception as e:
-                    print(f"提取exposure_program失败: {e}")
-                    exif_data['exposure_program'] = 'Unknown'
-            
-            # 提取闪光灯信息
-            if piexif.ExifIFD.Flash in exif_dict['Exif']:
-                try:
-                    flash = exif_dict['Exif'][piexif.ExifIFD.Flash]
-                    flash_map = {
-                        0: 'No Flash', 1: 'Fired', 5: 'Fired, Return not detected',
-                        7: 'Fired, Return detected', 9: 'On', 13: 'On, Return not detected',
-                        15: 'On, Return detected', 16: 'Off', 24: 'Auto, Did not fire',
-                        25: 'Auto, Fired', 29: 'Auto, Fired, Return not detected',
-                        31: 'Auto, Fired, Return detected', 32: 'No flash function',
-                        65: 'Fired, Red-eye reduction', 69: 'Fired, Red-eye reduction, Return not detected',
-                        71: 'Fired, Red-eye reduction, Return detected', 73: 'On, Red-eye reduction',
-                        77: 'On, Red-eye reduction, Return not detected',
-                        79: 'On, Red-eye reduction, Return detected', 89: 'Auto, Fired, Red-eye reduction',
-                        93: 'Auto, Fired, Red-eye reduction, Return not detected',
-                        95: 'Auto, Fired, Red-eye reduction, Return detected'
-                    }
-                    exif_data['flash'] = flash_map.get(flash, str(flash))
-                except Exception as e:
-                    print(f"提取flash失败: {e}")
-                    exif_data['flash'] = 'Unknown'
-            
-
-                
-        except Exception as e:
-            # EXIF读取失败时返回空字典，使用默认值
-            print(f"EXIF提取错误: {e}")
-            pass
-            
-        return exif_data
-        
-    def _convert_gps_to_decimal(self, gps_coords, ref):
-        """将GPS坐标转换为十进制度"""
+    
+    def _load_fingerprints(self, directory_path, Session, directory_id=None, recursive=True):
+        """
+        批量加载目录下已入库图片的指纹，返回 {file_path: FileFingerprint}
+        recursive为False时只加载直接位于该目录下的图片
+        """
+        session = Session()
         try:
-            degrees = float(gps_coords[0][0]) / float(gps_coords[0][1])
-            minutes = float(gps_coords[1][0]) / float(gps_coords[1][1])
-            seconds = float(gps_coords[2][0]) / float(gps_coords[2][1])
+            # 同时匹配路径前缀，避免嵌套注册的目录重复插入
+            prefix = os.path.join(os.path.normpath(directory_path), '')
+            condition = Image.file_path.startswith(prefix, autoescape=True)
+            if not recursive:
+                condition = and_(condition, func.instr(func.substr(Image.file_path, len(prefix) + 1), os.sep) == 0)
+            if directory_id is not None:
+                condition = or_(Image.directory_id == directory_id, condition)
             
-            decimal = degrees + (minutes / 60.0) + (seconds / 3600.0)
+            rows = session.query(
+                Image.file_path, Image.id, Image.directory_id,
+                Image.file_size, Image.file_mtime_ns, Image.file_inode
+            ).filter(condition).all()
             
-            if ref in [b'S', b'W', 'S', 'W']:
-                decimal = -decimal
-                
-            return decimal
-        except:
-            return None
+            return {
+                row.file_path: FileFingerprint(row.id, row.directory_id, row.file_size,
+                                               row.file_mtime_ns, row.file_inode)
+                for row in rows
+            }
+        finally:
+            session.close()
     
-    def _get_rotation_angle(self, image_path):
-        """根据EXIF方向信息获取旋转角度"""
+    def _compare_fingerprint(self, known, file_stat):
+        """比较文件指纹，返回 'unchanged'、'legacy'（旧记录无指纹）或 'changed'"""
+        if known.file_size != file_stat.st_size:
+            return 'changed'
+        if known.mtime_ns is None:
+            return 'legacy'
+        if known.mtime_ns != file_stat.st_mtime_ns:
+            return 'changed'
+        # 部分文件系统（如网络挂载）不提供inode，此时忽略
+        if known.inode and file_stat.st_ino and known.inode != file_stat.st_ino:
+            return 'changed'
+        return 'unchanged'
+    
+    def _fingerprint_values(self, image_id, file_stat):
+        """生成用于更新的指纹字段"""
+        return {
+            'id': image_id,
+            'file_size': file_stat.st_size,
+            'file_mtime_ns': file_stat.st_mtime_ns,
+            'file_inode': file_stat.st_ino or None
+        }
+    
+    def _backfill_fingerprints(self, backfills, Session):
+        """批量补齐图片记录的指纹、完整哈希和感知哈希"""
+        # 按主键批量更新要求每组记录的字段相同
+        groups = {}
+        for values in backfills:
+            groups.setdefault(tuple(sorted(values)), []).append(values)
+        
+        session = Session()
         try:
-            exif_dict = piexif.load(image_path)
-            if piexif.ImageIFD.Orientation in exif_dict['0th']:
-                orientation = exif_dict['0th'][piexif.ImageIFD.Orientation]
-                orientation_map = {
-                    1: 0,   # Horizontal (normal)
-                    3: 180, # Rotate 180
-                    6: 90,  # Rotate 90 CW
-                    8: 270  # Rotate 270 CW
-                }
-                return orientation_map.get(int(orientation), 0)
-        except:
-            pass
-        return 0
+            for rows in groups.values():
+                session.execute(update(Image), rows)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            self.scan_error.emit(f"更新文件指纹失败: {str(e)}")
+        finally:
+            session.close()
     
-    def _create_thumbnail(self, image_path, image_id):
-        """创建缩略图（带方向修正）"""
+    def _prune_images(self, image_ids, Session):
+        """删除磁盘上已不存在的图片记录及其缩略图"""
+        session = Session()
         try:
-            # 生成缩略图文件名
-            file_hash = hashlib.md5(str(image_path).encode()).hexdigest()
-            thumbnail_filename = f"{image_id}_{file_hash}.jpg"
-            thumbnail_path = self.thumbnail_dir / thumbnail_filename
-            
-            # 如果缩略图已存在，直接返回路径
-            if thumbnail_path.exists():
-                return str(thumbnail_path)
-            
-            # 获取旋转角度
-            rotation_angle = self._get_rotation_angle(image_path)
-            
-            # 创建缩略图
-            with PILImage.open(image_path) as img:
-                # 转换为RGB模式（处理RGBA等模式）
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    background = PILImage.new('RGB', img.size, (255, 255, 255))
-                    if img.mode == 'P':
-                        img = img.convert('RGBA')
-                    background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                    img = background
-                elif img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # 根据EXIF方向旋转图片
-                if rotation_angle != 0:
-                    img = img.rotate(rotation_angle, expand=True)
-                
-                # 计算缩略图尺寸（保持宽高比）
-                img.thumbnail((150, 150), PILImage.Resampling.LANCZOS)
-                
-                # 保存缩略图
-                img.save(thumbnail_path, 'JPEG', quality=85)
-                
-            return str(thumbnail_path)
-            
+            # 分块避免超出SQLite的参数数量限制（删除或清空很大的目录时），全部在同一个事务中
+            thumbnail_paths = []
+            for start in range(0, len(image_ids), 500):
+                chunk = image_ids[start:start + 500]
+                thumbnail_paths.extend(
+                    row.thumbnail_path for row in
+                    session.query(Thumbnail.thumbnail_path).filter(Thumbnail.image_id.in_(chunk))
+                )
+                session.execute(delete(album_images).where(album_images.c.image_id.in_(chunk)))
+                session.query(Thumbnail).filter(Thumbnail.image_id.in_(chunk)).delete(synchronize_session=False)
+                session.query(Image).filter(Image.id.in_(chunk)).delete(synchronize_session=False)
+            session.commit()
         except Exception as e:
-            raise Exception(f"创建缩略图失败: {str(e)}")
\ No newline at end of file
+            session.rollback()
+            self.scan_error.emit(f"清理已删除的图片失败: {str(e)}")
+            return
+        finally:
+            session.close()
+        self.removed_images += len(image_ids)
+        
+        # 内容相同的图片共用缩略图，只删除不再被引用的文件
+        session = Session()
+        try:
+            remove_unreferenced_thumbnails(session, thumbnail_paths)
+        finally:
+            session.close()
@@ -0,0 +1,55 @@
+"""
+扫描调度模块
+界面请求优先处理的路径（选中的目录、网格中可见的图片）进入优先级队列，扫描线程在文件之间取出处理
+"""
+import heapq
+import itertools
+import os
+import threading
+
+
+class ScanScheduler:
+    """
+    扫描优先级队列
+    每次请求是一组路径（目录或图片文件），最新的请求优先；重复请求相同路径时只保留最新的一次
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._heap = []
+        self._counter = itertools.count()
+        self._latest = {}  # 请求路径组 -> 最新序号
+
+    def request(self, paths):
+        """请求优先处理一组路径，可在任意线程调用"""
+        if isinstance(paths, str):
+            paths = [paths]
+        key = tuple(sorted({os.path.normpath(str(path)) for path in paths}))
+        if not key:
+            return
+        with self._lock:
+            seq = next(self._counter)
+            self._latest[key] = seq
+            heapq.heappush(self._heap, (-seq, key))
+
+    def pop(self):
+        """取出最新的请求，没有时返回None"""
+        with self._lock:
+            while self._heap:
+                negative_seq, key = heapq.heappop(self._heap)
+                if self._latest.get(key) == -negative_seq:
+                    del self._latest[key]
+                    return key
+            return None
+
+    def has_requests(self):
+        """是否有待处理的请求"""
+        with self._lock:
+            return bool(self._latest)
+
+
+def path_matcher(paths):
+    """生成判断图片路径是否属于请求的函数：等于请求中的文件，或位于请求中的目录下"""
+    files = set(paths)
+    prefixes = tuple(os.path.join(path, '') for path in paths)
+    return lambda path: path in files or path.startswith(prefixes)
@@ -0,0 +1,106 @@
+"""
+相似图片模块
+基于图片的64位感知哈希（入库时由缩略图计算），用多索引哈希在内存中查找汉明距离k以内的图片
+"""
+from itertools import combinations
+from src.models.image import Image
+
+# 多索引哈希：64位分成4段，每段16位
+INDEX_SEGMENTS = 4
+SEGMENT_BITS = 64 // INDEX_SEGMENTS
+SEGMENT_MASK = (1 << SEGMENT_BITS) - 1
+
+# 默认的相似阈值（pHash汉明距离）
+DEFAULT_MAX_DISTANCE = 10
+
+
+def hamming_distance(a, b):
+    """两个64位哈希的汉明距离"""
+    return (a ^ b).bit_count()
+
+
+class HammingIndex:
+    """
+    多索引哈希（MIH）
+    64位哈希分成4段，每段建一个哈希表。距离不超过k的两个哈希至少有一段的差异不超过k//4位，
+    查询时只需在每段枚举这些位翻转后的桶，再逐个校验完整距离
+    """
+
+    def __init__(self):
+        self._ids = {}  # 哈希 -> [图片ID]
+        self._tables = [{} for _ in range(INDEX_SEGMENTS)]
+        self._flip_masks = {}
+
+    def __len__(self):
+        return sum(len(ids) for ids in self._ids.values())
+
+    def add(self, value, image_id):
+        """加入一张图片的哈希"""
+        ids = self._ids.get(value)
+        if ids is not None:
+            ids.append(image_id)
+            return
+        self._ids[value] = [image_id]
+        for segment, table in enumerate(self._tables):
+            table.setdefault((value >> (segment * SEGMENT_BITS)) & SEGMENT_MASK, []).append(value)
+
+    def search(self, value, max_distance):
+        """返回汉明距离不超过max_distance的 [(距离, 图片ID)]，按距离升序"""
+        radius = max_distance // INDEX_SEGMENTS
+        checked = set()
+        results = []
+        for segment, table in enumerate(self._tables):
+            key = (value >> (segment * SEGMENT_BITS)) & SEGMENT_MASK
+            for mask in self._masks(radius):
+                for candidate in table.get(key ^ mask, ()):
+                    if candidate in checked:
+                        continue
+                    checked.add(candidate)
+                    distance = hamming_distance(candidate, value)
+                    if distance <= max_distance:
+                        results.extend((distance, image_id) for image_id in self._ids[candidate])
+        results.sort()
+        return results
+
+    def _masks(self, radius):
+        """一段内最多翻转radius位的所有掩码"""
+        masks = self._flip_masks.get(radius)
+        if masks is None:
+            masks = [0]
+            for count in range(1, radius + 1):
+                for bits in combinations(range(SEGMENT_BITS), count):
+                    masks.append(sum(1 << bit for bit in bits))
+            self._flip_masks[radius] = masks
+        return masks
+
+
+def load_similarity_index(session, kind='phash', batch_size=50000):
+    """从数据库加载已有感知哈希的图片，构建索引"""
+    column = getattr(Image, kind)
+    index = HammingIndex()
+    query = session.query(Image.id, column).filter(column.isnot(None)).yield_per(batch_size)
+    for image_id, value in query:
+        index.add(int(value, 16), image_id)
+    return index
+
+
+def find_similar_images(session, image_id, max_distance=DEFAULT_MAX_DISTANCE, index=None, kind='phash'):
+    """
+    查找与指定图片相似的图片，返回 [(距离, Image)]，第一项为图片自身
+    图片还没有感知哈希时返回空列表；index可复用已构建的索引
+    """
+    value = session.query(getattr(Image, kind)).filter(Image.id == image_id).scalar()
+    if value is None:
+        return []
+    if index is None:
+        index = load_similarity_index(session, kind)
+
+    matches = index.search(int(value, 16), max_distance)
+    # 图片自身排在最前
+    matches.sort(key=lambda match: (match[1] != image_id, match[0], match[1]))
+    images = {}
+    ids = [match_id for _, match_id in matches]
+    for start in range(0, len(ids), 500):
+        for image in session.query(Image).filter(Image.id.in_(ids[start:start + 500])):
+            images[image.id] = image
+    return [(distance, images[match_id]) for distance, match_id in matches if match_id in images]
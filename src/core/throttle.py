@@ -0,0 +1,144 @@
+"""
+扫描限速模块
+令牌桶限制每秒处理的文件数和读取的字节数，并在Linux上降低扫描线程和解析进程的CPU/IO优先级
+"""
+import ctypes
+import os
+import platform
+import threading
+import time
+from collections import deque
+
+# ioprio_set系统调用号
+_IOPRIO_SYSCALLS = {'x86_64': 251, 'amd64': 251, 'i386': 289, 'i686': 289, 'aarch64': 30, 'arm64': 30}
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_CLASS_BE = 2
+_IOPRIO_CLASS_SHIFT = 13
+
+
+def lower_priority(thread_id=0, niceness=10, io_level=7):
+    """
+    降低当前进程（或Linux下指定线程）的CPU和IO优先级，重复调用不会继续降低
+    IO使用best-effort的最低级别，而不是idle类，避免磁盘持续繁忙时扫描完全停止
+    """
+    if hasattr(os, 'setpriority'):
+        try:
+            # Linux下nice值按线程生效，thread_id为0表示当前进程
+            current = os.getpriority(os.PRIO_PROCESS, thread_id)
+            if current < niceness:
+                os.setpriority(os.PRIO_PROCESS, thread_id, niceness)
+        except OSError as e:
+            print(f"降低CPU优先级失败: {e}")
+
+    syscall_nr = _IOPRIO_SYSCALLS.get(platform.machine().lower())
+    if not platform.system() == 'Linux' or syscall_nr is None:
+        return
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        ioprio = (_IOPRIO_CLASS_BE << _IOPRIO_CLASS_SHIFT) | io_level
+        if libc.syscall(syscall_nr, _IOPRIO_WHO_PROCESS, thread_id, ioprio) != 0:
+            print(f"降低IO优先级失败: {os.strerror(ctypes.get_errno())}")
+    except (OSError, AttributeError) as e:
+        print(f"降低IO优先级失败: {e}")
+
+
+class TokenBucket:
+    """令牌桶，rate为每秒补充的令牌数（0表示不限制），最多积累capacity个"""
+
+    def __init__(self, rate=0, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def reserve(self, amount):
+        """
+        预订amount个令牌，返回需要等待的秒数
+        允许透支，单个超过容量的请求（如大文件）只会等待而不会永远无法通过
+        """
+        if not self.rate:
+            return 0.0
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self.tokens -= amount
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def reset(self):
+        """补满令牌（刚开始限速时不受之前全速运行的影响）"""
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+
+class RateMeter:
+    """统计最近一段时间内的实际处理速度"""
+
+    def __init__(self, window=5.0):
+        self.window = window
+        self._samples = deque()  # (时间, 字节数)
+        self._lock = threading.Lock()
+
+    def record(self, nbytes):
+        """记录处理完一个文件"""
+        with self._lock:
+            self._samples.append((time.monotonic(), nbytes))
+
+    def rates(self):
+        """返回 (文件/秒, 字节/秒)"""
+        now = time.monotonic()
+        with self._lock:
+            while self._samples and now - self._samples[0][0] > self.window:
+                self._samples.popleft()
+            if not self._samples:
+                return 0.0, 0.0
+            elapsed = max(now - self._samples[0][0], 1.0)
+            return len(self._samples) / elapsed, sum(nbytes for _, nbytes in self._samples) / elapsed
+
+
+class IOThrottle:
+    """
+    扫描限速器：文件数和字节数两个令牌桶，启用时按两者中较长的等待时间限速
+    启用状态可在界面线程中随时切换（如用户正在滚动或预览时限速，空闲时全速）
+    """
+
+    def __init__(self, files_per_second=0, bytes_per_second=0):
+        self.files = TokenBucket(files_per_second)
+        self.bytes = TokenBucket(bytes_per_second)
+        self.meter = RateMeter()
+        self._enabled = False
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self._enabled
+
+    def set_enabled(self, enabled):
+        """启用或关闭限速"""
+        with self._lock:
+            if enabled and not self._enabled:
+                self.files.reset()
+                self.bytes.reset()
+            self._enabled = enabled
+
+    def acquire(self, nbytes, stop_event=None):
+        """处理一个文件之前调用，限速时等待令牌；关闭限速或请求停止时立即返回"""
+        with self._lock:
+            if not self._enabled:
+                return
+            delay = max(self.files.reserve(1), self.bytes.reserve(nbytes))
+
+        deadline = time.monotonic() + delay
+        while self._enabled:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or (stop_event and stop_event.is_set()):
+                return
+            # 分段等待，限速中途关闭时及时恢复全速
+            time.sleep(min(remaining, 0.1))
+
+    def record(self, nbytes):
+        """记录处理完一个文件"""
+        self.meter.record(nbytes)
+
+    def rates(self):
+        """最近的实际速度 (文件/秒, 字节/秒)"""
+        return self.meter.rates()
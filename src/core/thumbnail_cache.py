@@ -0,0 +1,96 @@
+"""
+缩略图缓存模块
+界面中已解码的缩略图按 (图片ID, 缩略图版本, 级别) 缓存在内存中，超出字节预算时淘汰最久未使用的项，
+在目录之间来回切换时不需要重新读取和解码。缩略图重新生成后版本变化，旧的缓存项不再命中，随LRU淘汰
+"""
+import threading
+from collections import OrderedDict
+
+# 默认内存预算（MB），可通过 settings.json 的 display.thumbnail_cache_mb 调整
+DEFAULT_CACHE_MB = 256
+
+
+def pixmap_bytes(pixmap):
+    """QPixmap/QImage解码后占用的内存字节数"""
+    return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+
+class ThumbnailCache:
+    """按字节预算淘汰的LRU缓存，记录命中、未命中和淘汰次数"""
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()  # 键 -> (值, 字节数)
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """取出缓存项并标记为最近使用，不存在时返回None"""
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        """加入缓存项，超出预算时淘汰最久未使用的项；单项超过预算时不缓存"""
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[1]
+            if nbytes > self.max_bytes:
+                return
+            self._items[key] = (value, nbytes)
+            self.current_bytes += nbytes
+            self._evict()
+
+    def set_max_bytes(self, max_bytes):
+        """调整预算，缩小时立即淘汰"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict()
+
+    def _evict(self):
+        while self.current_bytes > self.max_bytes and self._items:
+            _, (_, nbytes) = self._items.popitem(last=False)
+            self.current_bytes -= nbytes
+            self.evictions += 1
+
+    def clear(self):
+        """清空缓存（计数保留）"""
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """缓存统计，用于按机器内存调整预算"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'items': len(self._items),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else 0.0
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_thumbnail_cache():
+    """应用内共用的缩略图缓存"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ThumbnailCache()
+        return _cache
@@ -0,0 +1,506 @@
+"""
+缩略图存储模块
+每张图片的缩略图按 128/256/512 三级保存：入库时一次解码生成较小的两级，512 在第一次使用时生成
+
+缩略图打包保存在 thumbnails/packs/ 下只追加的段文件中，偏移索引在数据库的 thumbnail_blobs 表，
+读取时通过 mmap 直接取出 JPEG 数据，不需要为每张缩略图打开文件。Thumbnail.thumbnail_path 保存存储键
+（pack:<图片路径的md5>），内容相同的图片共用一个键；被替换或删除的数据由压缩整理回收。
+
+旧版本的缩略图是 thumbnails/ 下的独立 JPEG 文件（<md5>.jpg 及 <md5>_<尺寸>.jpg），
+迁移之前仍可正常读取，migrate_loose_thumbnails 把它们导入段文件并改写缩略图记录
+"""
+import hashlib
+import mmap
+import os
+import threading
+import uuid
+from pathlib import Path
+from sqlalchemy import bindparam, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from src.core.ingest import (THUMBNAIL_LEVELS, THUMBNAIL_EAGER_LEVELS, THUMBNAIL_BASE_LEVEL,
+                             render_thumbnail, scale_thumbnail, thumbnail_dimensions)
+from src.models.thumbnail import Thumbnail
+from src.models.thumbnail_blob import ThumbnailBlob
+
+try:
+    import fcntl
+except ImportError:  # Windows：被其他进程打开的段文件无法删除，压缩时自然跳过
+    fcntl = None
+
+# 打包存储的键前缀，没有前缀的thumbnail_path是旧版本的独立文件
+PACK_PREFIX = 'pack:'
+
+# 单个段文件的最大大小，超过后写入新的段文件
+SEGMENT_MAX_BYTES = 256 * 1024 * 1024
+
+# 段文件中无效数据的比例达到该值时压缩整理
+COMPACT_DEAD_RATIO = 0.3
+
+THUMBNAIL_ROOT = Path("thumbnails")
+
+
+class ThumbnailStore:
+    """
+    段文件读写
+    每个进程写入自己独占的段文件（新建时以O_EXCL取得下一个编号），多个进程（桌面程序和命令行）
+    可以同时写入而不需要跨进程加锁；进程内的扫描线程和界面线程共用一个实例
+    """
+
+    def __init__(self, root=THUMBNAIL_ROOT):
+        self.directory = Path(root) / "packs"
+        self._lock = threading.Lock()
+        self._active = None  # (段编号, 文件对象)
+        self._maps = {}  # 段编号 -> mmap
+
+    def _segment_path(self, segment):
+        return self.directory / f"{segment:08d}.pack"
+
+    def segments(self):
+        """磁盘上的段文件 {段编号: 大小}"""
+        if not self.directory.exists():
+            return {}
+        sizes = {}
+        for path in self.directory.glob("*.pack"):
+            try:
+                sizes[int(path.stem)] = path.stat().st_size
+            except (ValueError, OSError):
+                continue
+        return sizes
+
+    @property
+    def active_segment(self):
+        return self._active[0] if self._active else None
+
+    def _open_active(self):
+        """新建一个本进程独占写入的段文件"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        segment = max(self.segments(), default=0) + 1
+        while True:
+            try:
+                fd = os.open(self._segment_path(segment), os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o644)
+                break
+            except FileExistsError:
+                segment += 1
+        if fcntl is not None:
+            # 持有锁表示段文件仍在写入，压缩整理时跳过
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._active = (segment, os.fdopen(fd, 'wb'))
+
+    def append(self, blobs):
+        """追加一组数据并写入磁盘，返回每项的 (段编号, 偏移, 长度)"""
+        locations = []
+        with self._lock:
+            for data in blobs:
+                if self._active is None or self._active[1].tell() >= SEGMENT_MAX_BYTES:
+                    self._seal()
+                    self._open_active()
+                segment, f = self._active
+                locations.append((segment, f.tell(), len(data)))
+                f.write(data)
+            if self._active is not None:
+                # 先落盘再提交索引，索引不会指向不完整的数据
+                self._active[1].flush()
+                os.fsync(self._active[1].fileno())
+        return locations
+
+    def read(self, segment, offset, length):
+        """读取一项数据，返回bytes"""
+        with self._lock:
+            mapped = self._maps.get(segment)
+            if mapped is None or offset + length > len(mapped):
+                # 段文件仍在增长（本进程或其他进程正在写入）时重新映射
+                with open(self._segment_path(segment), 'rb') as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                old = self._maps.pop(segment, None)
+                if old is not None:
+                    old.close()
+                self._maps[segment] = mapped
+            return mapped[offset:offset + length]
+
+    def _seal(self):
+        """结束当前段文件的写入"""
+        if self._active is not None:
+            self._active[1].close()
+            self._active = None
+
+    def seal(self):
+        """结束当前段文件的写入，之后的数据写入新的段文件（压缩整理前调用）"""
+        with self._lock:
+            self._seal()
+
+    def is_writing(self, segment):
+        """段文件是否正在被其他进程写入"""
+        if fcntl is None or segment == self.active_segment:
+            return segment == self.active_segment
+        try:
+            with open(self._segment_path(segment), 'rb') as f:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            return False
+        except OSError:
+            return True
+
+    def remove_segment(self, segment):
+        """删除段文件，返回是否成功（Windows下被其他进程打开时失败，留到下次）"""
+        with self._lock:
+            mapped = self._maps.pop(segment, None)
+            if mapped is not None:
+                mapped.close()
+        try:
+            self._segment_path(segment).unlink(missing_ok=True)
+            return True
+        except OSError as e:
+            print(f"删除缩略图段文件失败: {segment} - {e}")
+            return False
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_thumbnail_store(root=THUMBNAIL_ROOT):
+    """进程内共用的缩略图存储"""
+    key = str(Path(root).resolve())
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = ThumbnailStore(root)
+        return store
+
+
+def thumbnail_key(image_path):
+    """根据图片路径生成缩略图存储键（不依赖数据库ID）"""
+    return f"{PACK_PREFIX}{hashlib.md5(str(image_path).encode()).hexdigest()}"
+
+
+def unique_thumbnail_key():
+    """不与任何图片路径对应的新存储键，原图的键仍被内容相同的副本共用时使用"""
+    return f"{PACK_PREFIX}{uuid.uuid4().hex}"
+
+
+def is_packed(thumbnail_path):
+    """缩略图是否在打包存储中（否则是旧版本的独立文件）"""
+    return bool(thumbnail_path) and thumbnail_path.startswith(PACK_PREFIX)
+
+
+def thumbnail_level_path(base_path, size):
+    """旧版本独立文件中指定尺寸的缩略图路径"""
+    if size == THUMBNAIL_BASE_LEVEL:
+        return str(base_path)
+    root, extension = os.path.splitext(str(base_path))
+    return f"{root}_{size}{extension}"
+
+
+def thumbnail_level_paths(base_path):
+    """旧版本独立文件中一组缩略图的所有级别路径"""
+    return [thumbnail_level_path(base_path, size) for size in THUMBNAIL_LEVELS]
+
+
+def choose_thumbnail_level(pixels):
+    """按需要的物理像素选择级别：不小于pixels的最小级别，都不够时使用最大的级别"""
+    return next((size for size in THUMBNAIL_LEVELS if size >= pixels), THUMBNAIL_LEVELS[-1])
+
+
+def put_thumbnails(session, items, replace=True):
+    """
+    写入缩略图 {存储键: {尺寸: JPEG字节}}，在session的事务中更新索引（由调用方提交）
+    replace为True时删除本次没有写入的级别（由旧内容按需生成的较大级别已过期）
+    返回 {存储键: 写入的总字节数}
+    """
+    entries = [(key, size, data) for key, levels in items.items() for size, data in sorted(levels.items())]
+    if not entries:
+        return {}
+    locations = get_thumbnail_store().append([data for _, _, data in entries])
+    rows = [
+        {'key': key, 'level': size, 'segment': segment, 'offset': offset, 'length': length}
+        for (key, size, _), (segment, offset, length) in zip(entries, locations)
+    ]
+    stmt = sqlite_insert(ThumbnailBlob)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ThumbnailBlob.key, ThumbnailBlob.level],
+        set_={'segment': stmt.excluded.segment, 'offset': stmt.excluded.offset, 'length': stmt.excluded.length}
+    )
+    session.connection().execute(stmt, rows)
+
+    if replace:
+        # 按写入的级别组合分组删除其余级别
+        groups = {}
+        for key, levels in items.items():
+            groups.setdefault(tuple(sorted(levels)), []).append(key)
+        for levels, keys in groups.items():
+            for start in range(0, len(keys), 500):
+                session.query(ThumbnailBlob).filter(
+                    ThumbnailBlob.key.in_(keys[start:start + 500]),
+                    ThumbnailBlob.level.notin_(levels)
+                ).delete(synchronize_session=False)
+
+    totals = {}
+    for key, _, data in entries:
+        totals[key] = totals.get(key, 0) + len(data)
+    return totals
+
+
+def load_thumbnail(session, thumbnail_path, size):
+    """读取指定级别的缩略图JPEG数据，不存在时返回None"""
+    if not thumbnail_path:
+        return None
+    if not is_packed(thumbnail_path):
+        try:
+            with open(thumbnail_level_path(thumbnail_path, size), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+    row = session.query(ThumbnailBlob.segment, ThumbnailBlob.offset, ThumbnailBlob.length).filter(
+        ThumbnailBlob.key == thumbnail_path,
+        ThumbnailBlob.level == size
+    ).first()
+    if row is None:
+        return None
+    try:
+        return get_thumbnail_store().read(row.segment, row.offset, row.length)
+    except (OSError, ValueError) as e:
+        print(f"读取缩略图失败: {thumbnail_path} - {e}")
+        return None
+
+
+def load_thumbnail_level(session, thumbnail_path, image_path, size):
+    """
+    读取指定级别的缩略图，不存在时生成并保存：比基础级小的由基础级缩小，更大的级别解码原图
+    无法生成时返回基础级（都没有时返回None）
+    """
+    data = load_thumbnail(session, thumbnail_path, size)
+    if data is not None or not thumbnail_path:
+        return data
+    try:
+        if size < THUMBNAIL_BASE_LEVEL:
+            base = load_thumbnail(session, thumbnail_path, THUMBNAIL_BASE_LEVEL)
+            if base is None:
+                return None
+            data = scale_thumbnail(base, size)
+        else:
+            data = render_thumbnail(image_path, (size,))[size]
+        if is_packed(thumbnail_path):
+            put_thumbnails(session, {thumbnail_path: {size: data}}, replace=False)
+            session.commit()
+        else:
+            # 先写临时文件再替换，避免读到写了一半的文件
+            path = thumbnail_level_path(thumbnail_path, size)
+            with open(f"{path}.tmp", 'wb') as f:
+                f.write(data)
+            os.replace(f"{path}.tmp", path)
+        return data
+    except Exception as e:
+        session.rollback()
+        print(f"生成缩略图失败: {thumbnail_path} ({size}) - {e}")
+        return load_thumbnail(session, thumbnail_path, THUMBNAIL_BASE_LEVEL)
+
+
+def thumbnails_missing_levels(session, thumbnail_paths, levels=THUMBNAIL_EAGER_LEVELS):
+    """返回缺少任一指定级别的缩略图存储键或路径"""
+    packed = [path for path in set(thumbnail_paths) if is_packed(path)]
+    present = {}
+    for start in range(0, len(packed), 500):
+        for key, level in session.query(ThumbnailBlob.key, ThumbnailBlob.level).filter(
+            ThumbnailBlob.key.in_(packed[start:start + 500])
+        ):
+            present.setdefault(key, set()).add(level)
+    missing = set()
+    for path in set(thumbnail_paths):
+        if is_packed(path):
+            if not set(levels) <= present.get(path, set()):
+                missing.add(path)
+        elif not all(os.path.exists(thumbnail_level_path(path, size)) for size in levels):
+            missing.add(path)
+    return missing
+
+
+def stored_sizes(session, thumbnail_paths):
+    """缩略图各级的总字节数 {存储键或路径: 字节数}"""
+    sizes = {}
+    packed = [path for path in set(thumbnail_paths) if is_packed(path)]
+    for start in range(0, len(packed), 500):
+        sizes.update(session.query(ThumbnailBlob.key, func.sum(ThumbnailBlob.length)).filter(
+            ThumbnailBlob.key.in_(packed[start:start + 500])
+        ).group_by(ThumbnailBlob.key).all())
+    for path in set(thumbnail_paths):
+        if path and not is_packed(path):
+            sizes[path] = sum(os.path.getsize(level_path) for level_path in thumbnail_level_paths(path)
+                              if os.path.exists(level_path))
+    return sizes
+
+
+def delete_thumbnails(session, thumbnail_paths):
+    """删除缩略图：打包存储只删除索引（空间由压缩整理回收），旧版本独立文件直接删除"""
+    packed = [path for path in set(thumbnail_paths) if is_packed(path)]
+    for start in range(0, len(packed), 500):
+        session.query(ThumbnailBlob).filter(
+            ThumbnailBlob.key.in_(packed[start:start + 500])
+        ).delete(synchronize_session=False)
+    session.commit()
+    for path in set(thumbnail_paths):
+        if not path or is_packed(path):
+            continue
+        for level_path in thumbnail_level_paths(path):
+            try:
+                Path(level_path).unlink(missing_ok=True)
+            except OSError as e:
+                print(f"删除缩略图文件失败: {level_path} - {e}")
+
+
+def store_stats(session):
+    """打包存储统计: 段文件数、文件总大小、有效数据大小，以及仍是独立文件的缩略图数"""
+    segments = get_thumbnail_store().segments()
+    live_bytes = session.query(func.sum(ThumbnailBlob.length)).scalar() or 0
+    file_bytes = sum(segments.values())
+    return {
+        'segments': len(segments),
+        'file_bytes': file_bytes,
+        'live_bytes': live_bytes,
+        'dead_ratio': round(1 - live_bytes / file_bytes, 3) if file_bytes else 0.0,
+        'loose_thumbnails': session.query(func.count(func.distinct(Thumbnail.thumbnail_path))).filter(
+            Thumbnail.thumbnail_path.notlike(f"{PACK_PREFIX}%")
+        ).scalar()
+    }
+
+
+def compact_thumbnails(Session, min_dead_ratio=COMPACT_DEAD_RATIO, batch_size=1000):
+    """
+    压缩整理：无效数据比例达到min_dead_ratio的段文件，把其中有效的数据复制到新的段文件后删除
+    其他进程正在写入的段文件跳过，返回 {'segments': 整理的段文件数, 'reclaimed_bytes': 回收的字节数}
+    """
+    store = get_thumbnail_store()
+    store.seal()
+    session = Session()
+    try:
+        live = dict(session.query(ThumbnailBlob.segment, func.sum(ThumbnailBlob.length)).group_by(
+            ThumbnailBlob.segment
+        ).all())
+    finally:
+        session.close()
+
+    compacted = 0
+    reclaimed = 0
+    for segment, size in sorted(store.segments().items()):
+        live_bytes = live.get(segment) or 0
+        if size and 1 - live_bytes / size < min_dead_ratio:
+            continue
+        if segment == store.active_segment or store.is_writing(segment):
+            continue
+
+        # 只改写仍指向旧位置的记录：整理期间同一缩略图被重新写入（扫描或命令行）时保留新的数据，
+        # 复制出的旧数据成为新段文件中的无效数据，由之后的整理回收
+        table = ThumbnailBlob.__table__
+        relocate = table.update().where(
+            table.c.id == bindparam('blob_id'),
+            table.c.segment == bindparam('old_segment'),
+            table.c.offset == bindparam('old_offset')
+        ).values(segment=bindparam('new_segment'), offset=bindparam('new_offset'))
+        session = Session()
+        try:
+            rows = session.query(ThumbnailBlob.id, ThumbnailBlob.offset, ThumbnailBlob.length).filter(
+                ThumbnailBlob.segment == segment
+            ).all()
+            for start in range(0, len(rows), batch_size):
+                chunk = rows[start:start + batch_size]
+                locations = store.append([store.read(segment, row.offset, row.length) for row in chunk])
+                session.connection().execute(relocate, [
+                    {'blob_id': row.id, 'old_segment': segment, 'old_offset': row.offset,
+                     'new_segment': new_segment, 'new_offset': offset}
+                    for row, (new_segment, offset, _) in zip(chunk, locations)
+                ])
+                session.commit()
+        except Exception as e:
+            session.rollback()
+            print(f"整理缩略图段文件失败: {segment} - {e}")
+            continue
+        finally:
+            session.close()
+
+        if store.remove_segment(segment):
+            compacted += 1
+            reclaimed += size - live_bytes
+    store.seal()
+    return {'segments': compacted, 'reclaimed_bytes': reclaimed}
+
+
+def migrate_loose_thumbnails(Session, thumbnail_dir=THUMBNAIL_ROOT, batch_size=500, progress=None):
+    """
+    把旧版本的独立缩略图文件导入打包存储，改写缩略图记录的thumbnail_path，导入后删除原文件
+    同一路径的各级文件一起导入；最后删除缩略图目录中不再被引用的独立文件
+    progress(已处理, 总数) 用于报告进度，返回 {'migrated', 'missing', 'removed_files'}
+    """
+    session = Session()
+    try:
+        paths = [row[0] for row in session.query(Thumbnail.thumbnail_path).filter(
+            Thumbnail.thumbnail_path.notlike(f"{PACK_PREFIX}%")
+        ).distinct()]
+    finally:
+        session.close()
+
+    migrated = 0
+    missing = 0
+    for start in range(0, len(paths), batch_size):
+        chunk = paths[start:start + batch_size]
+        items = {}
+        renames = []
+        for path in chunk:
+            levels = {}
+            for size in THUMBNAIL_LEVELS:
+                try:
+                    with open(thumbnail_level_path(path, size), 'rb') as f:
+                        levels[size] = f.read()
+                except OSError:
+                    continue
+            if THUMBNAIL_BASE_LEVEL not in levels:
+                # 基础级已丢失，保留原记录，由重新生成缩略图处理
+                missing += 1
+                continue
+            key = f"{PACK_PREFIX}{Path(path).stem}"
+            items[key] = levels
+            try:
+                width, height = thumbnail_dimensions(levels[THUMBNAIL_BASE_LEVEL])
+            except Exception:
+                width = height = None
+            renames.append({'old_path': path, 'new_path': key, 'width': width, 'height': height})
+
+        session = Session()
+        try:
+            totals = put_thumbnails(session, items)
+            if renames:
+                table = Thumbnail.__table__
+                session.connection().execute(
+                    table.update().where(table.c.thumbnail_path == bindparam('old_path')).values(
+                        thumbnail_path=bindparam('new_path'), file_size=bindparam('size'),
+                        width=bindparam('width'), height=bindparam('height')
+                    ),
+                    [dict(rename, size=totals.get(rename['new_path'])) for rename in renames]
+                )
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        finally:
+            session.close()
+
+        for rename in renames:
+            for level_path in thumbnail_level_paths(rename['old_path']):
+                Path(level_path).unlink(missing_ok=True)
+        migrated += len(renames)
+        if progress:
+            progress(min(start + batch_size, len(paths)), len(paths))
+
+    # 缩略图目录中没有记录引用的独立文件（如之前删除记录时残留的文件）
+    removed_files = 0
+    session = Session()
+    try:
+        remaining = {row[0] for row in session.query(Thumbnail.thumbnail_path).filter(
+            Thumbnail.thumbnail_path.notlike(f"{PACK_PREFIX}%")
+        )}
+    finally:
+        session.close()
+    referenced = {os.path.normpath(level_path) for path in remaining for level_path in thumbnail_level_paths(path)}
+    for path in Path(thumbnail_dir).glob("*.jpg"):
+        if os.path.normpath(str(path)) not in referenced:
+            path.unlink(missing_ok=True)
+            removed_files += 1
+    return {'migrated': migrated, 'missing': missing, 'removed_files': removed_files}
@@ -0,0 +1,214 @@
+"""
+目录遍历模块
+基于os.scandir的流式遍历，边遍历边产出图片文件，供扫描线程立即开始处理
+"""
+import os
+import queue
+import threading
+
+# 遍历结束标记
+_WALK_DONE = object()
+
+
+class ScanTotals:
+    """
+    扫描总数估计
+    已遍历完成的目录使用实际数量，其余目录取预估值（上次扫描数或预计数）与已发现数量的较大值
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._estimates = {}
+        self._walked = {}
+        self._finished = set()
+
+    def set_estimate(self, key, count):
+        """设置目录的预估数量（可在计数线程中调用）"""
+        with self._lock:
+            self._estimates[key] = count
+
+    def add_walked(self, key, count=1):
+        """记录目录中新发现的文件"""
+        with self._lock:
+            self._walked[key] = self._walked.get(key, 0) + count
+
+    def finish(self, key):
+        """目录遍历完成，之后使用实际数量"""
+        with self._lock:
+            self._finished.add(key)
+
+    def total(self):
+        """当前的总数估计"""
+        with self._lock:
+            keys = set(self._estimates) | set(self._walked)
+            return sum(
+                self._walked.get(key, 0) if key in self._finished
+                else max(self._estimates.get(key, 0), self._walked.get(key, 0))
+                for key in keys
+            )
+
+
+def walk_key(root, path):
+    """
+    文件在遍历顺序中的位置键，可直接比较先后
+    每个目录中先按名称处理文件，再按名称进入子目录
+    """
+    parts = os.path.relpath(path, root).split(os.sep)
+    return tuple((1, part) for part in parts[:-1]) + ((0, parts[-1]),)
+
+
+def iter_image_files(root, supported_formats, stop_event=None, recursive=True, start_after=None):
+    """
+    按固定顺序遍历目录，产出 (文件路径, stat结果)
+    忽略隐藏文件/文件夹，跳过符号链接形成的目录环路和重复的硬链接
+    recursive为False时只列出该目录下的文件；start_after为上次中断的位置，之前的文件和整棵子树都会跳过
+    """
+    cursor_key = walk_key(root, start_after) if start_after else None
+    visited_dirs = set()  # (st_dev, st_ino)，防止符号链接环路
+    seen_files = set()  # 硬链接文件只处理一次
+    stack = [(root, ())]
+
+    while stack:
+        if stop_event and stop_event.is_set():
+            return
+        current, prefix = stack.pop()
+
+        # 子树全部位于检查点之前
+        if cursor_key and prefix < cursor_key[:len(prefix)]:
+            continue
+
+        try:
+            dir_stat = os.stat(current)
+        except OSError:
+            continue
+        dir_key = (dir_stat.st_dev, dir_stat.st_ino)
+        if dir_stat.st_ino and dir_key in visited_dirs:
+            continue
+        visited_dirs.add(dir_key)
+
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    try:
+                        if entry.is_dir():
+                            if recursive:
+                                subdirs.append(entry.name)
+                            continue
+                        if entry.is_file() and \
+                                os.path.splitext(entry.name)[1].lower() in supported_formats:
+                            files.append(entry)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+        files.sort(key=lambda entry: entry.name)
+        for entry in files:
+            if cursor_key and prefix + ((0, entry.name),) <= cursor_key:
+                continue
+            try:
+                # DirEntry会缓存stat结果，后续增量比较直接复用
+                file_stat = entry.stat()
+            except OSError:
+                continue
+
+            # 硬链接和指向同一文件的符号链接只处理一次
+            if file_stat.st_nlink > 1 or entry.is_symlink():
+                file_key = (file_stat.st_dev, file_stat.st_ino or entry.inode())
+                if file_key in seen_files:
+                    continue
+                seen_files.add(file_key)
+
+            yield entry.path, file_stat
+
+        # 按名称顺序深度优先遍历子目录
+        for name in sorted(subdirs, reverse=True):
+            stack.append((os.path.join(current, name), prefix + ((1, name),)))
+
+
+def count_image_files(root, supported_formats, stop_event=None, on_progress=None, report_every=1000):
+    """
+    快速统计目录下的图片数量（只读取目录项，不stat文件），用于预估扫描总数
+    on_progress会定期收到当前的计数
+    """
+    count = 0
+    visited_dirs = set()
+    stack = [root]
+
+    while stack:
+        if stop_event and stop_event.is_set():
+            break
+        current = stack.pop()
+
+        try:
+            dir_stat = os.stat(current)
+        except OSError:
+            continue
+        dir_key = (dir_stat.st_dev, dir_stat.st_ino)
+        if dir_stat.st_ino and dir_key in visited_dirs:
+            continue
+        visited_dirs.add(dir_key)
+
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.name.startswith('.'):
+                        continue
+                    try:
+                        if entry.is_dir():
+                            stack.append(entry.path)
+                        elif os.path.splitext(entry.name)[1].lower() in supported_formats:
+                            count += 1
+                            if on_progress and count % report_every == 0:
+                                on_progress(count)
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+
+    if on_progress:
+        on_progress(count)
+    return count
+
+
+def stream_image_files(root, supported_formats, stop_event=None, maxsize=2048, recursive=True, start_after=None):
+    """
+    在后台线程中遍历目录，通过有界队列逐个产出 (文件路径, stat结果)
+    队列满时遍历线程等待，避免一次性在内存中构建完整的文件列表
+    """
+    files = queue.Queue(maxsize=maxsize)
+    cancelled = threading.Event()
+
+    def put(item):
+        # 消费者停止读取时不再阻塞
+        while not cancelled.is_set():
+            try:
+                files.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iter_image_files(root, supported_formats, stop_event, recursive, start_after):
+                if not put(item):
+                    return
+        finally:
+            put(_WALK_DONE)
+
+    producer = threading.Thread(target=produce, name="image-walker", daemon=True)
+    producer.start()
+    try:
+        while True:
+            item = files.get()
+            if item is _WALK_DONE:
+                break
+            yield item
+    finally:
+        cancelled.set()
+        producer.join(timeout=1)
@@ -0,0 +1,276 @@
+"""
+目录监视模块
+监视已注册目录的文件变化（Linux下QFileSystemWatcher基于inotify），
+不支持的挂载（网络盘等）或监视数量超出系统限制时改为定时轮询。
+变化经过防抖合并后以子目录为单位发出，交给扫描线程只同步受影响的位置。
+目录监视只报告文件的新增、删除、移动和属性变化，不报告对已有文件的原地写入（inotify目录监视没有
+IN_MODIFY/IN_CLOSE_WRITE，轮询只比较目录修改时间）：通过临时文件加重命名保存的编辑会被同步，
+原地覆盖写入的修改在下次完整扫描时同步。防抖结束时仍在复制的文件由扫描线程推迟，通过recheck()稍后再次同步
+"""
+import os
+import threading
+import time
+from PySide6.QtCore import QObject, Signal, QTimer, QFileSystemWatcher
+
+# 不支持inotify事件的文件系统类型，使用轮询
+POLLING_FILESYSTEMS = {
+    'nfs', 'nfs4', 'cifs', 'smbfs', 'smb3', '9p', 'afs', 'ncpfs',
+    'fuse.sshfs', 'fuse.rclone', 'fuse.s3fs', 'fuse.gvfsd-fuse', 'davfs', 'vboxsf', 'drvfs'
+}
+
+
+def _filesystem_type(path):
+    """读取/proc/mounts获取路径所在挂载点的文件系统类型（非Linux返回None）"""
+    try:
+        with open('/proc/mounts', encoding='utf-8') as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return None
+
+    path = os.path.realpath(path)
+    best_point, best_type = '', None
+    for mount_point, fs_type in mounts:
+        mount_point = mount_point.replace('\\040', ' ')
+        if (path == mount_point or path.startswith(os.path.join(mount_point, ''))) and \
+                len(mount_point) > len(best_point):
+            best_point, best_type = mount_point, fs_type
+    return best_type
+
+
+def _list_subdirectories(path):
+    """列出目录下的非隐藏子目录"""
+    subdirs = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if not entry.name.startswith('.') and entry.is_dir():
+                        subdirs.append(entry.path)
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return subdirs
+
+
+def _walk_directories(root):
+    """遍历目录树，返回 {目录路径: 修改时间}，跳过隐藏目录和符号链接环路"""
+    directories = {}
+    visited = set()
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            dir_stat = os.stat(current)
+        except OSError:
+            continue
+        key = (dir_stat.st_dev, dir_stat.st_ino)
+        if dir_stat.st_ino and key in visited:
+            continue
+        visited.add(key)
+        directories[current] = dir_stat.st_mtime_ns
+        stack.extend(_list_subdirectories(current))
+    return directories
+
+
+class DirectoryWatcher(QObject):
+    """
+    已注册目录的文件监视器
+    同一目录的多次事件在防抖时间内合并为一次，持续变化时最多延迟max_delay_ms
+    """
+
+    directories_changed = Signal(list)  # [(目录路径, 是否递归同步)]
+    _polled = Signal(list)  # 轮询线程发现的变化目录
+
+    def __init__(self, debounce_ms=1500, max_delay_ms=10000, poll_interval_ms=30000, parent=None):
+        super().__init__(parent)
+        self.debounce_ms = debounce_ms
+        self.max_delay_ms = max_delay_ms
+
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._on_directory_changed)
+        self._watched = set()  # 由QFileSystemWatcher监视的目录
+        self._roots = {}  # 注册目录 -> 'watch' 或 'poll'
+
+        # 轮询模式下每个注册目录的 {子目录: 修改时间} 快照
+        self._poll_snapshots = {}
+        self._poll_thread = None
+        self._poll_timer = QTimer(self)
+        self._poll_timer.setInterval(poll_interval_ms)
+        self._poll_timer.timeout.connect(self._start_poll)
+        self._polled.connect(self._on_polled)
+
+        # 待发出的变化: {目录: 是否递归}
+        self._pending = {}
+        self._pending_since = None
+        self._debounce_timer = QTimer(self)
+        self._debounce_timer.setSingleShot(True)
+        self._debounce_timer.timeout.connect(self._emit_pending)
+
+    def set_directories(self, directory_paths):
+        """设置需要监视的注册目录，新增的开始监视，移除的停止监视"""
+        roots = {os.path.normpath(path) for path in directory_paths if os.path.isdir(path)}
+
+        for root in list(self._roots):
+            if root not in roots:
+                self._unwatch_root(root)
+        for root in sorted(roots - set(self._roots)):
+            self._watch_root(root)
+
+        if any(mode == 'poll' for mode in self._roots.values()):
+            self._poll_timer.start()
+        else:
+            self._poll_timer.stop()
+
+    def recheck(self, directory_paths):
+        """稍后再次同步这些目录（其中有文件在同步时仍在写入）"""
+        for path in directory_paths:
+            self._add_pending(os.path.normpath(path), False)
+
+    def modes(self):
+        """各注册目录的监视方式"""
+        return dict(self._roots)
+
+    def stop(self):
+        """停止所有监视"""
+        self.set_directories([])
+        self._debounce_timer.stop()
+        self._pending.clear()
+
+    def _watch_root(self, root):
+        """开始监视注册目录，不支持inotify或添加失败时改为轮询"""
+        directories = _walk_directories(root)
+        if _filesystem_type(root) not in POLLING_FILESYSTEMS:
+            paths = [path for path in directories if path not in self._watched]
+            failed = set(self._watcher.addPaths(paths)) if paths else set()
+            if not failed:
+                self._watched.update(paths)
+                self._roots[root] = 'watch'
+                return
+            # 通常是超出了inotify的监视数量限制
+            added = [path for path in paths if path not in failed]
+            if added:
+                self._watcher.removePaths(added)
+            print(f"无法监视目录 {root}（{len(failed)} 个子目录添加失败），改为定时轮询")
+
+        self._roots[root] = 'poll'
+        self._poll_snapshots[root] = directories
+
+    def _unwatch_root(self, root):
+        """停止监视注册目录"""
+        mode = self._roots.pop(root)
+        self._poll_snapshots.pop(root, None)
+        if mode == 'watch':
+            prefix = os.path.join(root, '')
+            paths = [path for path in self._watched if path == root or path.startswith(prefix)]
+            if paths:
+                self._watcher.removePaths(paths)
+            self._watched.difference_update(paths)
+
+    def _on_directory_changed(self, path):
+        """inotify事件：目录内有文件新增、修改、删除或移动"""
+        path = os.path.normpath(path)
+        if os.path.isdir(path):
+            self._add_pending(path, False)
+        else:
+            # 目录本身被删除或移走，同步整棵子树
+            self._watched.discard(path)
+            self._add_pending(path, True)
+
+    def _add_pending(self, path, recursive):
+        """记录变化并重新开始防抖计时"""
+        self._pending[path] = self._pending.get(path, False) or recursive
+        now = time.monotonic()
+        if self._pending_since is None:
+            self._pending_since = now
+
+        # 持续有事件时（如正在复制大量文件）不无限推迟
+        remaining_ms = self.max_delay_ms - (now - self._pending_since) * 1000
+        self._debounce_timer.start(max(0, int(min(self.debounce_ms, remaining_ms))))
+
+    def _emit_pending(self):
+        """发出合并后的变化"""
+        pending, self._pending = self._pending, {}
+        self._pending_since = None
+
+        for path, recursive in list(pending.items()):
+            if recursive or not os.path.isdir(path):
+                continue
+            # 新出现的子目录：开始监视并递归同步；消失的子目录：递归同步以清理记录
+            prefix = os.path.join(path, '')
+            current = set(_list_subdirectories(path))
+            known = {watched for watched in self._watched
+                     if watched.startswith(prefix) and os.sep not in watched[len(prefix):]}
+            for subdir in current - known:
+                if self._is_watched_root_path(subdir):
+                    self._watch_subtree(subdir)
+                    pending[subdir] = True
+            for subdir in known - current:
+                self._watched.discard(subdir)
+                self._watcher.removePath(subdir)
+                pending[subdir] = True
+
+        # 祖先目录已递归同步时，子目录不需要单独处理
+        recursive_paths = [os.path.join(path, '') for path, recursive in pending.items() if recursive]
+        changes = [
+            (path, recursive) for path, recursive in sorted(pending.items())
+            if not any(path.startswith(prefix) for prefix in recursive_paths)
+        ]
+        if changes:
+            self.directories_changed.emit(changes)
+
+    def _is_watched_root_path(self, path):
+        """路径是否属于inotify模式的注册目录"""
+        return any(mode == 'watch' and (path == root or path.startswith(os.path.join(root, '')))
+                   for root, mode in self._roots.items())
+
+    def _watch_subtree(self, path):
+        """监视新出现的子目录树"""
+        paths = [subdir for subdir in _walk_directories(path) if subdir not in self._watched]
+        if not paths:
+            return
+        failed = set(self._watcher.addPaths(paths))
+        self._watched.update(subdir for subdir in paths if subdir not in failed)
+        if failed:
+            print(f"无法监视 {len(failed)} 个新目录，变化将在下次完整扫描时同步")
+
+    def _start_poll(self):
+        """在后台线程中遍历轮询模式的目录，避免网络盘阻塞界面"""
+        if self._poll_thread is not None and self._poll_thread.is_alive():
+            return
+        snapshots = {root: dict(snapshot) for root, snapshot in self._poll_snapshots.items()}
+        self._poll_thread = threading.Thread(target=self._poll, args=(snapshots,), name="directory-poller",
+                                             daemon=True)
+        self._poll_thread.start()
+
+    def _poll(self, snapshots):
+        """
+        比较目录修改时间找出变化的目录
+        文件新增、删除和重命名会更新所在目录的修改时间；原地修改的文件在下次完整扫描时同步
+        """
+        changes = []
+        for root, previous in snapshots.items():
+            if not os.path.isdir(root):
+                continue
+            current = _walk_directories(root)
+            for path, mtime_ns in current.items():
+                if path not in previous:
+                    changes.append((root, path, True, mtime_ns))
+                elif previous[path] != mtime_ns:
+                    changes.append((root, path, False, mtime_ns))
+            for path in previous.keys() - current.keys():
+                changes.append((root, path, True, None))
+        if changes:
+            self._polled.emit(changes)
+
+    def _on_polled(self, changes):
+        """轮询结果回到主线程：更新快照并合并变化"""
+        for root, path, recursive, mtime_ns in changes:
+            snapshot = self._poll_snapshots.get(root)
+            if snapshot is None:
+                continue  # 轮询期间目录已移除
+            if mtime_ns is None:
+                snapshot.pop(path, None)
+            else:
+                snapshot[path] = mtime_ns
+            self._add_pending(path, recursive)
@@ -7,11 +7,17 @@ from src.models.directory import Directory
 from src.models.image import Image
 from src.models.album import Album
 from src.models.thumbnail import Thumbnail
+from src.models.scan_job import ScanJob
+from src.models.scan_failure import ScanFailure
+from src.models.thumbnail_blob import ThumbnailBlob
 
 __all__ = [
     "Base",
     "Directory", 
     "Image",
     "Album",
-    "Thumbnail"
+    "Thumbnail",
+    "ScanJob",
+    "ScanFailure",
+    "ThumbnailBlob"
 ]
\ No newline at end of file
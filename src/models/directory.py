@@ -11,6 +11,8 @@ class Directory(Base):
     name = Column(String(255), nullable=False)
     is_active = Column(Boolean, default=True)
     scan_recursive = Column(Boolean, default=True)
+    last_file_count = Column(Integer)  # 上次扫描发现的图片数，用于预估进度总数
+    last_scanned_at = Column(DateTime)  # 上次完整扫描的时间
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     
@@ -24,6 +26,8 @@ class Directory(Base):
             "name": self.name,
             "is_active": self.is_active,
             "scan_recursive": self.scan_recursive,
+            "last_file_count": self.last_file_count,
+            "last_scanned_at": self.last_scanned_at.isoformat() if self.last_scanned_at else None,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
             "image_count": len(self.images)
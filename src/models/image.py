@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, Float, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, Float, Text, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from src.core.database import Base
@@ -10,6 +10,12 @@ class Image(Base):
     file_path = Column(String(500), unique=True, nullable=False, index=True)
     file_name = Column(String(255), nullable=False)
     file_size = Column(Integer)
+    file_mtime_ns = Column(Integer)  # 文件修改时间(纳秒)，用于增量扫描
+    file_inode = Column(Integer)  # 文件inode，用于增量扫描
+    content_hash = Column(String(32))  # 内容指纹：文件大小和首尾数据块的哈希
+    full_hash = Column(String(64), index=True)  # 完整内容哈希，只在内容指纹相同时计算
+    dhash = Column(String(16))  # 缩略图的64位差异哈希（十六进制）
+    phash = Column(String(16))  # 缩略图的64位感知哈希（十六进制），用于查找相似图片
     width = Column(Integer)
     height = Column(Integer)
     format = Column(String(10))
@@ -34,6 +40,7 @@ class Image(Base):
     gps_altitude = Column(Float)
     location = Column(Text)
     orientation = Column(String(50))
+    exif_orientation = Column(Integer)  # EXIF方向值（1-8），入库时缩略图已按此转正
     color_space = Column(String(20))
     white_balance = Column(String(20))
     metering_mode = Column(String(20))
@@ -48,12 +55,23 @@ class Image(Base):
     albums = relationship("Album", secondary="album_images", back_populates="images")
     thumbnail = relationship("Thumbnail", back_populates="image", uselist=False, cascade="all, delete-orphan")
     
+    __table_args__ = (
+        # 按大小+内容指纹查找可能重复的图片
+        Index('ix_images_size_content_hash', 'file_size', 'content_hash'),
+    )
+    
     def to_dict(self):
         return {
             "id": self.id,
             "file_path": self.file_path,
             "file_name": self.file_name,
             "file_size": self.file_size,
+            "file_mtime_ns": self.file_mtime_ns,
+            "file_inode": self.file_inode,
+            "content_hash": self.content_hash,
+            "full_hash": self.full_hash,
+            "dhash": self.dhash,
+            "phash": self.phash,
             "width": self.width,
             "height": self.height,
             "format": self.format,
@@ -76,6 +94,7 @@ class Image(Base):
             "gps_altitude": self.gps_altitude,
             "location": self.location,
             "orientation": self.orientation,
+            "exif_orientation": self.exif_orientation,
             "color_space": self.color_space,
             "white_balance": self.white_balance,
             "metering_mode": self.metering_mode,
@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Text
+from datetime import datetime
+from src.core.database import Base
+
+class ScanFailure(Base):
+    __tablename__ = "scan_failures"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    directory_id = Column(Integer, ForeignKey("directories.id"), nullable=False, index=True)
+    file_path = Column(String(500), unique=True, nullable=False, index=True)
+    file_size = Column(Integer)  # 失败时的文件大小，与修改时间一起作为指纹；为空表示等待重试
+    file_mtime_ns = Column(Integer)  # 失败时的文件修改时间(纳秒)
+    error_type = Column(String(100))  # 异常类名
+    error_message = Column(Text)
+    attempts = Column(Integer, default=1)  # 处理失败的次数
+    first_failed_at = Column(DateTime, default=datetime.now)
+    last_failed_at = Column(DateTime, default=datetime.now)
+    
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "directory_id": self.directory_id,
+            "file_path": self.file_path,
+            "file_size": self.file_size,
+            "file_mtime_ns": self.file_mtime_ns,
+            "error_type": self.error_type,
+            "error_message": self.error_message,
+            "attempts": self.attempts,
+            "first_failed_at": self.first_failed_at.isoformat() if self.first_failed_at else None,
+            "last_failed_at": self.last_failed_at.isoformat() if self.last_failed_at else None
+        }
@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Boolean, Text
+from datetime import datetime
+from src.core.database import Base
+
+class ScanJob(Base):
+    __tablename__ = "scan_jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    directory_id = Column(Integer, ForeignKey("directories.id"), nullable=False, index=True)
+    status = Column(String(20), nullable=False, default='running', index=True)  # running/paused/interrupted/cancelled/completed
+    incremental = Column(Boolean, default=True)  # 是否为增量扫描
+    cursor = Column(Text)  # 按遍历顺序已全部处理完成的最后一个文件路径
+    files_seen = Column(Integer, default=0)  # 检查点之前遍历到的图片数
+    files_written = Column(Integer, default=0)  # 写入数据库的图片数
+    files_failed = Column(Integer, default=0)  # 处理失败的图片数
+    started_at = Column(DateTime, default=datetime.now)
+    updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
+    finished_at = Column(DateTime)
+    
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "directory_id": self.directory_id,
+            "status": self.status,
+            "incremental": self.incremental,
+            "cursor": self.cursor,
+            "files_seen": self.files_seen,
+            "files_written": self.files_written,
+            "files_failed": self.files_failed,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
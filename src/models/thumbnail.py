@@ -12,6 +12,9 @@ class Thumbnail(Base):
     width = Column(Integer, default=150)  # 缩略图宽度
     height = Column(Integer, default=150)  # 缩略图高度
     file_size = Column(Integer)  # 文件大小(字节)
+    source = Column(String(20), default='decoded')  # 来源: embedded(内嵌缩略图) / decoded(解码原图)
+    generator_version = Column(Integer)  # 生成缩略图的逻辑版本（尺寸、编码参数、方向处理），旧记录为空
+    source_fingerprint = Column(String(50))  # 生成时原图的指纹（大小:修改时间纳秒）
     created_at = Column(DateTime, default=datetime.now)
     updated_at = Column(DateTime, default=datetime.now, onupdate=datetime.now)
     
@@ -26,6 +29,9 @@ class Thumbnail(Base):
             "width": self.width,
             "height": self.height,
             "file_size": self.file_size,
+            "source": self.source,
+            "generator_version": self.generator_version,
+            "source_fingerprint": self.source_fingerprint,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None
         }
\ No newline at end of file
@@ -0,0 +1,26 @@
+from sqlalchemy import Column, Integer, String, Index
+from src.core.database import Base
+
+class ThumbnailBlob(Base):
+    __tablename__ = "thumbnail_blobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    key = Column(String(100), nullable=False)  # 与Thumbnail.thumbnail_path相同的存储键（pack:开头）
+    level = Column(Integer, nullable=False)  # 缩略图级别（长边像素）
+    segment = Column(Integer, nullable=False, index=True)  # 段文件编号
+    offset = Column(Integer, nullable=False)  # 在段文件中的偏移
+    length = Column(Integer, nullable=False)  # JPEG数据长度
+    
+    __table_args__ = (
+        Index('ix_thumbnail_blobs_key_level', 'key', 'level', unique=True),
+    )
+    
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "key": self.key,
+            "level": self.level,
+            "segment": self.segment,
+            "offset": self.offset,
+            "length": self.length
+        }
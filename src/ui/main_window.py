@@ -5,6 +5,8 @@
 
 import sys
 import os
+import time
+import math
 from pathlib import Path
 import json
 
@@ -15,28 +17,39 @@ sys.path.insert(0, str(project_root))
 from PySide6.QtWidgets import (QApplication, QMainWindow, QFileDialog, 
                               QMessageBox, QTreeWidgetItem, QMenu, QProgressBar, QLabel,
                               QListView, QDialog, QVBoxLayout, QHBoxLayout, QPushButton,
-                              QScrollArea)
+                              QScrollArea, QToolButton, QTableWidget, QTableWidgetItem,
+                              QAbstractItemView, QHeaderView)
 from PySide6.QtCore import Qt, QThread, Signal, QTimer, QSize
 from PySide6.QtGui import (QPixmap, QImage, QPainter, QFont, QFontDatabase,
                            QStandardItemModel, QStandardItem, QKeySequence, QTransform,
                            QShortcut)
-import PySide6.QtGui as QtGui
 from src.core.scanner_thread import ImageScannerThread
+from src.core.watcher import DirectoryWatcher
+from src.core.throttle import IOThrottle
+from src.core.duplicates import find_duplicate_groups, duplicate_summary
+from src.core.batch_writer import remove_unreferenced_thumbnails
+from src.core.similarity import load_similarity_index, find_similar_images, DEFAULT_MAX_DISTANCE
+from src.core.quarantine import list_failures, retry_failures
+from src.core.thumbnail_cache import get_thumbnail_cache, DEFAULT_CACHE_MB
+from src.core.thumbnails import choose_thumbnail_level, load_thumbnail_level
+from src.ui.thumbnail_model import ThumbnailListModel, FILE_PATH_ROLE
 from PySide6.QtUiTools import QUiLoader
 from PySide6.QtCore import QFile, QIODevice
 import qtawesome as qta
+from sqlalchemy import func, or_
 
 from src.core.initializer import DatabaseInitializer
 from src.core.database import get_db
 from src.models.directory import Directory
 from src.models.image import Image
 from src.models.thumbnail import Thumbnail
+from src.models.scan_failure import ScanFailure
 
 from PySide6.QtWidgets import (QMainWindow, QApplication, QFileDialog, QMessageBox, 
                               QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QScrollArea, 
                               QDialog, QListWidgetItem, QTreeWidgetItem, QProgressDialog)
 from PySide6.QtCore import Qt, QThread, Signal, QDir, QTimer, QSettings, QSize, QUrl, QEvent
-from PySide6.QtGui import QPixmap, QImage, QIcon, QFont, QShortcut, QTransform, QImageReader, QImageIOHandler
+from PySide6.QtGui import QPixmap, QImage, QIcon, QFont, QShortcut, QTransform, QImageReader
 
 
 class ImagePreviewWindow(QDialog):
@@ -143,11 +156,11 @@ class ImagePreviewWindow(QDialog):
         """加载图片"""
         try:
             if os.path.exists(self.image_path):
-                # 使用QImage加载图片以获取EXIF信息
-                image = QImage(self.image_path)
+                # 按EXIF方向（含镜像）转正后显示，rotation_angle只记录用户的旋转
+                reader = QImageReader(self.image_path)
+                reader.setAutoTransform(True)
+                image = reader.read()
                 if not image.isNull():
-                    # 获取并应用正确的旋转方向
-                    self.apply_rotation_from_exif(image)
                     self.original_pixmap = QPixmap.fromImage(image)
                     if not self.original_pixmap.isNull():
                         # 默认适应窗口大小
@@ -161,37 +174,6 @@ class ImagePreviewWindow(QDialog):
         except Exception as e:
             QMessageBox.warning(self, "错误", f"加载图片失败: {str(e)}")
             
-    def apply_rotation_from_exif(self, image):
-        """根据EXIF信息应用正确的旋转方向"""
-        try:
-            # 使用QImageReader读取EXIF信息
-            from PySide6.QtGui import QImageReader
-            
-            reader = QImageReader(self.image_path)
-            if reader.canRead():
-                # 获取图片的变换信息（包括旋转）
-                transform = reader.transformation()
-                
-                # 根据变换类型应用旋转
-                if transform == QImageIOHandler.TransformationRotate90:
-                    self.rotation_angle = 90
-                elif transform == QImageIOHandler.TransformationRotate180:
-                    self.rotation_angle = 180
-                elif transform == QImageIOHandler.TransformationRotate270:
-                    self.rotation_angle = 270
-                else:
-                    self.rotation_angle = 0
-                    
-                # 应用旋转到QImage
-                if self.rotation_angle != 0:
-                    transform_matrix = QTransform()
-                    transform_matrix.rotate(self.rotation_angle)
-                    image = image.transformed(transform_matrix, Qt.SmoothTransformation)
-                    
-        except Exception as e:
-            print(f"应用旋转时出错: {e}")
-            self.rotation_angle = 0
-            
     def wheelEvent(self, event):
         """处理鼠标滚轮事件"""
         if event.modifiers() & Qt.ControlModifier:
@@ -264,14 +246,107 @@ class ImagePreviewWindow(QDialog):
                 print(f"更新图片显示时出错: {e}")
 
 
+class ScanFailuresDialog(QDialog):
+    """处理失败（已隔离）的文件列表，可选择重试"""
+    
+    def __init__(self, directory_id=None, title="处理失败的文件", parent=None):
+        super().__init__(parent)
+        self.directory_id = directory_id
+        self.retry_directories = []  # 重试后需要重新扫描的注册目录
+        
+        self.setWindowTitle(title)
+        self.resize(900, 500)
+        
+        layout = QVBoxLayout()
+        self.summary_label = QLabel()
+        layout.addWidget(self.summary_label)
+        
+        self.table = QTableWidget(0, 5)
+        self.table.setHorizontalHeaderLabels(["文件", "错误类型", "错误信息", "失败次数", "最后失败时间"])
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.table.verticalHeader().setVisible(False)
+        layout.addWidget(self.table)
+        
+        buttons_layout = QHBoxLayout()
+        buttons_layout.addStretch()
+        retry_selected_btn = QPushButton("重试所选")
+        retry_selected_btn.clicked.connect(self.retry_selected)
+        buttons_layout.addWidget(retry_selected_btn)
+        retry_all_btn = QPushButton("全部重试")
+        retry_all_btn.clicked.connect(self.retry_all)
+        buttons_layout.addWidget(retry_all_btn)
+        close_btn = QPushButton("关闭")
+        close_btn.clicked.connect(self.reject)
+        buttons_layout.addWidget(close_btn)
+        layout.addLayout(buttons_layout)
+        self.setLayout(layout)
+        
+        self.load_failures()
+    
+    def load_failures(self):
+        """从数据库加载隔离的文件"""
+        with next(get_db()) as db:
+            failures = list_failures(db, self.directory_id)
+        
+        self.table.setRowCount(len(failures))
+        for row, failure in enumerate(failures):
+            path_item = QTableWidgetItem(failure.file_path)
+            path_item.setData(Qt.ItemDataRole.UserRole, failure.id)
+            path_item.setToolTip(failure.file_path)
+            self.table.setItem(row, 0, path_item)
+            self.table.setItem(row, 1, QTableWidgetItem(failure.error_type or ""))
+            message_item = QTableWidgetItem(failure.error_message or "")
+            message_item.setToolTip(failure.error_message or "")
+            self.table.setItem(row, 2, message_item)
+            self.table.setItem(row, 3, QTableWidgetItem(str(failure.attempts or 0)))
+            last_failed = failure.last_failed_at.strftime("%Y-%m-%d %H:%M") if failure.last_failed_at else ""
+            self.table.setItem(row, 4, QTableWidgetItem(last_failed))
+        self.table.resizeColumnsToContents()
+        self.table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.summary_label.setText(f"共 {len(failures)} 个文件处理失败，文件没有变化时扫描会跳过它们")
+    
+    def retry_selected(self):
+        """重试选中的文件"""
+        failure_ids = [self.table.item(index.row(), 0).data(Qt.ItemDataRole.UserRole)
+                       for index in self.table.selectionModel().selectedRows()]
+        if failure_ids:
+            self._retry(failure_ids)
+    
+    def retry_all(self):
+        """重试列表中的全部文件"""
+        if self.table.rowCount():
+            self._retry(None)
+    
+    def _retry(self, failure_ids):
+        with next(get_db()) as db:
+            self.retry_directories = retry_failures(db, failure_ids, self.directory_id)
+        self.accept()
+
+
 class MainWindow(QMainWindow):
     """主应用窗口"""
     
+    # display.thumbnail_size 的预设值（逻辑像素），也可以直接配置数字
+    THUMBNAIL_DISPLAY_SIZES = {'small': 100, 'medium': 150, 'large': 220}
+    PREVIEW_THUMBNAIL_LEVEL = 512  # 预览区使用的缩略图级别
+    
     def __init__(self):
         super().__init__()
         self.ui = None
         self.scanner_thread = None
+        self.scan_started_at = None
+        self.last_scan_stats = {}
         self.thumbnail_model = None
+        self.directory_watcher = None
+        self.pending_directory_changes = {}  # 文件监视器发现、等待同步的目录: {路径: 是否递归}
+        self.current_view_loader = self._load_all_photos  # 重新加载当前缩略图视图
+        self.current_directory_path = None  # 当前查看的目录（查看全部照片等时为None）
+        self.user_busy = False  # 用户正在滚动或预览，自适应模式下扫描限速
+        self.previewing = False
+        self.throttle_mode = 'adaptive'
+        self.similarity_index = None  # 感知哈希索引，第一次查找相似图片时构建，扫描后失效
         
         # 初始化
         self._init_ui()
@@ -282,6 +357,7 @@ class MainWindow(QMainWindow):
         self._setup_thumbnail_view()
         self._start_background_scan()
         self._load_all_photos()
+        self._setup_directory_watcher()
         
     def _init_ui(self):
         """初始化UI"""
@@ -303,14 +379,17 @@ class MainWindow(QMainWindow):
         nav_items = [
             ('fa5s.image', '全部照片'),
             ('fa5s.star', '收藏夹'), 
-            ('fa5s.folder', '相册')
+            ('fa5s.folder', '相册'),
+            ('fa5s.clone', '重复图片')
         ]
         
         for i, (icon, tooltip) in enumerate(nav_items):
-            if i < self.ui.listWidget_main_nav.count():
-                item = self.ui.listWidget_main_nav.item(i)
-                item.setIcon(qta.icon(icon, color='#ecf0f1'))
-                item.setToolTip(tooltip)
+            if i >= self.ui.listWidget_main_nav.count():
+                # UI文件中没有的导航项
+                self.ui.listWidget_main_nav.addItem(QListWidgetItem(tooltip))
+            item = self.ui.listWidget_main_nav.item(i)
+            item.setIcon(qta.icon(icon, color='#ecf0f1'))
+            item.setToolTip(tooltip)
     
     def _setup_button_icons(self):
         """设置按钮图标"""
@@ -387,13 +466,20 @@ class MainWindow(QMainWindow):
     def _setup_thumbnail_view(self):
         """设置缩略图视图"""
         # 创建模型
-        self.thumbnail_model = QStandardItemModel()
+        # 虚拟化模型只保存已加载行的ID和路径，图标在绘制时按需解析
+        self.thumbnail_display_size = self._get_thumbnail_display_size()
+        size = self.thumbnail_display_size
+        self.thumbnail_cache = get_thumbnail_cache()
+        self.thumbnail_cache.set_max_bytes(self._get_thumbnail_cache_bytes())
+        self.thumbnail_model = ThumbnailListModel(self)
+        self.thumbnail_model.set_thumbnail_level(self._grid_thumbnail_level())
         self.ui.thum_body.setModel(self.thumbnail_model)
         
-        # 设置视图属性
+        # 设置视图属性，图标大小来自 display.thumbnail_size
         self.ui.thum_body.setViewMode(QListView.IconMode)
-        self.ui.thum_body.setIconSize(QSize(150, 150))
-        self.ui.thum_body.setGridSize(QSize(170, 200))
+        self.ui.thum_body.setUniformItemSizes(True)
+        self.ui.thum_body.setIconSize(QSize(size, size))
+        self.ui.thum_body.setGridSize(QSize(size + 20, size + 50))
         self.ui.thum_body.setSpacing(10)
         self.ui.thum_body.setMovement(QListView.Static)
         self.ui.thum_body.setResizeMode(QListView.Adjust)
@@ -421,6 +507,57 @@ class MainWindow(QMainWindow):
                 background-color: #e3f2fd;
             }
         """)
+        
+        # 网格刷新和可见区域优先处理都做合并，避免频繁触发
+        self.grid_reload_timer = QTimer(self)
+        self.grid_reload_timer.setSingleShot(True)
+        self.grid_reload_timer.setInterval(1000)
+        self.grid_reload_timer.timeout.connect(lambda: self.current_view_loader and self.current_view_loader())
+        
+        self.visible_priority_timer = QTimer(self)
+        self.visible_priority_timer.setSingleShot(True)
+        self.visible_priority_timer.setInterval(200)
+        self.visible_priority_timer.timeout.connect(self._prioritize_visible_thumbnails)
+        self.ui.thum_body.verticalScrollBar().valueChanged.connect(self.visible_priority_timer.start)
+        self.ui.thum_body.verticalScrollBar().valueChanged.connect(self._on_grid_scrolled)
+        self.ui.thum_body.verticalScrollBar().valueChanged.connect(self._mark_user_activity)
+    
+    def _visible_row_range(self):
+        """网格中可见的首行和末行，没有可见项时返回None"""
+        view = self.ui.thum_body
+        viewport = view.viewport().rect()
+        first = view.indexAt(viewport.topLeft())
+        last = view.indexAt(viewport.bottomRight())
+        if not first.isValid():
+            return None
+        last_row = last.row() if last.isValid() else self.thumbnail_model.rowCount() - 1
+        return first.row(), last_row
+    
+    def _on_grid_scrolled(self):
+        """滚动时取消已经滚出可见范围的缩略图加载请求"""
+        visible = self._visible_row_range()
+        if visible is not None:
+            self.thumbnail_model.set_visible_range(*visible)
+    
+    def _prioritize_visible_thumbnails(self):
+        """扫描进行中时，请求优先处理网格中可见的图片"""
+        if self.scanner_thread is None or not self.scanner_thread.isRunning():
+            return
+        visible = self._visible_row_range()
+        if visible is None:
+            return
+        paths = [self.thumbnail_model.row_data(row).file_path for row in range(visible[0], visible[1] + 1)]
+        self.scanner_thread.prioritize([path for path in paths if path])
+    
+    def _on_directory_indexed(self, directory_path):
+        """优先扫描的目录有新记录，正在查看该目录时刷新网格"""
+        current = self.current_directory_path
+        if not current:
+            return
+        current = os.path.normpath(current)
+        if current == directory_path or current.startswith(os.path.join(directory_path, '')) \
+                or directory_path.startswith(os.path.join(current, '')):
+            self.grid_reload_timer.start()
     
     def _init_connections(self):
         """初始化信号连接"""
@@ -445,6 +582,8 @@ class MainWindow(QMainWindow):
         if hasattr(self.ui, 'thum_body'):
             self.ui.thum_body.clicked.connect(self._on_thumbnail_clicked)
             self.ui.thum_body.doubleClicked.connect(self._on_thumbnail_double_clicked)
+            self.ui.thum_body.setContextMenuPolicy(Qt.ContextMenuPolicy.CustomContextMenu)
+            self.ui.thum_body.customContextMenuRequested.connect(self._show_thumbnail_context_menu)
     
     def _init_window(self):
         """初始化窗口"""
@@ -464,6 +603,51 @@ class MainWindow(QMainWindow):
         except Exception:
             pass
     
+    def _load_scanner_settings(self):
+        """加载扫描器配置"""
+        try:
+            config_file = Path(__file__).parent.parent.parent / "config" / "settings.json"
+            if config_file.exists():
+                with open(config_file, 'r', encoding='utf-8') as f:
+                    return json.load(f).get('scanner', {})
+        except Exception:
+            pass
+        return {}
+    
+    def _create_scanner_thread(self, directory_paths, incremental=True, changed_directories=None,
+                               thumbnails_only=False):
+        """按配置创建扫描线程"""
+        settings = self._load_scanner_settings()
+        self.scan_started_at = time.monotonic()
+        throttle_settings = settings.get('throttle', {})
+        thread = ImageScannerThread(
+            directory_paths,
+            incremental=incremental,
+            workers=settings.get('workers') or None,  # 0或未配置时使用CPU核心数
+            batch_size=settings.get('batch_size', 200),
+            batch_interval_ms=settings.get('batch_interval_ms', 500),
+            embedded_thumbnails=settings.get('embedded_thumbnails', False),
+            changed_directories=changed_directories,
+            throttle=IOThrottle(
+                files_per_second=throttle_settings.get('files_per_second', 20),
+                bytes_per_second=throttle_settings.get('mb_per_second', 16) * 1024 * 1024
+            ),
+            low_priority=throttle_settings.get('low_priority', True),
+            progress_interval_ms=settings.get('progress_interval_ms', 100),
+            thumbnails_only=thumbnails_only,
+            # 修改时间在防抖时间以内的文件可能仍在写入
+            settle_ms=self._load_watcher_settings().get('debounce_ms', 1500)
+        )
+        self.throttle_mode = throttle_settings.get('mode', 'adaptive')  # adaptive / always / off
+        thread.set_throttled(self._should_throttle())
+        thread.scan_paused.connect(self._on_scan_paused)
+        thread.rates_updated.connect(self._on_scan_rates)
+        thread.directory_indexed.connect(self._on_directory_indexed)
+        # 重新生成的缩略图替换网格中显示的旧版本
+        thread.thumbnails_updated.connect(self.thumbnail_model.refresh_thumbnails)
+        thread.finished.connect(self._on_scanner_finished)
+        return thread
+    
     def _save_window_state(self):
         """保存窗口状态"""
         try:
@@ -494,11 +678,14 @@ class MainWindow(QMainWindow):
         nav_map = {
             "全部照片": self._load_all_photos,
             "收藏夹": self._load_favorites,
-            "相册": self._load_albums
+            "相册": self._load_albums,
+            "重复图片": self._load_duplicates
         }
         
         action = nav_map.get(nav_text)
         if action:
+            self.current_view_loader = action
+            self.current_directory_path = None
             action()
             
         # 更新标签显示
@@ -551,19 +738,27 @@ class MainWindow(QMainWindow):
         self.progress_bar.setVisible(True)
         
         # 创建并启动扫描线程
-        self.scanner_thread = ImageScannerThread([directory_path])
+        self.scanner_thread = self._create_scanner_thread([directory_path])
+        self._set_scan_controls_visible(True)
         self.scanner_thread.progress_updated.connect(self._on_scan_progress)
         self.scanner_thread.scan_completed.connect(
             lambda count: self._on_single_scan_completed(count, dir_name)
         )
         self.scanner_thread.scan_error.connect(self._on_scan_error)
+        self.scanner_thread.scan_failures.connect(self._on_scan_failures)
+        self.scanner_thread.scan_stats.connect(self._on_scan_stats)
+        self.scanner_thread.thumbnails_refined.connect(self._on_thumbnails_refined)
         self.scanner_thread.start()
         
     def _on_single_scan_completed(self, count, dir_name):
         """单个目录扫描完成"""
         self.progress_bar.setVisible(False)
+        if self.scanner_thread is not None and self.scanner_thread.is_stopped():
+            self.status_label.setText(f"扫描已停止：{dir_name} (已处理 {count} 张图片)")
+            return
         self.status_label.setText(f"扫描完成：{dir_name} ({count} 张图片)")
-        QMessageBox.information(self, "扫描完成", f"目录 {dir_name} 扫描完成，共发现 {count} 张图片")
+        QMessageBox.information(self, "扫描完成", f"目录 {dir_name} 扫描完成，共发现 {count} 张图片\n\n"
+                                                  f"{self._format_scan_counters(self.last_scan_stats)}")
     
     def _load_directories(self):
         """从数据库加载目录到TreeWidget，包含子目录"""
@@ -632,38 +827,124 @@ class MainWindow(QMainWindow):
     def _refresh_directories(self):
         """刷新目录显示"""
         self._load_directories()
+        self._update_watched_directories()
     
     def _refresh_data(self):
-        """刷新数据 - 重新生成缩略图"""
+        """刷新数据 - 在后台重新生成过期或缺失的缩略图"""
         reply = QMessageBox.question(
             self, "确认刷新", 
-            "确定要重新生成所有缩略图吗？\n\n"
-            "这将删除现有缩略图并重新生成，\n"
-            "可以修复图片方向显示问题。",
+            "确定要重新生成缩略图吗？\n\n"
+            "将在后台重新生成缺失、过期（生成方式已更新或原图已修改）的缩略图，\n"
+            "替换完成前仍显示现有缩略图。",
             QMessageBox.Yes | QMessageBox.No,
             QMessageBox.No
         )
         
         if reply == QMessageBox.Yes:
+            if self.scanner_thread is not None and self.scanner_thread.isRunning():
+                QMessageBox.information(self, "提示", "扫描正在进行，请等待完成后再重新生成缩略图")
+                return
             try:
-                # 删除现有缩略图文件和记录
-                import shutil
-                thumbnails_dir = Path("thumbnails")
-                if thumbnails_dir.exists():
-                    shutil.rmtree(thumbnails_dir)
-                
-                # 删除数据库中的缩略图记录
-                with next(get_db()) as db:
-                    db.query(Thumbnail).delete()
-                    db.commit()
-                
-                # 重新扫描图片
-                self._start_background_scan()
-                QMessageBox.information(self, "提示", "正在重新生成缩略图，请稍候...")
-                
+                self._start_background_scan(thumbnails_only=True)
             except Exception as e:
                 QMessageBox.warning(self, "错误", f"刷新失败: {str(e)}")
     
+    def _load_watcher_settings(self):
+        """加载文件监视配置"""
+        try:
+            config_file = Path(__file__).parent.parent.parent / "config" / "settings.json"
+            if config_file.exists():
+                with open(config_file, 'r', encoding='utf-8') as f:
+                    return json.load(f).get('watcher', {})
+        except Exception:
+            pass
+        return {}
+    
+    def _setup_directory_watcher(self):
+        """
+        监视已注册目录的文件变化，自动同步新增、删除、移动和通过重命名保存的图片
+        原地覆盖写入已有文件不产生目录事件，这类修改在下次完整扫描时同步
+        """
+        settings = self._load_watcher_settings()
+        if not settings.get('enabled', True):
+            return
+        
+        self.directory_watcher = DirectoryWatcher(
+            debounce_ms=settings.get('debounce_ms', 1500),
+            max_delay_ms=settings.get('max_delay_ms', 10000),
+            poll_interval_ms=settings.get('poll_interval_ms', 30000),
+            parent=self
+        )
+        self.directory_watcher.directories_changed.connect(self._on_directories_changed)
+        self._update_watched_directories()
+    
+    def _update_watched_directories(self):
+        """按数据库中的活跃目录更新监视列表"""
+        if self.directory_watcher is None:
+            return
+        try:
+            with next(get_db()) as db:
+                directories = db.query(Directory).filter(Directory.is_active == True).all()
+                self.directory_watcher.set_directories([d.path for d in directories])
+        except Exception as e:
+            print(f"更新目录监视失败: {e}")
+    
+    def _on_directories_changed(self, changes):
+        """文件监视器发现变化，合并后同步"""
+        for path, recursive in changes:
+            self.pending_directory_changes[path] = self.pending_directory_changes.get(path, False) or recursive
+        self._start_pending_sync()
+    
+    def _start_pending_sync(self):
+        """同步文件监视器积累的变化（已有扫描在运行时等其结束）"""
+        if not self.pending_directory_changes:
+            return
+        if self.scanner_thread is not None and self.scanner_thread.isRunning():
+            return
+        
+        changes = sorted(self.pending_directory_changes.items())
+        self.pending_directory_changes = {}
+        try:
+            with next(get_db()) as db:
+                directories = db.query(Directory).filter(Directory.is_active == True).all()
+                directory_paths = [d.path for d in directories]
+        except Exception as e:
+            print(f"同步目录变化失败: {e}")
+            return
+        
+        self.scanner_thread = self._create_scanner_thread(directory_paths, changed_directories=changes)
+        self.scanner_thread.scan_error.connect(lambda error_msg: print(error_msg))
+        self.scanner_thread.scan_failures.connect(
+            lambda failures, total: print(f"同步目录变化时 {total} 个文件处理失败，如: {failures[0][0]} - {failures[0][1]}")
+        )
+        self.scanner_thread.scan_stats.connect(self._on_watch_sync_stats)
+        if self.directory_watcher is not None:
+            self.scanner_thread.files_unsettled.connect(self.directory_watcher.recheck)
+        self.scanner_thread.thumbnails_refined.connect(self._on_thumbnails_refined)
+        self.scanner_thread.start()
+    
+    def _on_watch_sync_stats(self, stats):
+        """目录变化同步完成，有图片增删时刷新当前视图"""
+        self.last_scan_stats = stats
+        processed = stats.get('records', 0)  # 实际写入的记录，不含未变化而跳过的文件
+        removed = stats.get('removed', 0)
+        if not processed and not removed:
+            return
+        self.status_label.setText(f"已同步目录变化：新增或更新 {processed} 张，移除 {removed} 张")
+        if self.current_view_loader:
+            self.current_view_loader()
+    
+    def _load_duplicates(self):
+        """加载内容相同的重复图片，同一组的副本相邻显示"""
+        self._update_status("显示重复图片")
+        try:
+            with next(get_db()) as db:
+                image_ids = [image.id for group in find_duplicate_groups(db) for image in group]
+            self.thumbnail_model.set_image_ids(image_ids)
+        except Exception as e:
+            print(f"加载重复图片失败: {e}")
+            self.thumbnail_model.clear()
+    
     def _load_all_photos(self):
         """加载所有照片"""
         self._update_status("显示所有照片")
@@ -685,6 +966,7 @@ class MainWindow(QMainWindow):
     def _update_photo_count(self, nav_text):
         """根据导航类型更新图片数量"""
         try:
+            self.ui.label_photo_count.setToolTip("")
             with next(get_db()) as db:
                 if nav_text == "全部照片":
                     count = db.query(Image).count()
@@ -693,6 +975,13 @@ class MainWindow(QMainWindow):
                 elif nav_text == "相册":
                     # 这里可能需要根据相册逻辑调整
                     count = 0  # 暂时返回0，后续实现相册功能
+                elif nav_text == "重复图片":
+                    summary = duplicate_summary(db)
+                    count = summary['images']
+                    self.ui.label_photo_count.setToolTip(
+                        f"{summary['groups']} 组重复，多余副本 {summary['redundant_copies']} 张，"
+                        f"可节省 {summary['reclaimable_bytes'] / (1024 * 1024):.1f} MB"
+                    )
                 else:
                     count = 0
                 
@@ -708,13 +997,9 @@ class MainWindow(QMainWindow):
             normalized_path = os.path.normpath(str(directory_path))
             
             with next(get_db()) as db:
-                # 使用路径前缀匹配来获取目录及其子目录的所有图片
-                search_pattern = f"{normalized_path}%"
-                images = db.query(Image).filter(
-                    Image.file_path.like(search_pattern)
-                ).all()
-                
-                count = len(images) if images else 0
+                count = db.query(func.count(Image.id)).filter(
+                    self._directory_condition(db, normalized_path)
+                ).scalar()
                 self.ui.label_photo_count.setText(f"{count} 张照片")
         except Exception as e:
             print(f"更新目录图片数量失败: {e}")
@@ -734,11 +1019,11 @@ class MainWindow(QMainWindow):
 
     def _load_thumbnails_for_all(self):
         """加载所有照片的缩略图"""
-        self._load_thumbnails_from_query(lambda db: db.query(Image).all())
+        self.thumbnail_model.set_query(None)
 
     def _load_thumbnails_for_favorites(self):
         """加载收藏照片的缩略图"""
-        self._load_thumbnails_from_query(lambda db: db.query(Image).filter(Image.is_favorite == True).all())
+        self.thumbnail_model.set_query(Image.is_favorite == True)
 
     def _load_thumbnails_for_albums(self):
         """加载相册的缩略图"""
@@ -748,108 +1033,26 @@ class MainWindow(QMainWindow):
     def _load_thumbnails_for_directory(self, directory_path):
         """加载指定目录及其子目录的缩略图"""
         try:
-            import os
             normalized_path = os.path.normpath(str(directory_path))
             
             with next(get_db()) as db:
-                # 使用路径前缀匹配来获取目录及其子目录的所有图片
-                search_pattern = f"{normalized_path}%"
-                images = db.query(Image).filter(
-                    Image.file_path.like(search_pattern)
-                ).all()
-                
-                if images:
-                    self._display_thumbnails(images)
-                else:
-                    # 如果没有找到图片，检查是否是已注册的目录
-                    directory = db.query(Directory).filter(Directory.path == normalized_path).first()
-                    if directory:
-                        # 获取该目录的图片
-                        images = db.query(Image).filter(Image.directory_id == directory.id).all()
-                        self._display_thumbnails(images)
-                    else:
-                        self.thumbnail_model.clear()
+                condition = self._directory_condition(db, normalized_path)
+            self.thumbnail_model.set_query(condition)
         except Exception as e:
             print(f"加载目录缩略图失败: {e}")
             self.thumbnail_model.clear()
-
-    def _load_thumbnails_from_query(self, query_func):
-        """从查询函数加载缩略图"""
-        try:
-            with next(get_db()) as db:
-                images = query_func(db)
-                self._display_thumbnails(images)
-        except Exception as e:
-            print(f"加载缩略图失败: {e}")
-            self.thumbnail_model.clear()
-
-    def _get_rotation_angle(self, orientation_str):
-        """根据EXIF方向信息获取旋转角度"""
-        if not orientation_str:
-            return 0
-            
-        orientation_map = {
-            'Horizontal (normal)': 0,
-            'Rotate 90 CW': 90,
-            'Rotate 180': 180,
-            'Rotate 270 CW': 270,
-            'Mirror horizontal': 0,  # 不处理镜像
-            'Mirror vertical': 0,      # 不处理镜像
-            'Mirror horizontal and rotate 270 CW': 0,  # 不处理镜像
-            'Mirror horizontal and rotate 90 CW': 0    # 不处理镜像
-        }
-        
-        return orientation_map.get(orientation_str, 0)
-    
-    def _rotate_pixmap(self, pixmap, angle):
-        """旋转QPixmap"""
-        if angle == 0:
-            return pixmap
-            
-        transform = QtGui.QTransform()
-        transform.rotate(angle)
-        return pixmap.transformed(transform, Qt.TransformationMode.SmoothTransformation)
     
-    def _display_thumbnails(self, images):
-        """显示缩略图（带方向修正）"""
-        self.thumbnail_model.clear()
-        
-        for image in images:
-            try:
-                # 获取缩略图路径
-                with next(get_db()) as db:
-                    thumbnail = db.query(Thumbnail).filter(Thumbnail.image_id == image.id).first()
-                    thumbnail_path = thumbnail.thumbnail_path if thumbnail else None
-                
-                if thumbnail_path and os.path.exists(thumbnail_path):
-                    # 创建缩略图项
-                    item = QStandardItem()
-                    
-                    # 加载缩略图
-                    pixmap = QPixmap(thumbnail_path)
-                    if not pixmap.isNull():
-                        # 根据EXIF方向信息旋转缩略图
-                        rotation_angle = self._get_rotation_angle(image.orientation)
-                        if rotation_angle != 0:
-                            pixmap = self._rotate_pixmap(pixmap, rotation_angle)
-                        item.setIcon(pixmap)
-                    else:
-                        # 如果缩略图加载失败，使用占位符
-                        item.setIcon(qta.icon('fa5s.image', color='#95a5a6', scale_factor=1.5))
-                else:
-                    # 没有缩略图，使用占位符
-                    item.setIcon(qta.icon('fa5s.image', color='#95a5a6', scale_factor=1.5))
-                
-                # 设置文件名作为文本
-                item.setText(image.file_name)
-                item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
-                item.setData(image.file_path, Qt.ItemDataRole.UserRole)  # 存储完整路径
-                item.setData(image.id, Qt.ItemDataRole.UserRole + 1)  # 存储图片ID
-                
-                self.thumbnail_model.appendRow(item)
-                
-            except Exception as e:
-                print(f"加载缩略图项失败: {e}")
+    def _directory_condition(self, db, normalized_path):
+        """
+        目录及其子目录中图片的查询条件：路径前缀匹配，已注册的目录同时按目录ID匹配
+        前缀包含路径分隔符（/photos/2020 不匹配 /photos/2020-backup），路径中的%和_按字面匹配
+        """
+        condition = or_(Image.file_path.startswith(os.path.join(normalized_path, ''), autoescape=True),
+                        Image.file_path == normalized_path)
+        directory = db.query(Directory).filter(Directory.path == normalized_path).first()
+        if directory:
+            condition = or_(condition, Image.directory_id == directory.id)
+        return condition
     
     def _open_settings(self):
         """打开设置"""
@@ -879,8 +1082,16 @@ class MainWindow(QMainWindow):
             
             # 更新标签显示
             self.ui.label_gridstate.setText(directory_name)
-            self._update_photo_count_for_directory(str(directory_path))
-            self._load_thumbnails_for_directory(str(directory_path))
+            self.current_view_loader = lambda path=str(directory_path): (
+                self._update_photo_count_for_directory(path),
+                self._load_thumbnails_for_directory(path)
+            )
+            self.current_directory_path = str(directory_path)
+            self.current_view_loader()
+            
+            # 扫描进行中时优先扫描该目录，扫描到的图片会陆续出现在网格中
+            if self.scanner_thread is not None and self.scanner_thread.isRunning():
+                self.scanner_thread.prioritize(str(directory_path))
     
     def _show_directory_context_menu(self, position):
         """显示目录右键菜单"""
@@ -898,6 +1109,10 @@ class MainWindow(QMainWindow):
         # 添加菜单项
         open_action = menu.addAction(qta.icon('fa5s.folder-open', color='#3498db'), "打开目录")
         refresh_action = menu.addAction(qta.icon('fa5s.sync', color='#3498db'), "刷新")
+        failures_action = None
+        if is_root:
+            failures_action = menu.addAction(qta.icon('fa5s.exclamation-triangle', color='#e67e22'),
+                                             "处理失败的文件")
         
         # 只为根目录显示移除选项
         if is_root:
@@ -911,9 +1126,27 @@ class MainWindow(QMainWindow):
             self._open_directory(item)
         elif action == refresh_action:
             self._refresh_directory_item(item, directory_path)
+        elif failures_action is not None and action == failures_action:
+            self._show_scan_failures(directory_path)
         elif is_root and action == menu.actions()[-1]:  # 最后一个动作是移除
             self._remove_directory(item)
     
+    def _show_scan_failures(self, directory_path):
+        """显示目录中处理失败的文件，用户选择重试时重新扫描"""
+        with next(get_db()) as db:
+            directory = db.query(Directory).filter(Directory.path == os.path.normpath(directory_path)).first()
+            if directory is None:
+                return
+            directory_id, dir_name = directory.id, directory.name
+        
+        dialog = ScanFailuresDialog(directory_id, f"处理失败的文件 - {dir_name}", self)
+        if dialog.exec() != QDialog.Accepted or not dialog.retry_directories:
+            return
+        if self.scanner_thread is not None and self.scanner_thread.isRunning():
+            QMessageBox.information(self, "提示", "正在扫描中，所选文件将在下次扫描时重试")
+            return
+        self._scan_single_directory(dialog.retry_directories[0], dir_name)
+    
     def _open_directory(self, item):
         """打开目录"""
         directory_path = item.data(0, 1)
@@ -996,16 +1229,7 @@ class MainWindow(QMainWindow):
                         thumbnail_paths = []
                         if image_ids:
                             thumbnails = db.query(Thumbnail).filter(Thumbnail.image_id.in_(image_ids)).all()
-                            thumbnail_paths = [thumb.thumbnail_path for thumb in thumbnails if thumb.thumbnail_path and os.path.exists(thumb.thumbnail_path)]
-                        
-                        # 删除生成的缩略图文件
-                        import os
-                        for thumb_path in thumbnail_paths:
-                            try:
-                                os.remove(thumb_path)
-                            except (OSError, IOError) as e:
-                                # 如果删除失败，记录错误但不中断流程
-                                print(f"删除缩略图文件失败: {thumb_path} - {e}")
+                            thumbnail_paths = [thumb.thumbnail_path for thumb in thumbnails if thumb.thumbnail_path]
                         
                         # 删除相关的缩略图数据库记录
                         if image_ids:
@@ -1013,11 +1237,15 @@ class MainWindow(QMainWindow):
                         
                         # 删除该目录下的所有图片数据库记录
                         db.query(Image).filter(Image.directory_id == directory.id).delete(synchronize_session=False)
+                        db.query(ScanFailure).filter(ScanFailure.directory_id == directory.id).delete(synchronize_session=False)
                         
                         # 删除目录数据库记录
                         db.delete(directory)
                         db.commit()
                         
+                        # 删除生成的缩略图文件（其他目录中的重复图片仍在使用的保留）
+                        remove_unreferenced_thumbnails(db, thumbnail_paths)
+                        
                         # 刷新显示
                         self._refresh_directories()
                         QMessageBox.information(self, "成功", "目录及相关记录已删除，本地图片文件保留")
@@ -1036,15 +1264,121 @@ class MainWindow(QMainWindow):
 
     def _setup_scanner(self):
         """设置后台扫描器"""
+        # 扫描的实际速度，显示在进度条旁边
+        self.rate_label = QLabel()
+        self.rate_label.setVisible(False)
+        self.statusBar().addPermanentWidget(self.rate_label)
+        
+        # 用户停止操作一段时间后恢复全速扫描
+        throttle_settings = self._load_scanner_settings().get('throttle', {})
+        self.user_idle_timer = QTimer(self)
+        self.user_idle_timer.setSingleShot(True)
+        self.user_idle_timer.setInterval(throttle_settings.get('idle_after_ms', 3000))
+        self.user_idle_timer.timeout.connect(self._on_user_idle)
+        
         self.progress_bar = QProgressBar()
         self.progress_bar.setVisible(False)
         self.statusBar().addPermanentWidget(self.progress_bar)
         
         self.status_label = QLabel("准备就绪")
         self.statusBar().addWidget(self.status_label)
+        
+        # 暂停/继续和取消扫描
+        self.pause_scan_button = QToolButton()
+        self.pause_scan_button.setIcon(qta.icon('fa5s.pause', color='#3498db'))
+        self.pause_scan_button.setToolTip("暂停扫描")
+        self.pause_scan_button.clicked.connect(self._toggle_scan_pause)
+        self.statusBar().addPermanentWidget(self.pause_scan_button)
+        
+        self.cancel_scan_button = QToolButton()
+        self.cancel_scan_button.setIcon(qta.icon('fa5s.stop', color='#e74c3c'))
+        self.cancel_scan_button.setToolTip("取消扫描")
+        self.cancel_scan_button.clicked.connect(self._cancel_scan)
+        self.statusBar().addPermanentWidget(self.cancel_scan_button)
+        self._set_scan_controls_visible(False)
+    
+    def _should_throttle(self):
+        """按限速模式和用户是否正在操作决定扫描是否限速"""
+        return self.throttle_mode == 'always' or \
+            (self.throttle_mode == 'adaptive' and (self.user_busy or self.previewing))
+    
+    def _apply_scan_throttle(self):
+        """把限速状态应用到正在运行的扫描"""
+        if self.scanner_thread is not None and self.scanner_thread.isRunning():
+            self.scanner_thread.set_throttled(self._should_throttle())
+    
+    def _mark_user_activity(self, *args):
+        """用户滚动、点击或预览：限速一段时间，空闲后恢复全速"""
+        self.user_busy = True
+        self._apply_scan_throttle()
+        self.user_idle_timer.start()
+    
+    def _on_user_idle(self):
+        """用户一段时间没有操作"""
+        self.user_busy = False
+        self._apply_scan_throttle()
+    
+    def _on_scan_rates(self, files_per_second, bytes_per_second, throttled):
+        """显示扫描的实际速度"""
+        text = f"{files_per_second:.1f} 张/秒 · {bytes_per_second / (1024 * 1024):.1f} MB/秒"
+        if throttled:
+            text += "（限速）"
+        self.rate_label.setText(text)
+        self.rate_label.setVisible(True)
+    
+    def _set_scan_controls_visible(self, visible):
+        """显示或隐藏扫描控制按钮"""
+        self.pause_scan_button.setVisible(visible)
+        self.cancel_scan_button.setVisible(visible)
+    
+    def _toggle_scan_pause(self):
+        """暂停或继续当前扫描"""
+        if self.scanner_thread is None or not self.scanner_thread.isRunning():
+            return
+        if self.scanner_thread.is_paused():
+            self.scanner_thread.resume()
+        else:
+            self.status_label.setText("正在暂停扫描...")
+            self.scanner_thread.pause()
+    
+    def _cancel_scan(self):
+        """取消当前扫描"""
+        if self.scanner_thread is None or not self.scanner_thread.isRunning():
+            return
+        reply = QMessageBox.question(
+            self, "取消扫描",
+            "确定要取消当前扫描吗？\n\n已处理的图片会保留，下次启动时不会继续本次扫描。",
+            QMessageBox.Yes | QMessageBox.No,
+            QMessageBox.No
+        )
+        if reply == QMessageBox.Yes:
+            self.status_label.setText("正在取消扫描...")
+            self.scanner_thread.cancel()
+    
+    def _on_scan_paused(self, paused):
+        """扫描暂停状态变化"""
+        if paused:
+            self.pause_scan_button.setIcon(qta.icon('fa5s.play', color='#3498db'))
+            self.pause_scan_button.setToolTip("继续扫描")
+            self.status_label.setText("扫描已暂停")
+        else:
+            self.pause_scan_button.setIcon(qta.icon('fa5s.pause', color='#3498db'))
+            self.pause_scan_button.setToolTip("暂停扫描")
+            self.status_label.setText("继续扫描...")
+    
+    def _on_scanner_finished(self):
+        """扫描线程结束"""
+        self._set_scan_controls_visible(False)
+        self.rate_label.setVisible(False)
+        self.pause_scan_button.setIcon(qta.icon('fa5s.pause', color='#3498db'))
+        self.pause_scan_button.setToolTip("暂停扫描")
+        # 扫描可能新增或更新了感知哈希
+        self.similarity_index = None
+        # 扫描期间文件监视器积累的变化在线程结束后同步
+        self._start_pending_sync()
 
-    def _start_background_scan(self):
-        """启动后台扫描"""
+    def _start_background_scan(self, incremental=True, thumbnails_only=False):
+        """启动后台扫描，thumbnails_only时只重新生成缩略图"""
         try:
             with next(get_db()) as db:
                 # 获取所有活跃目录
@@ -1052,14 +1386,19 @@ class MainWindow(QMainWindow):
                 directory_paths = [d.path for d in directories if os.path.exists(d.path)]
                 
                 if directory_paths:
-                    self.status_label.setText("正在扫描图片...")
+                    self.status_label.setText("正在重新生成缩略图..." if thumbnails_only else "正在扫描图片...")
                     self.progress_bar.setVisible(True)
                     
                     # 创建并启动扫描线程
-                    self.scanner_thread = ImageScannerThread(directory_paths)
+                    self.scanner_thread = self._create_scanner_thread(directory_paths, incremental=incremental,
+                                                                      thumbnails_only=thumbnails_only)
+                    self._set_scan_controls_visible(True)
                     self.scanner_thread.progress_updated.connect(self._on_scan_progress)
                     self.scanner_thread.scan_completed.connect(self._on_scan_completed)
                     self.scanner_thread.scan_error.connect(self._on_scan_error)
+                    self.scanner_thread.scan_failures.connect(self._on_scan_failures)
+                    self.scanner_thread.scan_stats.connect(self._on_scan_stats)
+                    self.scanner_thread.thumbnails_refined.connect(self._on_thumbnails_refined)
                     self.scanner_thread.start()
                 else:
                     self.status_label.setText("没有找到可扫描的目录")
@@ -1071,12 +1410,52 @@ class MainWindow(QMainWindow):
         """扫描进度更新"""
         self.progress_bar.setMaximum(total)
         self.progress_bar.setValue(current)
-        self.status_label.setText(f"扫描图片... {current}/{total}")
+        self.status_label.setText(f"扫描图片... {current}/{total}{self._format_scan_eta(current, total)}")
+
+    def _format_scan_eta(self, current, total):
+        """根据已用时间估算剩余时间"""
+        if not self.scan_started_at or current <= 0 or total <= current:
+            return ""
+        elapsed = time.monotonic() - self.scan_started_at
+        remaining = int(elapsed / current * (total - current))
+        if remaining >= 3600:
+            return f"，剩余约 {remaining // 3600} 小时 {remaining % 3600 // 60} 分"
+        if remaining >= 60:
+            return f"，剩余约 {remaining // 60} 分 {remaining % 60} 秒"
+        return f"，剩余约 {remaining} 秒"
 
     def _on_scan_completed(self, count):
         """扫描完成"""
         self.progress_bar.setVisible(False)
-        self.status_label.setText(f"扫描完成，共处理 {count} 张图片")
+        if self.scanner_thread is not None and self.scanner_thread.is_stopped():
+            self.status_label.setText(f"扫描已停止，已处理 {count} 张图片")
+            return
+        self.status_label.setText(f"扫描完成，共处理 {count} 张图片（{self._format_scan_counters(self.last_scan_stats)}）")
+
+    def _format_scan_counters(self, stats):
+        """扫描结果计数: 新增/更新/未变化/失败/已隔离"""
+        counters = (f"新增 {stats.get('new', 0)}，更新 {stats.get('updated', 0)}，"
+                    f"未变化 {stats.get('skipped', 0)}，失败 {stats.get('failed', 0)}")
+        if stats.get('quarantined'):
+            counters += f"，跳过之前失败的文件 {stats['quarantined']}"
+        return counters
+
+    def _on_thumbnails_refined(self, current, total):
+        """内嵌缩略图替换进度"""
+        if current < total:
+            self.status_label.setText(f"优化缩略图... {current}/{total}")
+        else:
+            self.status_label.setText(f"缩略图优化完成，共 {total} 张")
+
+    def _on_scan_stats(self, stats):
+        """扫描统计信息"""
+        self.last_scan_stats = stats
+        self.status_label.setToolTip(
+            f"耗时 {stats.get('elapsed_seconds', 0)} 秒，"
+            f"解析进程 {stats.get('workers')} 个，"
+            f"批量大小 {stats.get('batch_size')}，"
+            f"写入 {stats.get('records', 0)} 条/{stats.get('batches', 0)} 批"
+        )
 
     def _on_scan_error(self, error_msg):
         """扫描错误"""
@@ -1084,8 +1463,100 @@ class MainWindow(QMainWindow):
         self.status_label.setText("扫描错误")
         QMessageBox.warning(self, "扫描错误", error_msg)
 
+    def _on_scan_failures(self, failures, total):
+        """处理失败的文件汇总，每个扫描阶段只提示一次"""
+        for image_path, message in failures:
+            print(f"{message} {image_path}")
+        lines = [f"{os.path.basename(image_path)}: {message}" for image_path, message in failures[:20]]
+        if total > len(lines):
+            lines.append(f"... 等共 {total} 个文件")
+        lines.append("\n无法解析的文件在没有变化前不会再处理，可在目录右键菜单“处理失败的文件”中重试")
+        self.status_label.setText(f"扫描中有 {total} 个文件处理失败")
+        QMessageBox.warning(self, "部分图片处理失败", "\n".join(lines))
+
+    def _show_thumbnail_context_menu(self, position):
+        """显示缩略图右键菜单"""
+        index = self.ui.thum_body.indexAt(position)
+        if not index.isValid():
+            return
+        image_id = index.data(Qt.ItemDataRole.UserRole + 1)
+        if not image_id:
+            return
+        
+        menu = QMenu(self)
+        similar_action = menu.addAction(qta.icon('fa5s.search', color='#3498db'), "查找相似图片")
+        
+        action = menu.exec(self.ui.thum_body.viewport().mapToGlobal(position))
+        if action == similar_action:
+            self._show_similar_images(image_id, index.data(Qt.ItemDataRole.DisplayRole))
+    
+    def _load_display_settings(self):
+        """加载显示配置"""
+        try:
+            config_file = Path(__file__).parent.parent.parent / "config" / "settings.json"
+            if config_file.exists():
+                with open(config_file, 'r', encoding='utf-8') as f:
+                    return json.load(f).get('display', {})
+        except Exception:
+            pass
+        return {}
+    
+    def _get_thumbnail_display_size(self):
+        """网格中缩略图的显示大小（逻辑像素）"""
+        value = self._load_display_settings().get('thumbnail_size', 'medium')
+        if isinstance(value, (int, float)) and value > 0:
+            return int(value)
+        return self.THUMBNAIL_DISPLAY_SIZES.get(value, self.THUMBNAIL_DISPLAY_SIZES['medium'])
+    
+    def _get_thumbnail_cache_bytes(self):
+        """缩略图缓存的内存预算（display.thumbnail_cache_mb）"""
+        value = self._load_display_settings().get('thumbnail_cache_mb', DEFAULT_CACHE_MB)
+        if not isinstance(value, (int, float)) or value < 0:
+            value = DEFAULT_CACHE_MB
+        return int(value * 1024 * 1024)
+    
+    def _grid_thumbnail_level(self):
+        """按显示大小和屏幕缩放比例选择网格使用的缩略图级别"""
+        return choose_thumbnail_level(math.ceil(self.thumbnail_display_size * self.devicePixelRatioF()))
+    
+    def _load_similarity_settings(self):
+        """加载相似图片配置"""
+        try:
+            config_file = Path(__file__).parent.parent.parent / "config" / "settings.json"
+            if config_file.exists():
+                with open(config_file, 'r', encoding='utf-8') as f:
+                    return json.load(f).get('similarity', {})
+        except Exception:
+            pass
+        return {}
+    
+    def _show_similar_images(self, image_id, file_name):
+        """在网格中显示与指定图片相似的图片（按汉明距离排序，图片自身在最前）"""
+        max_distance = self._load_similarity_settings().get('max_distance', DEFAULT_MAX_DISTANCE)
+        try:
+            with next(get_db()) as db:
+                if self.similarity_index is None:
+                    started = time.perf_counter()
+                    self.similarity_index = load_similarity_index(db)
+                    print(f"相似图片索引: {len(self.similarity_index)} 张图片，"
+                          f"构建耗时 {time.perf_counter() - started:.2f} 秒")
+                matches = find_similar_images(db, image_id, max_distance, self.similarity_index)
+                if not matches:
+                    QMessageBox.information(self, "提示", "该图片还没有感知哈希，请等待扫描完成后再试")
+                    return
+                self.thumbnail_model.set_image_ids([image.id for _, image in matches])
+        except Exception as e:
+            QMessageBox.warning(self, "警告", f"查找相似图片失败: {str(e)}")
+            return
+        
+        self.current_view_loader = lambda: self._show_similar_images(image_id, file_name)
+        self.current_directory_path = None
+        self.ui.label_gridstate.setText(f"相似图片: {file_name}")
+        self.ui.label_photo_count.setText(f"{len(matches) - 1} 张相似照片")
+    
     def _on_thumbnail_clicked(self, index):
         """处理缩略图点击事件，显示图片详情"""
+        self._mark_user_activity()
         if not index.isValid():
             return
             
@@ -1103,8 +1574,8 @@ class MainWindow(QMainWindow):
                 if not image:
                     return
                 
-                # 显示图片预览
-                self._display_image_preview(file_path, image.orientation)
+                # 显示图片预览（优先使用512级缩略图，不解码原图），缩略图存储键在网格行中已经读取
+                self._display_image_preview(file_path, self.thumbnail_model.row_data(index.row()).thumbnail_path)
                 
                 # 显示EXIF信息
                 self._display_exif_info(image)
@@ -1119,35 +1590,43 @@ class MainWindow(QMainWindow):
                 return
                 
             # 获取图片文件路径
-            item = self.thumbnail_model.itemFromIndex(index)
-            if not item:
-                return
-                
-            image_path = item.data(Qt.UserRole)
+            image_path = index.data(FILE_PATH_ROLE)
             if not image_path or not os.path.exists(image_path):
                 QMessageBox.warning(self, "警告", "图片文件不存在")
                 return
                 
-            # 创建并显示图片预览窗口
+            # 创建并显示图片预览窗口，预览期间扫描限速
             preview_window = ImagePreviewWindow(image_path, self)
-            preview_window.exec_()  # 模态显示
+            self.previewing = True
+            self._apply_scan_throttle()
+            try:
+                preview_window.exec_()  # 模态显示
+            finally:
+                self.previewing = False
+                self._mark_user_activity()
             
         except Exception as e:
             print(f"打开图片预览失败: {e}")
             QMessageBox.warning(self, "错误", f"无法打开图片预览: {str(e)}")
 
-    def _display_image_preview(self, file_path, orientation):
-        """显示图片预览"""
+    def _display_image_preview(self, file_path, thumbnail_path=None):
+        """显示图片预览，有缩略图时使用512级（第一次使用时生成），否则解码原图"""
         try:
             if hasattr(self.ui, 'image_preview'):
-                # 加载图片
-                pixmap = QPixmap(file_path)
+                data = None
+                if thumbnail_path:
+                    with next(get_db()) as db:
+                        data = load_thumbnail_level(db, thumbnail_path, file_path, self.PREVIEW_THUMBNAIL_LEVEL)
+                
+                # 加载图片（缩略图生成时已按EXIF方向转正，没有缩略图时由读取器按方向转正原图）
+                if data:
+                    image = QImage.fromData(data)
+                else:
+                    reader = QImageReader(file_path)
+                    reader.setAutoTransform(True)
+                    image = reader.read()
+                pixmap = QPixmap.fromImage(image)
                 if not pixmap.isNull():
-                    # 根据EXIF方向信息旋转图片
-                    rotation_angle = self._get_rotation_angle(orientation)
-                    if rotation_angle != 0:
-                        pixmap = self._rotate_pixmap(pixmap, rotation_angle)
-                    
                     # 缩放图片以适应预览区域
                     if hasattr(self.ui, 'preview_container'):
                         preview_size = self.ui.preview_container.size()
@@ -1325,6 +1804,20 @@ class MainWindow(QMainWindow):
     def closeEvent(self, event):
         """关闭事件"""
         self._save_window_state()
+        self.thumbnail_model.shutdown()
+        stats = self.thumbnail_cache.stats()
+        print(f"缩略图缓存: {stats['items']} 项，{stats['bytes'] / (1024 * 1024):.1f}/"
+              f"{stats['max_bytes'] / (1024 * 1024):.0f} MB，命中 {stats['hits']}，未命中 {stats['misses']}，"
+              f"淘汰 {stats['evictions']}，命中率 {stats['hit_ratio']:.0%}")
+        if self.directory_watcher is not None:
+            self.directory_watcher.stop()
+        self.pending_directory_changes.clear()
+        
+        # 等待扫描线程写入缓冲的记录并保存检查点，下次启动时从检查点继续
+        if self.scanner_thread is not None and self.scanner_thread.isRunning():
+            self.status_label.setText("正在保存扫描进度...")
+            self.scanner_thread.stop()
+            self.scanner_thread.wait()
         event.accept()
 
 
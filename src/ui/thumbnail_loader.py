@@ -0,0 +1,91 @@
+"""
+缩略图异步加载模块
+缩略图的读取和JPEG解码在QThreadPool的工作线程中进行，解码为QImage（可跨线程使用）后通过信号交回界面线程，
+界面线程只做QPixmap转换。后提交的请求优先执行（滚动后新出现的可见项先加载），滚出可见范围的请求被取消
+"""
+from PySide6.QtCore import QObject, QRunnable, QThread, QThreadPool, Signal, Slot
+from PySide6.QtGui import QImage
+
+from src.core.database import get_db
+from src.core.thumbnails import load_thumbnail_level
+
+
+class _LoadJob(QRunnable):
+    """读取并解码一张缩略图，开始执行时已被取消则直接返回"""
+
+    def __init__(self, loader, key, token, thumbnail_path, file_path, level, row):
+        super().__init__()
+        self.loader = loader
+        self.key = key
+        self.token = token
+        self.thumbnail_path = thumbnail_path
+        self.file_path = file_path
+        self.level = level
+        self.row = row
+
+    def run(self):
+        if not self.loader.is_wanted(self.key, self.token):
+            return
+        image = QImage()
+        try:
+            with next(get_db()) as db:
+                data = load_thumbnail_level(db, self.thumbnail_path, self.file_path, self.level)
+            if data:
+                image = QImage.fromData(data)
+        except Exception as e:
+            print(f"加载缩略图失败: {self.file_path} - {e}")
+        self.loader._done.emit(self.key, self.token, image, self.row)
+
+
+class ThumbnailLoader(QObject):
+    """
+    缩略图异步加载器
+    request()在界面线程中调用，同一个键同时只有一个请求；结果通过loaded(键, QImage, 行号)发出，
+    加载失败时QImage为空
+    """
+
+    loaded = Signal(object, QImage, int)
+    _done = Signal(object, int, QImage, int)
+
+    def __init__(self, parent=None, threads=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        # 留一个核心给界面线程和扫描
+        self.pool.setMaxThreadCount(threads or max(2, min(4, QThread.idealThreadCount() - 1)))
+        self._pending = {}  # 键 -> (请求序号, 行号)
+        self._token = 0
+        self._done.connect(self._on_done)
+
+    def request(self, key, thumbnail_path, file_path, level, row):
+        """提交加载请求，越晚提交的请求优先级越高"""
+        if key in self._pending:
+            return
+        self._token += 1
+        self._pending[key] = (self._token, row)
+        self.pool.start(_LoadJob(self, key, self._token, thumbnail_path, file_path, level, row), self._token)
+
+    def is_wanted(self, key, token):
+        """请求是否仍然有效（工作线程中调用）"""
+        pending = self._pending.get(key)
+        return pending is not None and pending[0] == token
+
+    def retain_rows(self, first, last):
+        """取消行号不在 [first, last] 范围内的请求，排队中的任务开始时直接返回"""
+        self._pending = {key: pending for key, pending in self._pending.items() if first <= pending[1] <= last}
+
+    def cancel_all(self):
+        """取消所有请求，移除还没有开始的任务"""
+        self._pending = {}
+        self.pool.clear()
+
+    def shutdown(self):
+        """取消所有请求并等待正在执行的任务结束"""
+        self.cancel_all()
+        self.pool.waitForDone()
+
+    @Slot(object, int, QImage, int)
+    def _on_done(self, key, token, image, row):
+        if self.is_wanted(key, token):
+            del self._pending[key]
+        # 已取消的请求如果已经解码完成，结果仍然交给模型缓存
+        self.loaded.emit(key, image, row)
@@ -0,0 +1,223 @@
+"""
+缩略图网格模型
+只保存已加载行的图片ID、文件名、路径和缩略图存储键，按需分页从数据库读取（按图片ID的键集分页），
+图标在视图绘制时通过data(DecorationRole)解析，打开任何视图的开销与图库大小无关；
+缓存未命中时先显示占位符，缩略图由ThumbnailLoader在线程池中解码，完成后只刷新对应的行
+"""
+from collections import namedtuple
+from PySide6.QtCore import Qt, QAbstractListModel, QModelIndex
+from PySide6.QtGui import QIcon, QPixmap
+import qtawesome as qta
+
+from src.core.database import get_db
+from src.core.ingest import THUMBNAIL_BASE_LEVEL
+from src.core.thumbnail_cache import get_thumbnail_cache, pixmap_bytes
+from src.models.image import Image
+from src.models.thumbnail import Thumbnail
+from src.ui.thumbnail_loader import ThumbnailLoader
+
+# 网格中的一行：缩略图存储键和版本（更新时间）用于读取和缓存缩略图
+GridRow = namedtuple('GridRow', ['image_id', 'file_name', 'file_path', 'thumbnail_path', 'version'])
+
+# 存储图片ID和完整路径的角色（与之前的QStandardItem相同）
+FILE_PATH_ROLE = Qt.ItemDataRole.UserRole
+IMAGE_ID_ROLE = Qt.ItemDataRole.UserRole + 1
+
+
+class ThumbnailListModel(QAbstractListModel):
+    """
+    缩略图网格的虚拟化模型
+    两种数据来源：按查询条件键集分页（set_query），或按给定顺序的图片ID列表分页解析（set_image_ids，
+    用于重复图片和相似图片）；视图滚动到末尾时通过canFetchMore/fetchMore加载下一页
+    """
+
+    PAGE_SIZE = 500
+    # 可见范围上下保留请求的行数，滚动距离超过这个范围的请求被取消
+    RETAIN_MARGIN = 100
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._rows = []
+        self._condition = None
+        self._image_ids = None  # 按顺序给定的图片ID，为None时按查询条件分页
+        self._offset = 0  # 图片ID列表中已解析的位置
+        self._last_id = 0  # 键集分页：已加载的最大图片ID
+        self._exhausted = True
+        self._failed = set()  # 加载失败的缩略图，重置前不再重试
+        self.level = THUMBNAIL_BASE_LEVEL
+        self.cache = get_thumbnail_cache()
+        self._placeholder = None
+        self.loader = ThumbnailLoader(self)
+        self.loader.loaded.connect(self._on_thumbnail_loaded)
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or index.row() >= len(self._rows):
+            return None
+        row = self._rows[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return row.file_name
+        if role == Qt.ItemDataRole.DecorationRole:
+            return self._icon(index.row(), row)
+        if role == Qt.ItemDataRole.TextAlignmentRole:
+            return Qt.AlignmentFlag.AlignCenter
+        if role == FILE_PATH_ROLE:
+            return row.file_path
+        if role == IMAGE_ID_ROLE:
+            return row.image_id
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted:
+            return
+        try:
+            rows = self._fetch_page()
+        except Exception as e:
+            print(f"加载缩略图列表失败: {e}")
+            self._exhausted = True
+            return
+        if rows:
+            self.beginInsertRows(QModelIndex(), len(self._rows), len(self._rows) + len(rows) - 1)
+            self._rows.extend(rows)
+            self.endInsertRows()
+
+    def set_query(self, condition=None):
+        """按查询条件显示图片（None为全部图片），按图片ID顺序分页加载"""
+        self._reset(condition=condition)
+
+    def set_image_ids(self, image_ids):
+        """按给定顺序显示图片"""
+        self._reset(image_ids=list(image_ids))
+
+    def clear(self):
+        """清空网格"""
+        self.loader.cancel_all()
+        self.beginResetModel()
+        self._rows = []
+        self._image_ids = None
+        self._condition = None
+        self._exhausted = True
+        self._failed.clear()
+        self.endResetModel()
+
+    def set_thumbnail_level(self, level):
+        """设置网格使用的缩略图级别，已加载的行重新解析图标"""
+        if level == self.level:
+            return
+        self.level = level
+        self._failed.clear()
+        self.loader.cancel_all()
+        if self._rows:
+            self.dataChanged.emit(self.index(0), self.index(len(self._rows) - 1),
+                                  [Qt.ItemDataRole.DecorationRole])
+
+    def row_data(self, row):
+        """指定行的 GridRow"""
+        return self._rows[row]
+
+    def refresh_thumbnails(self, image_ids):
+        """缩略图已重新生成：重新读取已加载行的缩略图存储键和版本，刷新这些行的图标"""
+        wanted = set(image_ids)
+        rows = [row for row, grid_row in enumerate(self._rows) if grid_row.image_id in wanted]
+        if not rows:
+            return
+        try:
+            with next(get_db()) as db:
+                thumbnails = {
+                    record.image_id: (record.thumbnail_path, record.updated_at) for record in
+                    db.query(Thumbnail.image_id, Thumbnail.thumbnail_path, Thumbnail.updated_at).filter(
+                        Thumbnail.image_id.in_({self._rows[row].image_id for row in rows})
+                    )
+                }
+        except Exception as e:
+            print(f"刷新缩略图失败: {e}")
+            return
+        for row in rows:
+            grid_row = self._rows[row]
+            thumbnail = thumbnails.get(grid_row.image_id, (None, None))
+            if (grid_row.thumbnail_path, grid_row.version) == thumbnail:
+                continue
+            self._rows[row] = grid_row._replace(thumbnail_path=thumbnail[0], version=thumbnail[1])
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+
+    def set_visible_range(self, first, last):
+        """视图可见范围变化时调用，取消已经滚出可见范围附近的加载请求"""
+        self.loader.retain_rows(first - self.RETAIN_MARGIN, last + self.RETAIN_MARGIN)
+
+    def shutdown(self):
+        """停止后台加载（关闭窗口时调用）"""
+        self.loader.shutdown()
+
+    def _reset(self, condition=None, image_ids=None):
+        self.loader.cancel_all()
+        self.beginResetModel()
+        self._rows = []
+        self._condition = condition
+        self._image_ids = image_ids
+        self._offset = 0
+        self._last_id = 0
+        self._exhausted = False
+        self._failed.clear()
+        self.endResetModel()
+        # 第一页直接加载，之后由视图滚动到末尾时请求
+        self.fetchMore()
+
+    def _fetch_page(self):
+        """读取下一页，返回GridRow列表：图片和缩略图记录一次外连接投影查询，只取网格需要的列"""
+        with next(get_db()) as db:
+            query = db.query(
+                Image.id, Image.file_name, Image.file_path, Thumbnail.thumbnail_path, Thumbnail.updated_at
+            ).outerjoin(Thumbnail, Thumbnail.image_id == Image.id)
+            if self._image_ids is not None:
+                page_ids = self._image_ids[self._offset:self._offset + self.PAGE_SIZE]
+                self._offset += len(page_ids)
+                self._exhausted = self._offset >= len(self._image_ids)
+                records = {record.id: record for record in query.filter(Image.id.in_(page_ids))} if page_ids else {}
+                records = [records[image_id] for image_id in page_ids if image_id in records]
+            else:
+                query = query.filter(Image.id > self._last_id)
+                if self._condition is not None:
+                    query = query.filter(self._condition)
+                records = query.order_by(Image.id).limit(self.PAGE_SIZE).all()
+                self._exhausted = len(records) < self.PAGE_SIZE
+                if records:
+                    self._last_id = records[-1].id
+        # 没有缩略图记录的行（thumbnail_path为空）直接显示占位符，不访问磁盘
+        return [GridRow(*record) for record in records]
+
+    def _icon(self, row_index, row):
+        """解析一行的图标：先查缓存，未命中时提交后台加载并先返回占位符，没有缩略图时使用占位符"""
+        if not row.thumbnail_path:
+            return self._placeholder_icon()
+        cache_key = (row.image_id, row.version, self.level)
+        icon = self.cache.get(cache_key)
+        if icon is not None:
+            return icon
+        if cache_key not in self._failed:
+            self.loader.request(cache_key, row.thumbnail_path, row.file_path, self.level, row_index)
+        return self._placeholder_icon()
+
+    def _on_thumbnail_loaded(self, cache_key, image, row_index):
+        """后台解码完成：在界面线程转换为QPixmap放入缓存，行仍在当前视图中时刷新该行"""
+        # 缩略图入库时已按EXIF方向转正，直接显示
+        pixmap = QPixmap.fromImage(image) if not image.isNull() else QPixmap()
+        if pixmap.isNull():
+            self._failed.add(cache_key)
+            return
+        self.cache.put(cache_key, QIcon(pixmap), pixmap_bytes(pixmap))
+        # 模型重置或级别变化后行号可能已经指向其他图片
+        if (cache_key[2] == self.level and row_index < len(self._rows)
+                and self._rows[row_index].image_id == cache_key[0]):
+            index = self.index(row_index)
+            self.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+
+    def _placeholder_icon(self):
+        if self._placeholder is None:
+            self._placeholder = qta.icon('fa5s.image', color='#95a5a6', scale_factor=1.5)
+        return self._placeholder